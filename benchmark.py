@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+# benchmark - time defedd on synthetic EDD files.
+# Real captures cannot always be shared, so this builds EDD files with the same layout that I'm fEDD Up
+# produces (16384 bytes per quarter track, each holding about 2.5 revolutions of the track, read from
+# a random spot) out of freshly made GCR tracks: 6+2 (16-sector) or 5+3 (13-sector) sectors with sync
+# gaps between them, optionally with weak bits (runs of zeros that sometimes read as ones) and bit slips.
+# Each disk type is then converted in each mode in a fresh defedd process with --profile, and the
+# report gives the tracks per second, the peak memory, and where the time went, stage by stage
+# and for each output writer.
+
+import sys
+import os
+import getopt
+import json
+import random
+import subprocess
+import tempfile
+import time
+
+defedd_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'defedd.py')
+
+edd_track_bytes = 16384 # one quarter track in the EDD file
+edd_track_bits = edd_track_bytes * 8
+
+# The disk types to build.  sectors is 16 (6+2) or 13 (5+3), weak is whether some of the gaps after data
+# fields have a run of zeros that reads back randomly, slips is whether each read gets bit slips
+# (how many is set with --slips).
+disk_types = {
+	'dos33': {'sectors': 16, 'weak': False, 'slips': False},
+	'dos32': {'sectors': 13, 'weak': False, 'slips': False},
+	'weak': {'sectors': 16, 'weak': True, 'slips': False},
+	'slips': {'sectors': 16, 'weak': True, 'slips': True},
+	}
+
+# The conversions to time each disk type with (defedd options).
+modes = {
+	'quick': ['-faq'],
+	'analyze': ['-fd5n'],
+	'dsk': ['-d'],
+	}
+
+# The disk nibbles for 6+2 and 5+3 encoding, in value order (the inverse of defedd's translate tables).
+nibbles_62 = bytes.fromhex(
+	'96979a9b9d9e9fa6a7abacadaeafb2b3b4b5b6b7b9babbbcbdbebfcbcdcecfd3'
+	'd6d7d9dadbdcdddedfe5e6e7e9eaebecedeeeff2f3f4f5f6f7f9fafbfcfdfeff')
+nibbles_53 = bytes.fromhex(
+	'abadaeafb5b6b7babbbdbebfd6d7dadbdddedfeaebedeeeff5f6f7fafbfdfeff')
+
+def swap_bits(value):
+	'''Swap the two low bits (6+2 auxiliary bits are stored reversed)'''
+	return ((value & 1) << 1) | ((value & 2) >> 1)
+
+def encode_field(values, nibbles):
+	'''Write a data field: each value XORed with the one before, then the checksum'''
+	field = bytearray()
+	prior = 0
+	for value in values:
+		field.append(nibbles[value ^ prior])
+		prior = value
+	field.append(nibbles[prior])
+	return field
+
+def encode_62(data):
+	'''Encode 256 bytes as a 6+2 data field (86 auxiliary values then 256 six-bit values)'''
+	auxiliary = []
+	for index in range(86):
+		value = swap_bits(data[index] & 3) | (swap_bits(data[index + 86] & 3) << 2)
+		if index < 84:
+			value |= swap_bits(data[index + 172] & 3) << 4
+		auxiliary.append(value)
+	return encode_field(auxiliary + [byte >> 2 for byte in data], nibbles_62)
+
+def encode_53(rng):
+	'''Make a 5+3 data field (410 five-bit values, random since nothing here decodes them)'''
+	return encode_field([rng.randrange(32) for index in range(410)], nibbles_53)
+
+def odd_even(value):
+	'''4-and-4 encoding for address fields'''
+	return bytes([(value >> 1) | 0xaa, value | 0xaa])
+
+def nibble_bits(nibbles):
+	'''The bits for a run of nibbles, as a string of 0s and 1s'''
+	return ''.join(format(nibble, '08b') for nibble in nibbles)
+
+def sync_bits(count):
+	'''The bits for count 10-bit sync nibbles'''
+	return '1111111100' * count
+
+def build_track(rng, track_number, disk_type, length):
+	'''Lay out one formatted track of length bits, return the bits and the weak spans in them'''
+	sectors = disk_type['sectors']
+	parts = [sync_bits(40)]
+	position = 400
+	weak_spans = []
+	for sector in range(sectors):
+		address = b'\xd5\xaa' + (b'\x96' if sectors == 16 else b'\xb5') + odd_even(254) + odd_even(track_number) + \
+			odd_even(sector) + odd_even(254 ^ track_number ^ sector) + b'\xde\xaa\xeb'
+		data = encode_62(rng.randbytes(256)) if sectors == 16 else encode_53(rng)
+		parts.append(nibble_bits(address) + sync_bits(6) + nibble_bits(b'\xd5\xaa\xad' + data + b'\xde\xaa\xeb'))
+		position += len(parts[-1])
+		if disk_type['weak'] and sector % 4 == 1:
+			weak_spans.append((position, position + 30))
+			parts.append('0' * 30)
+			position += 30
+		gap = sync_bits(14 if sectors == 16 else 26)
+		parts.append(gap)
+		position += len(gap)
+	# the rest of the track is sync, with a partial one at the end where the write wrapped around
+	parts.append(sync_bits((length - position) // 10))
+	parts.append('1' * ((length - position) % 10))
+	return ''.join(parts), weak_spans
+
+def read_track(rng, bits, weak_spans, slips):
+	'''Read about 2.5 revolutions of a track from a random spot, as the EDD card would, return the bytes'''
+	revolutions = []
+	for revolution in range(edd_track_bits // len(bits) + 2):
+		read = bits
+		for start, end in weak_spans:
+			read = read[:start] + ''.join('1' if rng.random() < 0.08 else '0' for bit in range(start, end)) + read[end:]
+		for slip in range(slips):
+			where = rng.randrange(len(read))
+			# a slip either reads a bit that was not there or misses one that was
+			read = read[:where] + ('0' + read[where:] if rng.random() < 0.5 else read[where + 1:])
+		revolutions.append(read)
+	start = rng.randrange(len(bits))
+	read = ''.join(revolutions)[start: start + edd_track_bits]
+	return int(read, 2).to_bytes(edd_track_bytes, 'big')
+
+def make_edd(filename, disk_type, tracks=35, seed=1, slips=3):
+	'''Write a synthetic EDD file of tracks whole tracks (at quarter track resolution)'''
+	rng = random.Random(seed)
+	slips = slips if disk_type['slips'] else 0
+	layouts = [build_track(rng, track_number, disk_type, rng.randrange(50600, 51400)) \
+		for track_number in range(tracks)]
+	with open(filename, mode='wb') as eddfile:
+		for quarter_track in range(tracks * 4 - 3):
+			track_number, quarter = divmod(quarter_track, 4)
+			if quarter == 2:
+				# half way between tracks there is nothing to read
+				eddfile.write(rng.randbytes(edd_track_bytes))
+			else:
+				# a quarter track away, the head still picks up the nearest track
+				bits, weak_spans = layouts[track_number + (quarter == 3)]
+				eddfile.write(read_track(rng, bits, weak_spans, slips))
+
+def run_case(eddfile, arguments):
+	'''Convert an EDD file in a fresh defedd process, return the profile report, wall time, and peak memory'''
+	profile_file = eddfile + '.json'
+	with open(eddfile + '.log', mode='w') as log:
+		started = time.perf_counter()
+		process = subprocess.Popen([sys.executable, defedd_script] + arguments + ['--profile', profile_file, eddfile], \
+			stdout=log, stderr=subprocess.STDOUT)
+		# wait4 rather than wait, for the resource usage of just this process
+		pid, wait_status, usage = os.wait4(process.pid, 0)
+		process.returncode = os.waitstatus_to_exitcode(wait_status)
+		wall = time.perf_counter() - started
+	# defedd's exit status does not say whether it worked, but the profile is only written if it did
+	if not os.path.exists(profile_file):
+		return None, wall, usage.ru_maxrss
+	with open(profile_file) as report:
+		return json.load(report), wall, usage.ru_maxrss
+
+def summarize(report, wall, peak):
+	'''Pull the numbers for the results table out of a profile report'''
+	tracks = len(report['tracks'])
+	analysis = report['disk'].get('analyze_disk', {'wall': wall})['wall']
+	stages = {stage: timing['wall'] for stage, timing in report['stages'].items()}
+	for stage, timing in report['disk'].items():
+		if stage != 'analyze_disk':
+			stages[stage] = stages.get(stage, 0.0) + timing['wall']
+	return {'tracks': tracks, 'wall': wall, 'analysis': analysis, 'tracks_per_second': tracks / analysis if analysis else 0.0,
+		'peak_memory': peak * 1024, 'stages': stages, 'standard': sum(1 for track in report['tracks'] if track['standard']),
+		'cached': sum(1 for track in report['tracks'] if track['cached'])}
+
+def benchmark(workdir, disks, conversions, tracks, seed, slips, extra_arguments):
+	'''Build each disk type and convert it each way, return the results keyed by (disk, mode)'''
+	results = {}
+	for disk in disks:
+		filename = os.path.join(workdir, disk + '.edd')
+		started = time.perf_counter()
+		make_edd(filename, disk_types[disk], tracks, seed, slips)
+		print('Built {} ({} tracks) in {:5.2f}s'.format(disk, tracks, time.perf_counter() - started))
+		for mode in conversions:
+			# each conversion gets its own copy, since the output files are named after the EDD file
+			eddfile = os.path.join(workdir, '{}-{}.edd'.format(disk, mode))
+			os.link(filename, eddfile)
+			report, wall, peak = run_case(eddfile, modes[mode] + extra_arguments)
+			if report is None:
+				print('  {:8} failed, see {}'.format(mode, eddfile + '.log'))
+				continue
+			results[(disk, mode)] = summarize(report, wall, peak)
+	return results
+
+def show_results(results):
+	'''Display the results table and the stage breakdown'''
+	print()
+	print('{:8} {:8} {:>6} {:>8} {:>9} {:>9} {:>9}'.format('disk', 'mode', 'tracks', 'std/cache', 'wall (s)', 'tracks/s', 'peak MB'))
+	for (disk, mode), result in results.items():
+		print('{:8} {:8} {:6d} {:>9} {:9.2f} {:9.1f} {:9.1f}'.format(disk, mode, result['tracks'],
+			'{}/{}'.format(result['standard'], result['cached']), result['analysis'], result['tracks_per_second'],
+			result['peak_memory'] / 1048576))
+	print()
+	stages = []
+	for result in results.values():
+		stages.extend(stage for stage in result['stages'] if stage not in stages)
+	print('{:24}'.format('stage (s)') + ''.join(' {:>8}'.format(disk[:8]) for disk, mode in results))
+	print('{:24}'.format('') + ''.join(' {:>8}'.format(mode[:8]) for disk, mode in results))
+	for stage in stages:
+		print('{:24}'.format(stage) + ''.join(' {:8.3f}'.format(result['stages'][stage]) \
+			if stage in result['stages'] else ' {:>8}'.format('-') for result in results.values()))
+
+def main(argv=None):
+	'''Main entry point'''
+	argv = sys.argv[1:] if argv is None else argv
+	disks = list(disk_types)
+	conversions = list(modes)
+	tracks = 35
+	seed = 1
+	slips = 3
+	keep_dir = None
+	json_file = None
+	try:
+		opts, extra_arguments = getopt.getopt(argv, "ht:s:k:", \
+			["help", "tracks=", "seed=", "slips=", "keep=", "disks=", "modes=", "json="])
+	except getopt.GetoptError as err:
+		print(str(err))
+		usage()
+		return 1
+	for o, a in opts:
+		if o == "-h" or o == "--help":
+			usage()
+			return 0
+		elif o == "-t" or o == "--tracks":
+			tracks = int(a)
+		elif o == "-s" or o == "--seed":
+			seed = int(a)
+		elif o == "--slips":
+			slips = int(a)
+		elif o == "-k" or o == "--keep":
+			keep_dir = a
+		elif o == "--disks":
+			disks = a.split(',')
+		elif o == "--modes":
+			conversions = a.split(',')
+		elif o == "--json":
+			json_file = a
+	for disk in disks:
+		if disk not in disk_types:
+			print('Unknown disk type {} (known: {})'.format(disk, ', '.join(disk_types)))
+			return 1
+	for mode in conversions:
+		if mode not in modes:
+			print('Unknown mode {} (known: {})'.format(mode, ', '.join(modes)))
+			return 1
+
+	if keep_dir:
+		os.makedirs(keep_dir, exist_ok=True)
+		results = benchmark(keep_dir, disks, conversions, tracks, seed, slips, extra_arguments)
+	else:
+		with tempfile.TemporaryDirectory(prefix='defedd-benchmark-') as workdir:
+			results = benchmark(workdir, disks, conversions, tracks, seed, slips, extra_arguments)
+	show_results(results)
+
+	if json_file:
+		with open(json_file, mode='w') as report:
+			json.dump([dict(result, disk=disk, mode=mode) for (disk, mode), result in results.items()], report, indent=1)
+	return 0
+
+def usage():
+	'''Display help information'''
+	print('''
+Usage: benchmark.py [options] [-- defedd options]
+
+Builds synthetic EDD files and times defedd converting them.
+Any options after -- are passed along to defedd for every conversion (e.g. -- -j 4 --nonumpy).
+
+Options:
+ -t, --tracks N  Build disks with N tracks (default 35)
+ -s, --seed N    Seed for the random track contents, weak bits, and slips (default 1)
+ --slips N       Bit slips in each revolution read on the slips disk (default 3)
+ -k, --keep DIR  Build and convert in DIR and leave the files there (default is a temporary directory)
+ --disks D,...   Disk types to build: dos33, dos32, weak, slips (default all)
+ --modes M,...   Conversions to time: quick (-faq), analyze (-fd5n), dsk (-d) (default all)
+ --json F        Also write the results to F (JSON)
+ -h, --help      You're looking at it.
+ 	''')
+	return
+
+if __name__ == "__main__":
+	sys.exit(main())
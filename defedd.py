@@ -14,11 +14,31 @@ import getopt
 import struct
 import math
 import time
-from operator import itemgetter
+import io
+import multiprocessing
+import os
+import hashlib
+import pickle
+import tempfile
+import re
+import functools
+import bisect
+import json
+import array
+import copy
+import contextvars
+import collections.abc
+import glob
+import traceback
+from operator import itemgetter, xor
+from itertools import accumulate
 import zlib # needed for mfi
-# TODO: explore bitstring https://pythonhosted.org/bitstring/
-# to see if it can speed things up
-# from bitstring import BitArray, BitStream
+# NumPy is optional.  If it is there, it is used to unpack and pack bits in bulk,
+# otherwise everything still works in pure Python (just slower).
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 # I am leaving this in kind of a disasterous state at the moment.
 # I have folded most everything into split at zeros
@@ -38,14 +58,14 @@ import zlib # needed for mfi
 # Copts and Robbers: 0 addr DDAADA data MAX=25? sync; 1.5-13/15.5 by 1 sync
 # Choplifter complex: 0, 1-8, 9, A-B, C-1E.5 by .5, 20 CII+
 
-# tracks is an array of track structures, the track structure is:
+# tracks is an array of track structures (see Track), the track structure is:
 # track_number: track number (eg. 12.5)
 # index_offset: 0 (bit corresponding to index hole, used in creating FDI file)
-# bits: bits read from the disk
-# zero_spans: bit ranges that are at risk (000s) and not, [[0/1, start, end], ...]
-# repeating_regions: bit ranges that are valid repeats [rev1 start, end, rev2 start, end, rev3 start, end]
+# bits: bits read from the disk (packed, see PackedBits)
+# zero_spans: bit ranges that are at risk (000s) and not, (0/1, start, end) rows (see Intervals)
+# repeating_regions: bit ranges that are valid repeats (rev1 start, end, rev2 start, end, rev3 start, end) rows
 # options will be stored globally for retrievability.  Set the defaults.
-options = {
+default_options = {
 	'write_protect': False, 
 	'sync_tracks': False,
 	'process_quarters': True, 'process_halves': True, 'analyze_sectors': True, 
@@ -55,16 +75,464 @@ options = {
 	'use_slice': False, 'from_zero': False, 'spiral': False,
 	'output_basename': 'outputfilename',
 	'output': {'nib': False, 'dsk': False, 'mfi': False, 'fdi': False, 'po': False, 'v2d': False, 'nit': False, 'nic': False, 'png': False},
-	'bitstring': False
+	'bitstring': False, 'numpy': numpy is not None, 'jobs': 1, 'stream_tracks': False, 'repeat_engine': 'search',
+	'cache_dir': None, 'cache_size': 256 * 1024 * 1024, 'fast_sectors': True,
+	'profile_file': None
 	}
 # status will be also be stored globally, things having to do with full disk
-status = {}
+def new_status():
+	'''The status of a disk conversion that has not started yet'''
+	return {'timings': {}, 'profile_tracks': []}
+
+# Everything about a conversion (the options, the status of the disk being converted, and where the
+# messages go) belongs to a Converter, so that there can be more than one of them going on in a process,
+# each in its own thread.  The analysis code reads and writes the options and status of whichever
+# converter is running in the current thread (or context) through the module-level options and status
+# below.  The command line just sets up a Converter and runs it.  A converter should only be running
+# one conversion at a time, so to convert in parallel, use a converter for each thread.
+class Converter:
+	'''Converts EDD files, with its own options, status, and console'''
+
+	def __init__(self, outputs=(), console=None, **settings):
+		self.options = copy.deepcopy({key: value for key, value in default_options.items() if key != 'console'})
+		self.options['console'] = [sys.stdout] if console is None else list(console)
+		for output_type in outputs:
+			self.set_output(output_type)
+		for key, value in settings.items():
+			if not key in self.options:
+				raise KeyError('Unknown option: {}'.format(key))
+			self.options[key] = value
+		self.status = new_status()
+		self.running = []
+
+	def set_output(self, output_type, output_writer=None):
+		'''Write an output type (e.g. 'dsk') with its usual writer, or with a TrackWriter subclass'''
+		self.options['output'][output_type] = output_writer or output_writers[output_type]
+
+	def __enter__(self):
+		self.running.append(running_converter.set(self))
+		return self
+
+	def __exit__(self, *exception):
+		running_converter.reset(self.running.pop())
+
+	def convert(self, eddfilename):
+		'''Convert an EDD file, returning the Disk'''
+		with self:
+			check_options()
+			self.status = new_status()
+			tracks = convert_file(eddfilename)
+			return Disk(eddfilename, tracks, self.status)
+
+	def convert_batch(self, names):
+		'''Convert EDD files (names, directories, or patterns) in worker processes, returning how each went'''
+		with self:
+			check_options()
+			return convert_batch(find_edd_files(names))
+
+# What a Converter hands back for an EDD file.
+class Disk:
+	'''A converted EDD file: its tracks and the status of the conversion'''
+
+	def __init__(self, eddfilename, tracks, status):
+		self.eddfilename = eddfilename
+		self.tracks = tracks # None if they were streamed through to the output files
+		self.status = status
+		self.track_count = status.get('track_count', 0)
+		self.timings = status['timings']
+
+class RunningConverter(collections.abc.MutableMapping):
+	'''The options or status of the converter running in this thread'''
+	__slots__ = ('part',)
+
+	def __init__(self, part):
+		self.part = part
+
+	def __getitem__(self, key):
+		return getattr(running_converter.get(), self.part)[key]
+
+	def __setitem__(self, key, value):
+		getattr(running_converter.get(), self.part)[key] = value
+
+	def __delitem__(self, key):
+		del getattr(running_converter.get(), self.part)[key]
+
+	def __contains__(self, key):
+		return key in getattr(running_converter.get(), self.part)
+
+	def __iter__(self):
+		return iter(getattr(running_converter.get(), self.part))
+
+	def __len__(self):
+		return len(getattr(running_converter.get(), self.part))
+
+# Anything not running in a converter of its own (the command line, worker processes) uses this one.
+default_converter = Converter()
+running_converter = contextvars.ContextVar('running_converter', default=default_converter)
+options = RunningConverter('options')
+status = RunningConverter('status')
 
 track_maximum = 52500 # maximum number of bits we can expect in a track
 track_minimum = 48500 # minimum number of bits we can expect in a track
 required_match = 300 # minimum number of bits to call a match good
-threezeros = bytearray(b'\x00\x00\x00')
-syncnibble = bytearray(b'\x00\x01\x01\x01\x01\x01\x01\x01\x01')
+
+# Track bits are kept packed eight to a byte, the way they come out of the EDD file,
+# rather than as a bytearray with one byte per bit (which was 8x the size, and every
+# slice was a copy).  A PackedBits is a read-only view onto a run of bits in a shared
+# buffer, so slicing it just makes another view.  It supports the parts of the bytearray
+# interface the analysis uses: bit indexing, slicing, index/find, count, comparison,
+# iteration and concatenation.  Searches and comparisons work on whole bytes or on the
+# bits as one big integer rather than a bit at a time.
+bit_digits = bytes.maketrans(b'\x00\x01', b'01')
+digit_bits = bytes.maketrans(b'01', b'\x00\x01')
+nonzero_byte = re.compile(b'[^\x00]')
+nonff_byte = re.compile(b'[^\xff]')
+numpy_minimum = 2048 # below this many bits, calling into NumPy costs more than it saves
+popcount = int.bit_count if hasattr(int, 'bit_count') else lambda value: bin(value).count('1')
+
+class PackedBits:
+	'''A read-only run of bits packed eight to a byte, sliceable without copying'''
+	__slots__ = ('data', 'start', 'stop')
+
+	def __init__(self, data=b'', start=0, stop=None):
+		self.data = bytes(data) # no copy if it is already bytes
+		self.start = start
+		self.stop = len(self.data) * 8 if stop is None else stop
+
+	@classmethod
+	def view(cls, data, start, stop):
+		'''Make a view without checking or copying the buffer'''
+		bits = cls.__new__(cls)
+		bits.data = data
+		bits.start = start
+		bits.stop = stop
+		return bits
+
+	@classmethod
+	def from_value(cls, value, length):
+		'''Pack the low length bits of an integer'''
+		pad = -length % 8
+		return cls.view((value << pad).to_bytes((length + 7) >> 3, 'big'), 0, length)
+
+	@classmethod
+	def from_bits(cls, bits):
+		'''Pack a sequence of 0/1 values (bytearray, list, etc.)'''
+		if isinstance(bits, PackedBits):
+			return bits
+		if len(bits) == 0:
+			return cls.view(b'', 0, 0)
+		if options['numpy'] and len(bits) >= numpy_minimum:
+			return cls.view(numpy.packbits(numpy.frombuffer(bytes(bits), dtype=numpy.uint8)).tobytes(), 0, len(bits))
+		return cls.from_value(int(bytes(bits).translate(bit_digits), 2), len(bits))
+
+	@classmethod
+	def join(cls, parts):
+		'''Concatenate several runs of bits into one'''
+		value = 0
+		length = 0
+		for part in parts:
+			part = cls.from_bits(part)
+			value = (value << len(part)) | part.value()
+			length += len(part)
+		return cls.from_value(value, length)
+
+	def value(self):
+		'''The bits as one unsigned integer, first bit most significant'''
+		if self.stop <= self.start:
+			return 0
+		value = int.from_bytes(self.data[self.start >> 3: (self.stop + 7) >> 3], 'big')
+		return (value >> (-self.stop % 8)) & ((1 << (self.stop - self.start)) - 1)
+
+	def to_string(self):
+		'''The bits as a string of 0s and 1s'''
+		length = self.stop - self.start
+		return format(self.value(), '0{}b'.format(length)) if length > 0 else ''
+
+	def unpacked(self):
+		'''The bits as a bytearray with one byte (0 or 1) per bit'''
+		if options['numpy'] and self.stop - self.start >= numpy_minimum:
+			first = self.start >> 3
+			count = ((self.stop + 7) >> 3) - first
+			bits = numpy.unpackbits(numpy.frombuffer(self.data, dtype=numpy.uint8, count=count, offset=first))
+			return bytearray(bits[self.start - (first << 3): self.stop - (first << 3)].tobytes())
+		return bytearray(self.to_string().encode().translate(digit_bits))
+
+	def packed(self):
+		'''The bits as bytes, eight to a byte, zero padded at the end'''
+		if self.start % 8 == 0 and self.stop % 8 == 0:
+			return self.data[self.start >> 3: (self.stop + 7) >> 3]
+		return PackedBits.from_value(self.value(), len(self)).data
+
+	def __len__(self):
+		return self.stop - self.start
+
+	def __getitem__(self, key):
+		length = self.stop - self.start
+		if isinstance(key, slice):
+			start, stop, step = key.indices(length)
+			if step != 1:
+				raise ValueError('PackedBits slices must have a step of 1')
+			return PackedBits.view(self.data, self.start + start, self.start + max(start, stop))
+		if key < 0:
+			key += length
+		if key < 0 or key >= length:
+			raise IndexError('bit index out of range')
+		position = self.start + key
+		return (self.data[position >> 3] >> (7 - (position & 7))) & 1
+
+	def __iter__(self):
+		return iter(self.unpacked())
+
+	def __eq__(self, other):
+		if isinstance(other, PackedBits):
+			return len(self) == len(other) and self.value() == other.value()
+		if isinstance(other, (bytes, bytearray, list)):
+			return self.unpacked() == bytearray(other)
+		return NotImplemented
+
+	__hash__ = None
+
+	def __add__(self, other):
+		if isinstance(other, PackedBits):
+			if len(other) == 0:
+				return self
+			if len(self) == 0:
+				return other
+			if other.data is self.data and other.start == self.stop:
+				# the two runs are already next to each other in the same buffer, just widen the view
+				return PackedBits.view(self.data, self.start, other.stop)
+		return PackedBits.join([self, other])
+
+	def __repr__(self):
+		return "PackedBits('{}')".format(self.to_string())
+
+	def _bounds(self, start, end):
+		'''Normalize start/end arguments the way bytes.find does'''
+		length = self.stop - self.start
+		start = 0 if start is None else (max(start + length, 0) if start < 0 else start)
+		end = length if end is None else (max(end + length, 0) if end < 0 else min(end, length))
+		return start, end
+
+	def index(self, sub, start=None, end=None):
+		'''Like bytearray.index, sub can be a single bit (0/1) or a run of bits'''
+		found = self.find(sub, start, end)
+		if found < 0:
+			raise ValueError('subsection not found')
+		return found
+
+	def find(self, sub, start=None, end=None):
+		'''Like bytearray.find, sub can be a single bit (0/1) or a run of bits'''
+		start, end = self._bounds(start, end)
+		if isinstance(sub, int):
+			return self._find_bit(sub, start, end)
+		sub = PackedBits.from_bits(sub)
+		if start > self.stop - self.start or end - start < len(sub):
+			return -1
+		if len(sub) < 16:
+			return self._find_short(sub, start, end)
+		return self._find_long(sub, start, end)
+
+	def _find_bit(self, bit, start, end):
+		'''Find the next single 0 or 1, whole bytes at a time'''
+		position = self.start + start
+		stop = self.start + end
+		data = self.data
+		# finish off a partial byte first
+		while position < stop and position & 7:
+			if ((data[position >> 3] >> (7 - (position & 7))) & 1) == bit:
+				return position - self.start
+			position += 1
+		if position >= stop:
+			return -1
+		# then skip whole bytes that cannot contain the bit
+		found = (nonzero_byte if bit else nonff_byte).search(data, position >> 3, (stop + 7) >> 3)
+		if not found:
+			return -1
+		byte = data[found.start()]
+		offset = 8 - (byte if bit else (~byte & 0xff)).bit_length()
+		position = (found.start() << 3) + offset
+		return position - self.start if position < stop else -1
+
+	def _find_short(self, sub, start, end):
+		'''Find a short run of bits by searching the bits as a string, a chunk at a time'''
+		needle = sub.to_string()
+		chunk = 8192
+		while start + len(needle) <= end:
+			haystack = self[start: min(end, start + chunk + len(needle) - 1)].to_string()
+			found = haystack.find(needle)
+			if found >= 0:
+				return start + found
+			start += chunk
+		return -1
+
+	def _find_long(self, sub, start, end):
+		'''Find a run of 16+ bits by searching for its whole bytes at each of the 8 bit alignments'''
+		length = len(sub)
+		target = sub.value()
+		data = self.data
+		first = self.start + start
+		last = self.start + end # the match has to end by here
+		best = None
+		for head, core, tail in phase_cores(target, length):
+			# a match starting at (byte * 8 - head) has core starting at byte
+			low = (first + head + 7) >> 3
+			high = (last - tail) >> 3
+			if best is not None:
+				# no sense looking for something later than what we already found
+				high = min(high, ((best - 1 + head) >> 3) + len(core))
+			while True:
+				found = data.find(core, low, high)
+				if found < 0:
+					break
+				position = (found << 3) - head
+				if PackedBits.view(data, position, position + length).value() == target:
+					best = position
+					break
+				low = found + 1
+		return -1 if best is None else best - self.start
+
+	def count(self, sub, start=None, end=None):
+		'''Like bytearray.count (non-overlapping), sub can be a single bit (0/1) or a run of bits'''
+		start, end = self._bounds(start, end)
+		bits = self[start: end]
+		if isinstance(sub, int):
+			ones = popcount(bits.value())
+			return ones if sub else len(bits) - ones
+		return bits.to_string().count(PackedBits.from_bits(sub).to_string())
+
+# Splitting a search pattern into whole bytes for each of the 8 possible bit alignments is
+# the expensive part of setting up a search, and the same patterns get searched for repeatedly.
+@functools.lru_cache(maxsize=64)
+def phase_cores(value, length):
+	'''Return [head bits, core bytes, tail bits] for each alignment of a bit pattern'''
+	cores = []
+	for phase in range(8):
+		head = -phase % 8
+		core_bytes = (length - head) >> 3
+		tail = length - head - (core_bytes << 3)
+		core = (value >> tail) & ((1 << (core_bytes << 3)) - 1)
+		cores.append((head, core.to_bytes(core_bytes, 'big'), tail))
+	return cores
+
+# A track is a record with a slot for each of the things the analysis finds out about it, rather than
+# a dict, so there is less to each one.  It still works like a dict (track['bits'], 'bits' in track,
+# track.get, track.update), which is how the analysis code uses it, and a key that has not been set yet
+# is missing just as it would be from a dict.  Anything without a slot of its own goes in __dict__.
+class Track(collections.abc.MutableMapping):
+	'''Everything about one track (quarter track) of the disk'''
+	__slots__ = ('track_number', 'index_offset', 'bits', 'features', 'zero_spans', 'repeating_regions',
+		'zero_streams', 'zero_stream_starts', 'track_map', 'bit_stream', 'track_bits', 'track_start',
+		'track_repeat', 'track_length', 'track_group', 'track_nibbles', 'all_nibbles', 'all_offsets',
+		'all_sectors', 'good_sectors', 'timings', 'processing_time', 'cache_key', 'from_cache',
+		'standard_track', '__dict__')
+	# the keys with slots of their own, anything else is only a key if it is in __dict__
+	# (so that, as with a dict, 'copy' in track is False and track['copy'] is a KeyError)
+	fields = frozenset(__slots__[:-1])
+
+	def __init__(self, **fields):
+		for key, value in fields.items():
+			self[key] = value
+
+	def __getitem__(self, key):
+		if key in Track.fields:
+			try:
+				return getattr(self, key)
+			except AttributeError:
+				raise KeyError(key) from None
+		return self.__dict__[key]
+
+	def __setitem__(self, key, value):
+		if key in Track.fields:
+			setattr(self, key, value)
+		else:
+			self.__dict__[key] = value
+
+	def __delitem__(self, key):
+		if key in Track.fields:
+			try:
+				delattr(self, key)
+			except AttributeError:
+				raise KeyError(key) from None
+		else:
+			del self.__dict__[key]
+
+	def __contains__(self, key):
+		return key in self.__dict__ or (key in Track.fields and hasattr(self, key))
+
+	def __iter__(self):
+		for key in Track.__slots__[:-1]:
+			if hasattr(self, key):
+				yield key
+		yield from self.__dict__
+
+	def __len__(self):
+		return sum(1 for key in self)
+
+	def copy(self):
+		'''A shallow copy of the track'''
+		return Track(**dict(self.items()))
+
+	def __repr__(self):
+		return 'Track({})'.format(', '.join('{}={!r}'.format(key, value) for key, value in self.items()))
+
+# Tables of intervals (the zero runs and spans, the repeating regions) can have hundreds of rows per
+# track.  Rather than a little list per row, they are kept as a column of array('l') for each field.
+# A row comes out as a tuple, and the columns can be used directly in the loops that go through them.
+class Intervals:
+	'''A table of rows of integers, stored by column'''
+	__slots__ = ('columns',)
+
+	def __init__(self, width, rows=()):
+		self.columns = tuple(array.array('l') for column in range(width))
+		for row in rows:
+			self.append(row)
+
+	def append(self, row):
+		'''Add a row to the end of the table'''
+		for column, value in zip(self.columns, row):
+			column.append(value)
+
+	def __len__(self):
+		return len(self.columns[0])
+
+	def __iter__(self):
+		return zip(*self.columns)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return list(zip(*(column[index] for column in self.columns)))
+		return tuple(column[index] for column in self.columns)
+
+	def __eq__(self, other):
+		return isinstance(other, Intervals) and self.columns == other.columns
+
+	def __repr__(self):
+		return 'Intervals({})'.format(list(self))
+
+# Positions of entries in a list (e.g. the track map), kept sorted by some offset of theirs (e.g. where
+# they end), so that the entries near an offset can be found by bisection rather than going through the list.
+class OffsetIndex:
+	'''Positions of entries, kept in order of an offset'''
+	__slots__ = ('offsets', 'positions')
+
+	def __init__(self):
+		self.offsets = array.array('l')
+		self.positions = array.array('l')
+
+	def add(self, offset, position):
+		'''Add the entry at position, with the given offset'''
+		at = bisect.bisect_right(self.offsets, offset)
+		self.offsets.insert(at, offset)
+		self.positions.insert(at, position)
+
+	def near(self, offset, tolerance):
+		'''The positions of the entries whose offsets are less than tolerance away from offset'''
+		low = bisect.bisect_right(self.offsets, offset - tolerance)
+		high = bisect.bisect_left(self.offsets, offset + tolerance, low)
+		return self.positions[low: high]
+
+threezeros = PackedBits.from_bits(b'\x00\x00\x00')
+syncnibble = PackedBits.from_bits(b'\x00\x01\x01\x01\x01\x01\x01\x01\x01')
 
 # Main analysis control loop
 def analyze_disk():
@@ -72,61 +540,332 @@ def analyze_disk():
 	global options
 	# Main analysis loop.  This goes through the whole EDD file track by track and analyzes each track.
 	# The resulting analyzed data is all accumulated in memory, then written back out in as many formats as requested.
+	# Or, if streaming, each track is written out as soon as it is analyzed (see stream_disk).
 	
+	started = clock()
+	analyzed_tracks = None
 	with open(options['output_basename'], mode="rb") as eddfile:
-		if options['write_log']:
-			options['console'].append(open(options['logfilename'], mode="w"))
+		if options['stream_tracks']:
+			stream_disk(eddfile)
+		else:
+			tracks = load_tracks(eddfile)
+			# cut back to just first two tracks for testing
+			# tracks = tracks[0:2]
+
+			# message('Searching within tracks for patterns.', 2)
+			# tracks = track_patterns(tracks)
+
+			# TODO: make this more elegant and/or more correct, also allow for some combinations like sync
+			if options['no_translation']:
+				for track in tracks:
+					track = untranslated_track(track)
+			else:
+				if options['sync_tracks']:
+					track_groups = sync_tracks(tracks)
+					tracks = group_tracks(tracks, track_groups)
+				else:
+					# create a trivial track group array
+					track_groups = []
+					for track in tracks:
+						track['track_group'] = len(track_groups)
+						track_groups.append({'track_group': [len(track_groups)], 'advance_average': 0})
+				# here for testing
+				options['analyze_bits'] = False
 
-		tracks = load_tracks(eddfile)
-		# cut back to just first two tracks for testing
-		# tracks = tracks[0:2]
+				if options['jobs'] > 1 and not options['sync_tracks']:
+					# every track stands alone, so they can be spread across worker processes
+					tracks = analyze_tracks_in_pool(tracks)
+				else:
+					# tracks = track_patterns(tracks)
+					for track in tracks:
+						track = split_track(track)
+
+					if options['analyze_bits'] or options['analyze_nibbles'] or options['analyze_sectors']:
+						message('Going through track groups, resolving bits and analyzing nibbles.', 2)
+						tracks = analyze_track(tracks, track_groups)
 
-		# message('Searching within tracks for patterns.', 2)
-		# tracks = track_patterns(tracks)
+				if options['sync_tracks']:
+					message('Going through track groups and trimming tracks for sync.', 2)
+					tracks = sync_groups(tracks, track_groups)
 
-		# TODO: make this more elegant and/or more correct, also allow for some combinations like sync
-		if options['no_translation']:
+			message('Writing output files.', 2)
+			for output_type, output_writer in options['output'].items():
+				if output_writer:
+					write_tracks(output_writer(eddfile), tracks)
 			for track in tracks:
-				track['track_start'] = 0
-				track['track_repeat'] = len(track['bits'])
-				track['track_bits'] = track['bits'][track['track_start']: track['track_repeat']]
+				profile_track(track)
+			status['track_count'] = len(tracks)
+			analyzed_tracks = tracks
+
+		if options['cache_dir']:
+			trim_cache()
+
+		if options['profile_file']:
+			record_time(status['timings'], 'analyze_disk', started)
+			write_profile()
+	return analyzed_tracks
+
+# Convert one EDD file, writing the output files (and the log) alongside it.
+def convert_file(eddfilename):
+	'''Analyze an EDD file and write out the requested output files, return the tracks'''
+	global options
+	options['output_basename'] = eddfilename
+	options['logfilename'] = eddfilename + '.log'
+	if options['write_log']:
+		# the log gets a big buffer, since werbose runs write a lot of small messages to it
+		options['console'].append(open(options['logfilename'], mode="w", buffering=log_buffer))
+	try:
+		return analyze_disk()
+	finally:
+		# close the log file if we were writing to it, even if the conversion failed
+		if options['write_log']:
+			options['console'].pop().close()
+
+# The EDD files to convert can be named directly, or given as a directory (every .edd file in it)
+# or a wildcard pattern (for shells that do not expand them).
+def find_edd_files(names):
+	'''Expand the EDD file names, directories, and patterns into a list of files'''
+	eddfilenames = []
+	for name in names:
+		if os.path.isdir(name):
+			found = [os.path.join(name, entry) for entry in os.listdir(name) if entry.lower().endswith('.edd')]
+		elif os.path.exists(name):
+			found = [name]
 		else:
-			if options['sync_tracks']:
-				track_groups = sync_tracks(tracks)
-				tracks = group_tracks(tracks, track_groups)
-			else:
-				# create a trivial track group array
-				track_groups = []
-				for track in tracks:
-					track['track_group'] = len(track_groups)
-					track_groups.append({'track_group': [len(track_groups)], 'advance_average': 0})
-			# tracks = track_patterns(tracks)
-			for track in tracks:
-				track = split_at_zeros(track)
-				track['track_bits'] = track['bit_stream']
-				track['track_start'] = 0
-				track['track_repeat'] = len(track['track_bits'])
+			found = glob.glob(name)
+		if not found:
+			print('No EDD files found for {}.'.format(name))
+		eddfilenames.extend(eddfilename for eddfilename in sorted(found) if not eddfilename in eddfilenames)
+	return eddfilenames
 
-			# here for testing
-			options['analyze_bits'] = False
+# Batch conversion.  When there is more than one EDD file, each one is converted in a process of its
+# own, --jobs of them at a time (the tracks of each file are then analyzed in that one process).  A fresh
+# process per file means nothing one conversion leaves in options or status carries over to the next,
+# and a file that fails is reported as failed rather than stopping the rest.  The messages for each file
+# are shown (in order) when it is done, followed by a summary of how all of them went.
+def convert_batch(eddfilenames):
+	'''Convert several EDD files using a pool of worker processes, then summarize'''
+	global options
+	batch_jobs = min(options['jobs'], len(eddfilenames))
+	message('Converting {} EDD files, {} at a time.', 1, len(eddfilenames), batch_jobs)
+	worker_options = {key: value for key, value in options.items() if key != 'console'}
+	worker_options['jobs'] = 1
+	results = []
+	started = time.perf_counter()
+	with multiprocessing.Pool(batch_jobs, initializer=start_worker, initargs=(worker_options,), maxtasksperchild=1) as pool:
+		for result in pool.imap(convert_file_worker, eddfilenames):
+			message(result['messages'], end='')
+			if not result['ok']:
+				message('Could not convert {}: {}', 0, result['eddfile'], result['error'])
+			results.append(result)
+	elapsed = time.perf_counter() - started
+	message('')
+	message('Batch summary:')
+	for result in results:
+		message('{:>6} {:4d} tracks {:7.2f}s  {}', 0, 'ok' if result['ok'] else 'FAILED', result['tracks'], \
+			result['seconds'], result['eddfile'])
+	message('{} of {} EDD files converted in {:5.2f}s.', 0, sum(1 for result in results if result['ok']), len(results), elapsed)
+	return results
 
-			if options['analyze_bits'] or options['analyze_nibbles'] or options['analyze_sectors']:
-				message('Going through track groups, resolving bits and analyzing nibbles.', 2)
-				tracks = analyze_track(tracks, track_groups)
+def convert_file_worker(eddfilename):
+	'''Convert one EDD file in a batch worker process, returning how it went'''
+	global options, status
+	started = time.perf_counter()
+	result = {'eddfile': eddfilename, 'ok': True, 'error': '', 'tracks': 0}
+	status.clear()
+	status.update(new_status())
+	if options['profile_file']:
+		# each file gets its own timing report, next to it
+		options['profile_file'] = eddfilename + '.profile.json'
+	try:
+		convert_file(eddfilename)
+		result['tracks'] = status.get('track_count', 0)
+	except Exception as err:
+		result['ok'] = False
+		result['error'] = '{}: {}'.format(type(err).__name__, err)
+		message(traceback.format_exc(), 1, end='')
+	result['seconds'] = time.perf_counter() - started
+	result['messages'] = worker_messages()
+	return result
 
-			if options['sync_tracks']:
-				message('Going through track groups and trimming tracks for sync.', 2)
-				tracks = sync_groups(tracks, track_groups)
+# Streaming version of the analysis loop, for when the tracks do not need to be considered together
+# (no track sync).  Tracks are read from the EDD file one at a time, analyzed, handed to each of the
+# output writers, and then let go, so memory use does not depend on how many tracks there are.
+def stream_disk(eddfile):
+	'''Analyze and write out the tracks one at a time'''
+	global options
+	message('Streaming tracks from EDD file through analysis to output files.', 2)
+	output_writers = [output_writer(eddfile) for output_writer in options['output'].values() if output_writer]
+	if options['no_translation']:
+		analyzed_tracks = (untranslated_track(track) for track in read_tracks(eddfile))
+	else:
+		# here for testing (as in analyze_disk)
+		options['analyze_bits'] = False
+		if options['jobs'] > 1:
+			analyzed_tracks = stream_tracks_in_pool(eddfile)
+		else:
+			analyzed_tracks = (stream_track(track) for track in read_tracks(eddfile))
+	status['track_count'] = 0
+	for track in analyzed_tracks:
+		for output_writer in output_writers:
+			output_writer.write_track(track)
+		profile_track(track)
+		status['track_count'] += 1
+	for output_writer in output_writers:
+		output_writer.close()
 
-		message('Writing output files.', 2)
-		for output_type, output_file in options['output'].items():
-			if output_file:
-				output_file(eddfile, tracks)
+def stream_track(track):
+	'''Split and analyze one track when streaming'''
+	global options
+	track = split_track(track)
+	if options['analyze_bits'] or options['analyze_nibbles'] or options['analyze_sectors']:
+		track = analyze_one_track(track)
+	return track
 
-		# close the log file if we were writing to it
-		if options['write_log']:
-			(options['console'])[1].close
-	return 1
+def stream_tracks_in_pool(eddfile):
+	'''Split and analyze the tracks using worker processes, yielding them in track order'''
+	global options
+	track_count = math.ceil(os.fstat(eddfile.fileno()).st_size / 16384)
+	worker_options = {key: value for key, value in options.items() if key != 'console'}
+	with multiprocessing.Pool(options['jobs'], initializer=start_worker, initargs=(worker_options,)) as pool:
+		for track, split_messages, analyze_messages in pool.imap(analyze_track_worker, range(track_count)):
+			message(split_messages + analyze_messages, end='')
+			yield track
+
+# Without translation, the track is just the whole EDD read
+def untranslated_track(track):
+	'''Set up the track bits to be all of the bits that were read'''
+	track['track_start'] = 0
+	track['track_repeat'] = len(track['bits'])
+	track['track_bits'] = track['bits'][track['track_start']: track['track_repeat']]
+	return track
+
+# Find the repeats in a track and build the bit stream that represents one revolution.
+def split_track(track):
+	'''Split the track at zeros and set up the track bits from the resulting bit stream'''
+	try:
+		if options['cache_dir']:
+			started = clock()
+			cached = load_cached_track(track)
+			record_time(track.setdefault('timings', {}), 'load_cached_track', started)
+			if cached:
+				return track
+		if fast_path_wanted():
+			started = clock()
+			standard = read_standard_track(track)
+			record_time(track.setdefault('timings', {}), 'read_standard_track', started)
+			if standard:
+				return track
+		track = split_at_zeros(track)
+		track['track_bits'] = track['bit_stream']
+		track['track_start'] = 0
+		track['track_repeat'] = len(track['track_bits'])
+		track['track_length'] = track['track_repeat']
+		return track
+	finally:
+		# everything after this works on the track bits, so the features of the EDD bits can go
+		forget_features(track)
+
+# Most disks are plain DOS 3.3/ProDOS (or DOS 3.2) disks, and when all that is being written is a .dsk,
+# all that matters is getting good data out of every sector.  So in that case, nibblize the EDD bits
+# directly (a revolution's worth, plus enough to finish off a sector that crosses the end of it) and
+# if every sector turns up with good address and data checksums, that's the track.  Only tracks that
+# don't pass go through the whole analysis to find and repair the revolution.
+fast_path_bits = track_maximum + 8192
+
+def fast_path_wanted():
+	'''Check whether standard tracks can be read straight from the EDD bits'''
+	global options
+	return options['fast_sectors'] and options['analyze_nibbles'] and options['analyze_sectors'] and \
+		not options['sync_tracks'] and not options['no_translation'] and \
+		[output_type for output_type, output_writer in options['output'].items() if output_writer] == ['dsk']
+
+def read_standard_track(track):
+	'''Read a standard 13/16 sector track straight from the EDD bits, or return False if it is not one'''
+	global fast_path_bits
+	track_start_clock = time.perf_counter()
+	decoded = decode_nibbles(unpacked_bits(track)[: fast_path_bits])
+	# work on a copy, so if this does not work out the track is left as it was
+	standard = track.copy()
+	standard['track_nibbles'] = decoded['nibbles']
+	standard['all_nibbles'] = decoded['nibbles']
+	standard['all_offsets'] = array.array('l', [end - start for start, end in zip(decoded['starts'], decoded['ends'])])
+	standard = consolidate_sectors(locate_sectors(standard))
+	dos32 = any(sector['dos32'] for sector in standard['all_sectors'])
+	if standard['good_sectors'] < (13 if dos32 else 16):
+		message('Track {:5.2f} is not a clean standard track ({} good sectors), analyzing it fully.', 2, \
+			track['track_number'], standard['good_sectors'])
+		return False
+	# the track length is the distance to the next copy of the first sector with a good address
+	# (the read can start in the middle of an address field, so the very first one may not have one)
+	good_sectors = [sector for sector in standard['all_sectors'] if sector['addr_checksum_ok']]
+	first = good_sectors[0]
+	standard['track_length'] = 0
+	for sector in good_sectors[1:]:
+		if (sector['sector'], sector['track']) == (first['sector'], first['track']):
+			standard['track_length'] = decoded['starts'][sector['offset']] - decoded['starts'][first['offset']]
+			break
+	if standard['track_length'] == 0:
+		standard['track_length'], correlation = estimate_track_length(standard)
+	standard['track_start'] = 0
+	standard['track_repeat'] = standard['track_length']
+	standard['track_bits'] = standard['bits'][: standard['track_length']]
+	standard['standard_track'] = True
+	standard['processing_time'] = time.perf_counter() - track_start_clock
+	track.update(standard)
+	message('Track {:5.2f} is a clean standard track, read straight from the EDD bits.', 2, track['track_number'])
+	return True
+
+# When tracks are not being synced, each track is analyzed on its own, so the work can be spread
+# across a pool of worker processes (--jobs).  Workers get a copy of the options when they start
+# and read their tracks straight out of the EDD file, so only a track index goes out to them.
+# What comes back is the analyzed track and whatever messages it would have displayed, which are
+# displayed here in track order, so the output (and the log) come out the same as a serial run.
+def analyze_tracks_in_pool(tracks):
+	'''Split and analyze all of the tracks using a pool of worker processes'''
+	global options
+	message('Analyzing tracks using {} worker processes.', 2, options['jobs'])
+	worker_options = {key: value for key, value in options.items() if key != 'console'}
+	with multiprocessing.Pool(options['jobs'], initializer=start_worker, initargs=(worker_options,)) as pool:
+		results = pool.map(analyze_track_worker, range(len(tracks)), chunksize=1)
+	for track, split_messages, analyze_messages in results:
+		message(split_messages, end='')
+	if options['analyze_bits'] or options['analyze_nibbles'] or options['analyze_sectors']:
+		message('Going through track groups, resolving bits and analyzing nibbles.', 2)
+		for track, split_messages, analyze_messages in results:
+			message(analyze_messages, end='')
+	# the (trivial) track groups were set up here rather than in the workers
+	for track, result in zip(tracks, results):
+		result[0]['track_group'] = track['track_group']
+	return [result[0] for result in results]
+
+def start_worker(worker_options):
+	'''Set up the options in a worker process, capturing messages rather than displaying them'''
+	global options
+	options.update(worker_options)
+	options['console'] = [io.StringIO()]
+
+def worker_messages():
+	'''Collect (and clear) the messages captured in a worker process'''
+	captured = options['console'][0]
+	text = captured.getvalue()
+	captured.seek(0)
+	captured.truncate()
+	return text
+
+def analyze_track_worker(track_index):
+	'''Load, split, and analyze one track in a worker process'''
+	global options
+	with open(options['output_basename'], mode="rb") as eddfile:
+		eddfile.seek(track_index * 16384)
+		track = Track(track_number=track_index * 0.25, index_offset=0, bits=PackedBits(eddfile.read(16384)))
+	track = split_track(track)
+	split_messages = worker_messages()
+	if options['analyze_bits'] or options['analyze_nibbles'] or options['analyze_sectors']:
+		track = analyze_one_track(track)
+	# the window index is big, and quicker to build again (if it is needed) than to send back
+	track.pop('window_index', None)
+	return track, split_messages, worker_messages()
 
 # Take the open file handle and read the bits from the EDD into tracks array
 # Return the initialized tracks array.
@@ -135,33 +874,34 @@ def load_tracks(eddfile):
 	'''create the base tracks array from the edd file'''
 	global options, status
 	message('load_tracks: Reading tracks from EDD file, converting into bit stream.', 2)
-	time_load_tracks = time.clock()
+	started = clock()
+	tracks = list(read_tracks(eddfile))
+	status['time_load_tracks'] = record_time(status['timings'], 'load_tracks', started)
+	message('load_tracks: Load/convert took {:5.2f} seconds', 2, status['time_load_tracks'])
+	return tracks
+
+# Read the tracks from the EDD file one at a time (each track is 16384 bytes)
+def read_tracks(eddfile):
+	'''generate the base track structures from the edd file'''
 	current_track = 0.0
-	tracks = []
 	while True:
 		eddbuffer = eddfile.read(16384)
 		if not eddbuffer:
 			break;
-		tracks.append({
-			'track_number': current_track,
-			'index_offset': 0,
-			'bits': bytes_to_bits(eddbuffer)
-		})
-		current_track += 0.25
+		track = Track(track_number=current_track, index_offset=0, bits=PackedBits(eddbuffer))
 		# display_bits call below is useful for seeing all the bits on the track, was
 		# used when I was trying to see just how noisy extended zero regions that
 		# I wrote myself really are.
-		# display_bits('Track {:5.2f}:'.format(tracks[-1]['track_number']), tracks[-1]['bits'], 2)
-	status['time_load_tracks'] = time.clock() - time_load_tracks
-	message('load_tracks: Load/convert took {:5.2f} seconds'.format(status['time_load_tracks']), 2)
-	return tracks
+		# display_bits('Track {:5.2f}:'.format(track['track_number']), track['bits'], 2)
+		yield track
+		current_track += 0.25
 
 def track_patterns(tracks):
 	'''Compute the intratrack matches for each track'''
 	global options
 	message('Searching within tracks for patterns.', 2)
 	for track in tracks:
-		time_track = time.clock()
+		time_track = time.perf_counter()
 		track = split_at_zeros(track)
 		# if we consolidated this track into the group then we will have already found these patterns
 		if not 'pattern_lengths' in track:
@@ -172,15 +912,15 @@ def track_patterns(tracks):
 		else:
 			track['match_best'] = 0
 			track['track_regions'] = []
-		track['time_track'] = time.clock() - time_track
+		track['time_track'] = time.perf_counter() - time_track
 
 		# status output
 		status_length = '{:5d}'.format(track['track_length']) if 'track_length' in track else '  n/a'
 		status_match = '{:6d}'.format(track['match_best']) if track['match_best'] > 0 else '   n/a'
 		# message('Track {:5.2f}: bits: {}, matched: {}, group: {:2d}, time: {:5.2f}s'.format(\
 		# 	track['track_number'], status_length, status_match, track['track_group'], track['time_track']), 1)
-		message('Track {:5.2f}: bits: {}, matched: {}, time: {:5.2f}s'.format(\
-			track['track_number'], status_length, status_match, track['time_track']), 1)
+		message('Track {:5.2f}: bits: {}, matched: {}, time: {:5.2f}s', 1, \
+			track['track_number'], status_length, status_match, track['time_track'])
 
 	return tracks
 
@@ -192,13 +932,13 @@ def split_at_zeros(track):
 	'''Locate streams of bits that look to contain more zeros in a row than the amplifier can handle'''
 	global options, threezeros, track_maximum, track_minimum
 	# split the track up by zero regions
-	message('Track: {}'.format(track['track_number']), 2)
-	track = find_zeros(track)
-	track = find_patterns_between_zeros(track)
-	track = build_track_map(track)
-	track = compress_gaps(track)
-	track = resolve_gaps(track)
-	track = build_bit_stream(track)
+	message('Track: {}', 2, track['track_number'])
+	track = timed(track, find_zeros)
+	track = timed(track, find_patterns_between_zeros)
+	track = timed(track, build_track_map)
+	track = timed(track, compress_gaps)
+	track = timed(track, resolve_gaps)
+	track = timed(track, build_bit_stream)
 	# Now we've basically got a solid track.
 	# Obsolete: remove.
 	# first_good = data_regions[0]
@@ -214,6 +954,35 @@ def split_at_zeros(track):
 	# track['zero_map'] = track_map
 	return track
 
+# Track features.  Some things about a track's EDD bits are wanted by more than one stage, or more than
+# once: the bits unpacked one to a byte, the runs of 000s and how many 000s there are, the estimated track
+# length, the suffix array.  Each is worked out the first time something asks for it and kept in the
+# track (in track['features'], along with the bits it came from, so if the bits are replaced it is worked
+# out again for the new ones).  They are let go once the track has been split, since after that the
+# analysis works on the track bits, and they are not cached or sent back from worker processes.
+def track_feature(compute):
+	'''Make a function of a track into a feature, worked out once and then kept in the track'''
+	name = compute.__name__
+	@functools.wraps(compute)
+	def feature(track):
+		bits = track['bits']
+		features = track.setdefault('features', {})
+		if name in features and features[name][0] is bits:
+			return features[name][1]
+		value = compute(track)
+		features[name] = (bits, value)
+		return value
+	return feature
+
+def forget_features(track):
+	'''Let go of the features worked out for a track'''
+	track.pop('features', None)
+
+@track_feature
+def unpacked_bits(track):
+	'''The track's EDD bits as bytes, one (0 or 1) per bit'''
+	return bytes(track['bits'].unpacked())
+
 # Find regions in the track that seem to be stretches of 0s, these are at great risk of
 # being misread, since the amplifier randomly produces spurious 1s if it reads too many 0s in a row.
 # Areas between these "zero streams" are the more reliable things to search for.
@@ -232,48 +1001,43 @@ def find_zeros(track):
 		# we already did this, skip ahead
 		return track
 	bits = track['bits']
-	zero_spans = []
+	zero_runs = find_zero_runs(track)
+	run_starts, run_ends = zero_runs.columns
+	zero_spans = Intervals(3)
 	zero_stream_start = 0
 	margin = 10 # 10 bits around a zero stream we found still count as being in a zero stream
 	escape_margin = 25 # 0001 that has no 000 within 25 bits marks end of zero stream
 	bit_stop = len(bits) - 3 # last place we could find a 000
-	in_zero_stream = False
 	index  = 0
+	run = 0 # the next run of 000s, the next 000 is always at the start of one
 	while index < bit_stop:
-		# find the next 000
-		if not in_zero_stream:
-			# if we're out of a zero stream go find the next one
-			try:
-				next_000 = bits.index(threezeros, index)
-				# area between index and the next_000 (modulo margin) is a reliable, non-zero stream
-				zero_spans.append([1, index + margin, next_000 - margin])
-				# move the index up to the zero stream and start collecting it
-				index = next_000
-				zero_stream_start = index
-				in_zero_stream = True
-			except ValueError:
-				# no more 000s, we're done checking
-				# area between index and len(bits) modulo margin is reliable
-				zero_spans.append([1, index + margin, len(bits) - margin])
-				break
-		else:
-			# we are in a zero stream, skip ahead to the next 1
-			try:
-				index = bits.index(0x01, index)
-			except ValueError:
+		# we're out of a zero stream, go find the next one
+		if run == len(zero_runs):
+			# no more 000s, we're done checking
+			# area between index and len(bits) modulo margin is reliable
+			zero_spans.append((1, index + margin, len(bits) - margin))
+			break
+		# area between index and the next 000 (modulo margin) is a reliable, non-zero stream
+		zero_stream_start = run_starts[run]
+		zero_spans.append((1, index + margin, zero_stream_start - margin))
+		# move the index up to the zero stream and start collecting it
+		index = zero_stream_start
+		while index < bit_stop:
+			# we are in a zero stream, skip ahead to the next 1 (the end of this run)
+			index = run_ends[run]
+			run += 1
+			if index == len(bits):
 				# There are no more 1s left, so track ends in a zero stream, and we're out
-				zero_spans.append([0, zero_stream_start, len(bits)])
+				zero_spans.append((0, zero_stream_start, len(bits)))
 				break
-			# from the 1 that we found, look to see if another 000 occurs in the near future
-			try:
-				next_000 = bits.index(threezeros, index, index + escape_margin)
+			# from the 1 that we found, see if the next 000 occurs in the near future
+			if run < len(zero_runs) and run_starts[run] + 3 <= index + escape_margin:
 				# there are more 000s coming up, so we are still in a zero stream
-				# move the index up to them, probably saves a picosecond.
-				index = next_000
-			except ValueError:
+				index = run_starts[run]
+			else:
 				# There are no 000s in the short term, so we're done with the zero stream
-				zero_spans.append([0, zero_stream_start, index])
-				in_zero_stream = False
+				zero_spans.append((0, zero_stream_start, index))
+				break
 	# We now have a track map, unless we didn't find any 000s in the whole track.  Could happen.
 	# In that case, the whole track is essentially "reliable".
 	# NOTE: Diversi-DOS.EDD has this property, no zero streams at all.
@@ -283,10 +1047,27 @@ def find_zeros(track):
 		message('No zero streams found in track.', 2)
 		# set the "reliable" data region to be the first track_minimum bits.
 		# zero_spans.append([1, 0, track_minimum])
-		zero_spans = [[1, 0, track_minimum]]
+		zero_spans = Intervals(3, [(1, 0, track_minimum)])
 	track['zero_spans'] = zero_spans
 	return track
 
+# Find all of the runs of three or more zeros in the track in one pass, as (start, end) rows.
+# Any 000 in the track is inside one of these, so this is all find_zeros needs, and the table
+# is a track feature so that anything else wanting to know about 000s can use it too.
+zero_run = re.compile(b'\x00{3,}')
+
+@track_feature
+def find_zero_runs(track):
+	'''Find the runs of three or more zeros in the track bits'''
+	global zero_run
+	return Intervals(2, (found.span() for found in zero_run.finditer(unpacked_bits(track))))
+
+# Count the 000s in the track (not overlapping, as bits.count(threezeros) would)
+@track_feature
+def count_threezeros(track):
+	'''Count the 000s in the track from the zero runs'''
+	return sum((end - start) // 3 for start, end in find_zero_runs(track))
+
 # Search the track for repeats, avoiding patches of 000s, this can usually get the repeats pretty quickly.
 # Even standard DOS disks can have trouble with strict matching otherwise because there are often patches of 000s
 # between sectors.
@@ -301,67 +1082,109 @@ def find_patterns_between_zeros(track):
 	# the zeros were already located.
 	track = find_zeros(track)
 	# Go through the reliable regions that start within revolution 1 and find all repeats
-	# The findings will be recorded by extending the elements in the zero_spans array
-	# to also contain [..., rev2 start, end, rev3 start, end], where 0, 0 means not found
+	# The findings are recorded as [rev2 start, end, rev3 start, end] for each region, where 0, 0 means not found
 	bits = track['bits']
-	data_regions = []
+	find_copy = repeat_finder(track)
+	data_regions = Intervals(6)
 	stop_bit = None
-	for region in track['zero_spans']:
-		if (stop_bit and region[1] > stop_bit) or region[1] > track_maximum:
+	for kind, start, end in track['zero_spans']:
+		if (stop_bit and start > stop_bit) or start > track_maximum:
 			# we've moved past the first revolution, so we're finished
 			break
-		bit_length = region[2] - region[1]
-		if region[0] == 1 and bit_length > required_match: # not a zero stream and long enough
-			bits_to_find = bits[region[1]: region[2]] # the reliable region
-			index = region[1] + track_minimum # start searching 1 track ahead
+		bit_length = end - start
+		if kind == 1 and bit_length > required_match: # not a zero stream and long enough
+			index = start + track_minimum # start searching 1 track ahead
+			repeats = [0, 0, 0, 0]
 			try:
-				occurrence = bits.index(bits_to_find, index)
-				if occurrence > region[1] + track_maximum:
+				occurrence = find_copy(start, end, index)
+				if occurrence > start + track_maximum:
 					# this was found, but beyond the second revolution
-					if occurrence < region[1] + track_minimum + track_minimum:
+					if occurrence < start + track_minimum + track_minimum:
 						# we found third revolution but not second revolution
-						region.extend([0, 0, occurrence, occurrence + bit_length])
-					else:
-						# we found something weird, a copy but too far away for second revolution
-						# and too close for third.  So, just record it as not found and move on.
-						# Shouldn't happen often, if at all.
-						region.extend([0, 0, 0, 0])
+						repeats[2:] = [occurrence, occurrence + bit_length]
+					# otherwise we found something weird, a copy but too far away for second revolution
+					# and too close for third.  So, just record it as not found and move on.
+					# Shouldn't happen often, if at all.
 				else:
 					# we found the bits in the second revolution.
-					region.extend([occurrence, occurrence + bit_length])
+					repeats[:2] = [occurrence, occurrence + bit_length]
 					# can we find third revolution?
 					try:
-						occurrence = bits.index(bits_to_find, index + track_minimum)
+						occurrence = find_copy(start, end, index + track_minimum)
 						# yes, we found the third revolution, record it
-						region.extend([occurrence, occurrence + bit_length])
+						repeats[2:] = [occurrence, occurrence + bit_length]
 					except ValueError:
 						# could not find the bits.
 						# second repeat is probably off the end of the stream
-						region.extend([0, 0])
+						pass
 			except ValueError:
 				# did not find the bits anywhere up ahead in any revolution.
-				region.extend([0, 0, 0, 0])
+				pass
 			# if we found at least one repeat, trust this as good data
-			if region[3] > 0 or region[5] > 0:
-				data_regions.append(region[1:])
+			if repeats[0] > 0 or repeats[2] > 0:
+				data_regions.append([start, end] + repeats)
 			# if this is the first good region, move the stop point back to the repeat
 			if not stop_bit:
-				stop_bit = region[3]
-			rev2_distance = region[3] - region[1] if region[3] > 0 else 0
-			rev3_distance = region[5] - region[3] if region[5] > 0 else 0
-			message('data: {:6d}-{:6d} ({:5d}) {:6d} ({:5d}), {:6d} ({:5d})'.format(region[1], region[2], bit_length,
-				region[3], rev2_distance, region[5], rev3_distance), 2)
+				stop_bit = repeats[0]
+			rev2_distance = repeats[0] - start if repeats[0] > 0 else 0
+			rev3_distance = repeats[2] - repeats[0] if repeats[2] > 0 else 0
+			message('data: {:6d}-{:6d} ({:5d}) {:6d} ({:5d}), {:6d} ({:5d})', 2, start, end, bit_length,
+				repeats[0], rev2_distance, repeats[2], rev3_distance)
 		else:
 			# a zero stream, print a debugging message for now
-			message('ZERO: {:6d}-{:6d} ({:5d})'.format(region[1], region[2], bit_length), 2)	
+			message('ZERO: {:6d}-{:6d} ({:5d})', 2, start, end, bit_length)	
 			pass
 	track['repeating_regions'] = data_regions
 	return(track)
 
+# Estimate the track length without finding any patterns, by autocorrelation.  Map the bits to
+# +1/-1 and for each distance between track_minimum and track_maximum see how well the bits agree
+# with the bits that distance ahead.  The distance where they agree best is the estimate.  This
+# works even on a track with nothing else to go on (though on noise the agreement will be poor).
+# With NumPy the autocorrelation for all distances comes from an FFT, otherwise each distance is
+# an XOR and a popcount of the track's bits as one big integer.  Either way, the correlation at
+# each distance is the agreement count scaled by how many bits overlap, so both give the same answer.
+# Returns (and keeps in the track) the estimated length and its correlation, from -1 to 1.
+
+@track_feature
+def estimate_track_length(track):
+	'''Estimate the track length by autocorrelation of the bits'''
+	global options, track_minimum, track_maximum
+	bits = track['bits']
+	length = len(bits)
+	last_distance = min(track_maximum, length - 1)
+	if last_distance < track_minimum:
+		return (0, 0.0)
+	distances = range(track_minimum, last_distance + 1)
+	if options['numpy']:
+		signal = numpy.frombuffer(unpacked_bits(track), dtype=numpy.uint8).astype(numpy.float64) * 2 - 1
+		size = 1 << (2 * length - 1).bit_length()
+		spectrum = numpy.fft.rfft(signal, size)
+		agreement = numpy.rint(numpy.fft.irfft(spectrum * numpy.conj(spectrum), size)[track_minimum: last_distance + 1])
+		correlations = agreement / (length - numpy.arange(track_minimum, last_distance + 1))
+		best = int(numpy.argmax(correlations))
+		correlation = float(correlations[best])
+	else:
+		value = bits.value()
+		correlation = -2.0
+		for index, distance in enumerate(distances):
+			overlap = length - distance
+			disagreement = popcount((value >> distance) ^ (value & ((1 << overlap) - 1)))
+			distance_correlation = (overlap - 2 * disagreement) / overlap
+			if distance_correlation > correlation:
+				best, correlation = index, distance_correlation
+	message('Estimated track length {} (correlation {:4.2f})', 2, distances[best], correlation)
+	return (distances[best], correlation)
+
 # once we've split at zeros and found repeating regions, assemble them into a map so we have
 # boundary conditions for the parts of the track we need to resolve.  The format of the track map is:
 # [1/0, rev 1 start, end, rev 2 start, end, rev 3 start, end]
 # First element will be a 1 if we have at least rev 1 and rev 2 consistent.
+# The track map is a list of segments covering one revolution of the track, in order.  Good (trusty)
+# segments are [1, start, end], offsets into track['bits'] of bits that repeated reliably.  Gaps are
+# [0, start, end, to_resolve], where to_resolve has the two or three reads of the gap bits (as views onto
+# track['bits'], so nothing is copied), the first of them starting at start.  The bits themselves are only
+# put together into a new buffer once the map is done, in build_bit_stream.
 def build_track_map(track):
 	global track_maximum, track_minimum, required_match
 	edd_string = '       ]        ]        ]        ]        ]        ]        ]        ]       ]       ]'
@@ -386,15 +1209,15 @@ def build_track_map(track):
 				# In intermediate good region without rev 3 bits, third cursor goes back to 0.
 				# So: if we have rev 3 bits and we had rev 3 bits before, add the rev 3 gap in.
 				if len(to_resolve[1]) == 0:
-					message('Added a zero to_resolve from {} to {}'.format(bit_cursor[1], region[2]), 2)
+					message('Added a zero to_resolve from {} to {}', 2, bit_cursor[1], region[2])
 				if region[4] > 0 and bit_cursor[2] > 0 and bit_cursor[2] < region[4]:
 					to_resolve.append(bits[bit_cursor[2]: region[4]])
 					if len(to_resolve[2]) == 0:
-						message('Added a zero to_resolve check bits from {} to {}'.format(bit_cursor[2], region[4]), 2)
+						message('Added a zero to_resolve check bits from {} to {}', 2, bit_cursor[2], region[4])
 				# Add this as a gap to the bit map, between bit cursor 0 and the start of the good region
 				# with the gap bits to resolve in the to_resolve array.
 				track_map.append([0, bit_cursor[0], region[0], to_resolve])
-				message('Added    gap: {} - {} ({})'.format(bit_cursor[0], region[0], region[0] - bit_cursor[0]), 2)
+				message('Added    gap: {} - {} ({})', 2, bit_cursor[0], region[0], region[0] - bit_cursor[0])
 				# show where the EDD card's bytes ended, in case this helps figure out failure modes
 				# I don't actually think this is helping, though, after having looked at it.
 				if False: # commenting out the display for the moment.
@@ -408,14 +1231,14 @@ def build_track_map(track):
 			if not first_good:
 				first_good = region
 			# recall that for the moment I am only considering a region "good" if it has rev 1 and rev 2
-			track_map.append([1, region[0], region[1], [bits[region[0]: region[1]]]])
-			message('Added trusty: {} - {} ({})'.format(region[0], region[1], bit_length), 2)
+			track_map.append([1, region[0], region[1]])
+			message('Added trusty: {} - {} ({})', 2, region[0], region[1], bit_length)
 			# and set the cursor to the end of the trusty bits
 			# if there are rev 3 bits ("check bits") set the third cursor to their end
 			# if there are not, zero the third cursor out so it does not get used for next gap
 			check_bits = region[4] + bit_length if region[4] > 0 else 0
 			bit_cursor = [region[1], region[2] + bit_length, check_bits]
-			message('Bit cursor: {}'.format(bit_cursor))
+			message('Bit cursor: {}', 0, bit_cursor)
 	# now we have all the bits in track_map except the gap bits leading up to the first good bits
 	# and those following the last good bits.  This may or may not be long enough to cover the track.
 	# One situation is where we started with a good region that is contained in the last good region
@@ -443,8 +1266,16 @@ def build_track_map(track):
 	# useful resolution possible.  And of course one hopes it barely matters because
 	# this is after all in the middle of an unreliable gap.
 	# Now, after all that verbiage, let us implement it.
-	message('Bit cursor: {}'.format(bit_cursor), 2)
-	message('First good: {}'.format(first_good), 2)
+	if not first_good:
+		# There were no good regions at all (an unformatted track, or noise, or just nothing that
+		# repeated reliably enough).  Fall back on the estimated track length and call it all a gap.
+		track_length, correlation = estimate_track_length(track)
+		message('No good regions, going by estimated track length {} (correlation {:4.2f}).', 2, \
+			track_length, correlation)
+		track['track_map'] = [[0, 0, track_length, [bits[:track_length], bits[track_length: 2 * track_length]]]]
+		return track
+	message('Bit cursor: {}', 2, bit_cursor)
+	message('First good: {}', 2, first_good)
 	if bit_cursor[0] > first_good[2]:
 		# end of last good region was past the beginning of the rev 2 copy of the first one
 		# I believe there is no way they can not match, so go ahead and end on a good
@@ -457,9 +1288,8 @@ def build_track_map(track):
 		else:
 			message('Track covered, begins and ends on good data, chopping latter block down.', 2)
 			# message('Track map -1 was {}'.format(track_map[-1]), 2)
-			track_map[-1][2] = first_good[2] - 1 # end of track
-			# cut back the bits as well
-			track_map[-1][3] = track_map[-1][3][: track_map[-1][2] - track_map[-1][1]]
+			# (the bits go with the offsets, so this cuts them back as well)
+			track_map[-1][2] = first_good[2] # end of track, where the first good bits come around again
 			# now track_map starts and ends with a good region, and they should flow together
 			# message('Track map -1 winds up being {}'.format(track_map[-1]), 2)
 	else:
@@ -495,7 +1325,7 @@ def build_track_map(track):
 				gap_length = track_length - bit_cursor[0]
 				to_resolve = [
 					bits[bit_cursor[0]: track_length],
-					bits[bit_cursor[1], bit_cursor[1] + gap_length]
+					bits[bit_cursor[1]: bit_cursor[1] + gap_length]
 					]
 				track_map.append([0, bit_cursor[0], track_length, to_resolve])
 				message('Track gap guessed, begins and ends on gap.', 2)
@@ -508,55 +1338,33 @@ def build_track_map(track):
 def compress_gaps(track):
 	track_map = track['track_map']
 	map_size = len(track_map)
-	message('Track map size is {}, heading to forward scan:'.format(len(track_map)), 2)
+	message('Track map size is {}, heading to forward scan:', 2, len(track_map))
 	for segment in range(map_size - 1):
 		# moving forward, look for sequence of good-gap
 		if track_map[segment][0] == 1 and track_map[segment + 1][0] == 0:
-			message('Checking {} and following'.format(segment), 2)
+			message('Checking {} and following', 2, segment)
 			# good block followed by a gap, try to push the good block in
 			good_block = track_map[segment]
 			gap_block = track_map[segment + 1]
-			edge_bits = bytearray()
 			to_resolve = gap_block[3]
-			check_bits = True if len(to_resolve) == 3 else False
-			# message('Length of to_resolve is {}'.format(len(to_resolve)), 2)
-			# message('to_resolve is actually: {}'.format(to_resolve), 2)
-			# do the first bits in all variants match?
-			while True:
-				test_bit = to_resolve[0][0]
-				if to_resolve[1][0] == test_bit:
-					# first one does
-					# if check_bits:
-					# 	message('Length of to_resolve[2] is {}'.format(len(to_resolve[2])), 2)
-					if check_bits and to_resolve[2][0] != test_bit:
-						# second one does not, so we are done
-						break
-				else:
-					# first one does not, so we are done
-					break
-				# if we got to here, we can shrink the gap and keep going
-				edge_bits.append(test_bit)
-				# chop to_resolve down
-				del to_resolve[0][0]
-				del to_resolve[1][0]
-				if check_bits:
-					del to_resolve[2][0]
-				# we have to stop if we eliminated one of the gap options
-				if len(to_resolve[0]) == 0 or len(to_resolve[1]) == 0 or (check_bits and len(to_resolve[2])== 0):
-					# we have eliminated the gap in at least one of the bit strings, stop here.
-					# eliminating the bits in any of the gaps will eliminate the gap.
-					to_resolve = []
-					message('One of the gaps pushed up to nothing.', 2)
-					break
-			# add the bits we found to the end of the good block
-			good_block[2] += len(edge_bits)
-			good_block[3][0].extend(edge_bits)
-			message('good_block[:3]: {}'.format(good_block[:3]), 2)
+			# how far do the first bits in all variants match?
+			edge_length = common_prefix_length(to_resolve)
+			if edge_length == min(len(option) for option in to_resolve):
+				# we have eliminated the gap in at least one of the bit strings, stop here.
+				# eliminating the bits in any of the gaps will eliminate the gap.
+				to_resolve = []
+				message('One of the gaps pushed up to nothing.', 2)
+			else:
+				# chop to_resolve down (these are views, so this does not copy)
+				to_resolve = [option[edge_length:] for option in to_resolve]
+			# add the bits we found to the end of the good block (they follow on from it in the first read)
+			good_block[2] += edge_length
+			message('good_block[:3]: {}', 2, good_block[:3])
 			# Update the left edge of the gap
-			gap_block[1] += len(edge_bits)
+			gap_block[1] += edge_length
 			gap_block[3] = to_resolve
-			message('gap_block[:3]: {}'.format(gap_block[:3]), 2)
-			message('Pushed left edge of gap by {} to {} aka {}'.format(len(edge_bits), good_block[2], gap_block[1]))
+			message('gap_block[:3]: {}', 2, gap_block[:3])
+			message('Pushed left edge of gap by {} to {} aka {}', 0, edge_length, good_block[2], gap_block[1])
 	# We've now pushed the right edge of the good blocks as far forward as we
 	# can.  This could maybe have reduced the gap to nothing if there was just
 	# a single spurious bit somewhere.  Go through and clean up gaps that have
@@ -568,66 +1376,42 @@ def compress_gaps(track):
 			del track_map[segment - 1]
 	# now, move backwards to try to squeeze the gaps from the other end
 	map_size = len(track_map)
-	message('Track map size is {}, heading to reverse scan:'.format(len(track_map)), 2)
+	message('Track map size is {}, heading to reverse scan:', 2, len(track_map))
 	for segment in range(map_size - 1):
 		tnemges = map_size - 1 - segment
 		# moving backward, look for sequence of good-gap from the end
 		if track_map[tnemges][0] == 1 and track_map[tnemges - 1][0] == 0:
 			# good block preceded by a gap, try to push the good block in
-			message('Checking {} and preceding'.format(tnemges), 2)
+			message('Checking {} and preceding', 2, tnemges)
 			good_block = track_map[tnemges]
 			gap_block = track_map[tnemges - 1]
-			message('good_block[:3]: {}'.format(good_block[:3]), 2)
-			message('gap_block[:3]: {}'.format(gap_block[:3]), 2)
-			edge_bits = bytearray()
+			message('good_block[:3]: {}', 2, good_block[:3])
+			message('gap_block[:3]: {}', 2, gap_block[:3])
 			to_resolve = gap_block[3]
-			check_bits = True if len(to_resolve) == 3 else False
-			# do the last bits in all variants match?
-			while True:
-				# message('to_resolve: {}'.format(to_resolve), 2)
-				# message('edge_bits: {}'.format(edge_bits), 2)
-				test_bit = to_resolve[0][-1]
-				if to_resolve[1][-1] == test_bit:
-					# first one does
-					if check_bits and to_resolve[2][-1] != test_bit:
-						# second one does not, so we are done
-						break
-				else:
-					# first one does not, so we are done
-					break
-				# if we got to here, we can shrink the gap and keep going
-				edge_bits.append(test_bit)
+			# how far do the last bits in all variants match?
+			edge_length = common_suffix_length(to_resolve)
+			if edge_length == min(len(option) for option in to_resolve):
+				# we have eliminated the gap in at least one of the bit strings, stop here.
+				# eliminating the bits in any of the gaps will eliminate the gap.
+				to_resolve = []
+				message('One of the gaps pulled back to nothing.', 2)
+			else:
 				# chop to_resolve down
-				del to_resolve[0][-1]
-				del to_resolve[1][-1]
-				if check_bits:
-					del to_resolve[2][-1]
-				# we have to stop if we eliminated one of the gap options
-				if len(to_resolve[0]) == 0 or len(to_resolve[1]) == 0 or (check_bits and len(to_resolve[2])== 0):
-					# we have eliminated the gap in at least one of the bit strings, stop here.
-					# eliminating the bits in any of the gaps will eliminate the gap.
-					to_resolve = []
-					message('One of the gaps pulled back to nothing.', 2)
-					break
+				to_resolve = [option[: len(option) - edge_length] for option in to_resolve]
 			# add the bits we found to the beginning of the good block
-			good_block[1] -= len(edge_bits)
-			# reverse the edge bits
-			edge_bits.reverse()
-			edge_length = len(edge_bits)
-			edge_bits.extend(good_block[3][0])
-			good_block[3][0] = edge_bits
+			good_block[1] -= edge_length
 			# message('good_block[:3]: {}'.format(good_block[:3]), 2)
 			# Update the right edge of the gap
 			gap_block[2] -= edge_length
 			gap_block[3] = to_resolve
-			message('gap_block[:3]: {}'.format(gap_block[:3]), 2)
-			message('Pulled right edge of gap by {} to {} aka {}'.format(edge_length, good_block[1], gap_block[2]))
+			message('gap_block[:3]: {}', 2, gap_block[:3])
+			message('Pulled right edge of gap by {} to {} aka {}', 0, edge_length, good_block[1], gap_block[2])
 	# We've now pushed the left edge of the good blocks as far backward as we
 	# can.  This could maybe have reduced the gap to nothing though it is 
 	# fairly unlikely that it wasn't already reduced in the forward pass.
 	# Not impossible, though, I think. So, go through and clean up gaps that have
 	# no bits as one of their options.
-	message('Track map has {} entries'.format(len(track_map)), 2)
+	message('Track map has {} entries', 2, len(track_map))
 	for segment in range(len(track_map), 0, -1):
 		check_segment = track_map[segment - 1]
 		if check_segment[0] == 0 and check_segment[3] == []:
@@ -637,6 +1421,25 @@ def compress_gaps(track):
 	# It was updated in place, so just return track.
 	return track
 
+# The gap options are compared all at once as integers, a differing bit shows up as a 1 in the xor.
+def common_prefix_length(variants):
+	'''Count the bits at the start that all of the gap options agree on'''
+	length = min(len(variant) for variant in variants)
+	first = variants[0][: length].value()
+	differ = 0
+	for variant in variants[1:]:
+		differ |= first ^ variant[: length].value()
+	return length - differ.bit_length()
+
+def common_suffix_length(variants):
+	'''Count the bits at the end that all of the gap options agree on'''
+	length = min(len(variant) for variant in variants)
+	first = variants[0][len(variants[0]) - length:].value()
+	differ = 0
+	for variant in variants[1:]:
+		differ |= first ^ variant[len(variant) - length:].value()
+	return (differ & -differ).bit_length() - 1 if differ else length
+
 # This is an IOU.  Right now gaps are resolved by accepting the first option.
 def resolve_gaps(track):
 	message('resolve_gaps.', 2)
@@ -649,17 +1452,17 @@ def resolve_gaps(track):
 # Go through the track map after compression and resolution and build a bit stream
 def build_bit_stream(track):
 	message('build_bit_stream.', 2)
-	bit_stream = bytearray()
 	for segment in track['track_map']:
-		message('Segment[:3]: {}'.format(segment[:3]), 2)
-		bit_stream.extend(segment[3][0])
-	track['bit_stream'] = bit_stream
+		message('Segment[:3]: {}', 2, segment[:3])
+	bits = track['bits']
+	track['bit_stream'] = PackedBits.join([bits[segment[1]: segment[2]] if segment[0] == 1 else segment[3][0] \
+		for segment in track['track_map']])
 	return(track)
 
 # Short version that just takes the rough cut and keeps it.
 def find_patterns(track, second_track = None):
 	# First, get a course match, only valid up to the window size used in find_occurrences.
-	occurrences = find_occurrences(track, second_track)
+	occurrences = find_repeats(track, second_track)
 	# Flatten the patterns and collect track length votes
 	track_length_votes = {}
 	patterns_by_length = []
@@ -679,6 +1482,10 @@ def find_patterns(track, second_track = None):
 	if len(track_length_votes) > 0:
 		votes = sorted(track_length_votes.items(), key=itemgetter(1), reverse = True)
 		track_length, highest_vote_count = votes[0]
+	elif not second_track:
+		# no patterns at all, so go with the estimate
+		track_length, correlation = estimate_track_length(track)
+		highest_vote_count = 0
 	else:
 		track_length = 0
 		highest_vote_count = 0
@@ -687,11 +1494,20 @@ def find_patterns(track, second_track = None):
 	if track_length > track_maximum:
 		message('Most popular track length was too high, cutting in half.', 2)
 		track_length = int(track_length / 2)
-	message('find_patterns: track length, by popular vote: {}'.format(track_length), 2)
-	if track_length > 0:
-		message('Longest pattern: {}'.format(patterns_by_length[0]), 2)
+	message('find_patterns: track length, by popular vote: {}', 2, track_length)
+	if len(patterns_by_length) > 0:
+		message('Longest pattern: {}', 2, patterns_by_length[0])
 	return patterns_by_length, track_length
 
+# Find the patterns in the bits that repeat, using whichever repeat engine was picked (--repeats).
+# The suffix array engine only looks within a track, so between tracks it is always a search.
+def find_repeats(track, second_track = None):
+	'''Find the repeating patterns in the track or between the tracks'''
+	global options
+	if options['repeat_engine'] == 'suffix' and not second_track:
+		return suffix_repeats(track)
+	return find_occurrences(track, second_track)
+
 # Do a relatively quick/course scan for patterns in the bits that repeat
 # This is used for finding the track length (searching for patterns within one track)
 # and for finding sync between adjacent quarter tracks (searching for patterns that appear in both)
@@ -720,6 +1536,11 @@ def find_occurrences(track, second_track = None):
 	# stop checking source bits when we will hit the end (or won't have a minimal track left)
 	source_bit_stop = len(source_bits) - end_margin
 	target_bit_stop = len(bits)
+	target_track = second_track if second_track else track
+	# with the coarse engine, find roughly how far apart the copies are first, and only look around there
+	offsets = repeat_offsets(track, second_track, minimum_pattern_length) if options['repeat_engine'] == 'coarse' else []
+	if offsets:
+		message('Looking for repeats {} bits apart.', 2, offsets)
 	patterns = {}
 	start_bit = 0
 	total_total_patterns = 0
@@ -732,17 +1553,37 @@ def find_occurrences(track, second_track = None):
 		# or from the beginning of the target bits (for matches between tracks).
 		# message('Occurrences: start bit {}'.format(start_bit), 2)
 		target_bit_start = 0 if second_track else (start_bit + track_minimum)
-		while True:
-			try:
-				next_occurrence = bits.index(bits_to_find, target_bit_start, target_bit_stop)
+		if offsets:
+			# the neighborhoods of where the copies were found to be, in order
+			search_ranges = [(start_bit + low, start_bit + high + window_size) for low, high in offsets]
+		else:
+			search_ranges = [(target_bit_start, target_bit_stop)]
+		if options['numpy'] and not offsets:
+			# rather than searching through the target bits, look up where windows with the same hash start
+			candidates = window_starts(target_track, window_size, window_hash(track, window_size, start_bit))
+		else:
+			candidates = None
+		for range_start, range_stop in search_ranges:
+			target_bit_start = max(target_bit_start, range_start)
+			range_stop = min(range_stop, target_bit_stop)
+			if range_stop - target_bit_start < window_size:
+				continue
+			while True:
+				if candidates is None:
+					try:
+						next_occurrence = bits.index(bits_to_find, target_bit_start, range_stop)
+					except ValueError:
+						# no more found, stop looking
+						break
+				else:
+					next_occurrence = next_window(bits, bits_to_find, candidates, target_bit_start, range_stop)
+					if next_occurrence < 0:
+						break
 				# found one, remember where it starts
 				occurrences.append(next_occurrence)
 				# move offset one past the first one we found and look for the next one
 				target_bit_start = next_occurrence + window_size
 				# message('Moved offset to {} and continuing'.format(offset), 2)
-			except ValueError:
-				# no more found, stop looking
-				break
 		# occurrences is now a list of absolute indices into target bit stream indicating where
 		# the bits_to_find window (from start_bit) occurs.
 		# Go through the match ranges we have established already and see if any are extended by
@@ -819,6 +1660,296 @@ def find_occurrences(track, second_track = None):
 			del patterns[source_end]
 	return patterns
 
+# Coarse to fine (--repeats coarse).  Rather than looking for each window of source bits everywhere
+# in the target bits, find_occurrences first works out roughly how far apart the copies are, from the
+# nibbles.  The data register falls into step after a nibble or two, so copies of the same bits latch
+# the same nibbles wherever they start, and there are an eighth as many nibbles as bits.  Each run of nibble_gram
+# nibbles in the source that is in the target (but not all over it, as runs of sync nibbles are)
+# votes for the distance between them, in buckets of offset_bucket bits.  Distances with enough votes
+# to have come from a match of the minimum pattern length are returned as ranges of distances, with a
+# bucket to spare on each side for bits that slipped.  The windows are then searched for bit by bit
+# only in those ranges.  If there are no such distances, an empty list says to search everywhere.
+# This compares far fewer bits, but decoding the nibbles takes about as long as searching everywhere
+# already does (with the window index, or bytes.find a byte at a time), so it is not the default.
+nibble_gram = 12
+offset_bucket = 64
+
+@track_feature
+def nibble_stream(track):
+	'''The nibbles the data register latches from the track's EDD bits'''
+	return decode_nibbles(unpacked_bits(track))
+
+def repeat_offsets(track, second_track, minimum_pattern_length):
+	'''Find roughly how far apart copies in the track (or between the tracks) are, as ranges of distances'''
+	global nibble_gram, offset_bucket, track_minimum
+	source = nibble_stream(track)
+	target = nibble_stream(second_track) if second_track else source
+	target_nibbles = bytes(target['nibbles'])
+	source_nibbles = bytes(source['nibbles']) if second_track else target_nibbles
+	places = {}
+	for index in range(len(target_nibbles) - nibble_gram + 1):
+		places.setdefault(target_nibbles[index: index + nibble_gram], []).append(target['starts'][index])
+	# within a track, copies are at least a minimal track apart
+	nearest = None if second_track else track_minimum - offset_bucket
+	votes = {}
+	for index in range(len(source_nibbles) - nibble_gram + 1):
+		found = places.get(source_nibbles[index: index + nibble_gram], ())
+		if len(found) > 4:
+			continue
+		start = source['starts'][index]
+		for place in found:
+			if nearest is None or place - start >= nearest:
+				bucket = (place - start) // offset_bucket
+				votes[bucket] = votes.get(bucket, 0) + 1
+	# a match of the minimum pattern length has a run starting at nearly every nibble in it
+	required_votes = (minimum_pattern_length // 8 - nibble_gram) // 2
+	offsets = []
+	for bucket in sorted(votes):
+		if votes[bucket] + votes.get(bucket - 1, 0) + votes.get(bucket + 1, 0) >= required_votes:
+			low, high = (bucket - 1) * offset_bucket, (bucket + 2) * offset_bucket
+			if offsets and low <= offsets[-1][1]:
+				offsets[-1][1] = high
+			else:
+				offsets.append([low, high])
+	return offsets
+
+# Index every window of the track's bits by a hash, so that find_occurrences can look windows up
+# rather than scanning the track for each one (Rabin-Karp).  The hash of a window mixes the 64-bit
+# chunks it is made of, and NumPy computes them for every starting place at once.  The index is a
+# sorted array of the hashes, each with its window's start tucked in below it (in place of its low
+# bits), so the windows with a given hash are found with a binary search, already in order of where
+# they start.  How many low bits that takes depends on the track's length, so the hashes themselves
+# are kept whole and only cut down when they are looked up, as they may come from a track of another
+# length.  A hash only says where to look, the bits are compared to confirm a match.  The index is
+# built once per track, and kept in the track along with the bits it was built from, in case the bits
+# get replaced.  Without NumPy, building the index a bit at a time costs more than it saves over bits.index.
+window_hash_multipliers = [0x9e3779b97f4a7c15, 0xc2b2ae3d27d4eb4f, 0x165667b19e3779f9, 0xd6e8feb86659fd93, \
+	0xff51afd7ed558ccd, 0xc4ceb9fe1a85ec53, 0x27d4eb2f165667c5, 0x94d049bb133111eb]
+
+def window_index(track, window_size):
+	'''Build (or reuse) the hashed index of all of the window_size-bit windows in the track'''
+	global window_hash_multipliers
+	bits = track['bits']
+	if 'window_index' in track and track['window_index'][0] is bits and track['window_index'][1] == window_size:
+		return track['window_index'][2]
+	window_count = max(len(bits) - window_size + 1, 0)
+	starting = bit_windows(bits, window_size)
+	# mix the chunks that make up each window, the last one only has the bits still in the window
+	hashes = numpy.zeros(window_count, dtype=numpy.uint64)
+	for k, offset in enumerate(range(0, window_size, 64)):
+		chunk = starting[offset: offset + window_count]
+		if window_size - offset < 64:
+			chunk = chunk >> numpy.uint64(64 - (window_size - offset))
+		hashes = (hashes ^ chunk) * numpy.uint64(window_hash_multipliers[k % 8])
+		hashes ^= hashes >> numpy.uint64(29)
+	# make room to tuck the start in below the hash, so sorting puts equal hashes in order of start
+	start_bits = max(window_count.bit_length(), 1)
+	keys = numpy.sort(((hashes >> numpy.uint64(start_bits)) << numpy.uint64(start_bits)) | \
+		numpy.arange(window_count, dtype=numpy.uint64))
+	track['window_index'] = (bits, window_size, (hashes, keys, start_bits))
+	return track['window_index'][2]
+
+# The 64 bits starting at every bit position (and for extra positions past the end), as a NumPy
+# array of 64-bit integers, with zeros for the bits beyond the end.
+def bit_windows(bits, extra=0):
+	'''Get the 64 bits starting at every bit position as integers'''
+	data = numpy.frombuffer(bits.packed() + bytes(((extra + 7) >> 3) + 17), dtype=numpy.uint8)
+	chunks = numpy.zeros(((len(bits) + extra + 7) >> 3) + 1, dtype=numpy.uint64)
+	for k in range(8):
+		chunks |= data[k: k + len(chunks)].astype(numpy.uint64) << numpy.uint64(56 - 8 * k)
+	following = data[8: 8 + len(chunks)].astype(numpy.uint64)
+	positions = numpy.arange(len(bits) + extra, dtype=numpy.int64)
+	shifts = (positions & 7).astype(numpy.uint64)
+	return (chunks[positions >> 3] << shifts) | ((following[positions >> 3] << shifts) >> numpy.uint64(8))
+
+def window_hash(track, window_size, position):
+	'''The hash of the window starting at position, as used in the track's window index'''
+	return int(window_index(track, window_size)[0][position])
+
+def window_starts(track, window_size, hash_value):
+	'''Where windows with this hash start in the track, in ascending order'''
+	hashes, keys, start_bits = window_index(track, window_size)
+	prefix = hash_value >> start_bits
+	low = numpy.searchsorted(keys, numpy.uint64(prefix << start_bits))
+	following = (prefix + 1) << start_bits
+	high = numpy.searchsorted(keys, numpy.uint64(following)) if following < (1 << 64) else len(keys)
+	return (keys[low: high] & numpy.uint64((1 << start_bits) - 1)).tolist()
+
+def next_window(bits, bits_to_find, candidates, start, end):
+	'''Find the first of the candidate starts in start-end where bits_to_find really is, or -1'''
+	for candidate_index in range(bisect.bisect_left(candidates, start), len(candidates)):
+		candidate = candidates[candidate_index]
+		if candidate + len(bits_to_find) > end:
+			break
+		# make sure it is really a match and not just a hash collision
+		if bits[candidate: candidate + len(bits_to_find)] == bits_to_find:
+			return candidate
+	return -1
+
+# Suffix array repeat engine (--repeats suffix).  Rather than searching forward through the track
+# for each stretch of bits, sort all of the suffixes of the track's bits once.  Copies of any run of
+# bits are then next to each other in the suffix array, in a block where the longest common prefix
+# (LCP) of neighbors is at least as long as the run, so finding them does not depend on where or how
+# far apart they are.  The suffixes are sorted by prefix doubling with NumPy, starting from their
+# first 64 bits, and the ranks from each round are kept so the LCPs can be built up from them.
+def suffix_array(bits):
+	'''Build the suffix array, the rank of each suffix, and the LCP of each neighboring pair'''
+	length = len(bits)
+	if length == 0:
+		return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+	windows = bit_windows(bits)
+	# a suffix that runs out of bits comes before the longer ones it is the start of
+	available = numpy.minimum(length - numpy.arange(length, dtype=numpy.int64), 64)
+	order = numpy.lexsort((available, windows))
+	rank = suffix_ranks(order, windows, available)
+	ranks = [rank]
+	span = 64
+	while rank[order[-1]] < length - 1 and span < length:
+		# sort on the rank of the first half and then the second half (0 if there isn't one)
+		keys = rank * (length + 1)
+		keys[:length - span] += rank[span:] + 1
+		order = numpy.argsort(keys)
+		rank = suffix_ranks(order, keys)
+		ranks.append(rank)
+		span *= 2
+	# LCP of each suffix and the next one in order, built up from the largest span down
+	first = order[:-1]
+	second = order[1:]
+	lcp = numpy.zeros(length - 1, dtype=numpy.int64)
+	for level in reversed(range(len(ranks))):
+		ahead = (second + lcp < length) & (first + lcp < length)
+		same = numpy.zeros(length - 1, dtype=bool)
+		same[ahead] = ranks[level][first[ahead] + lcp[ahead]] == ranks[level][second[ahead] + lcp[ahead]]
+		lcp += same * (64 << level)
+	# and then the last few bits, from the 64 bits where they stopped matching
+	ahead = (second + lcp < length) & (first + lcp < length)
+	rest = numpy.zeros(length - 1, dtype=numpy.int64)
+	rest[ahead] = numpy.minimum(leading_zeros(windows[first[ahead] + lcp[ahead]] ^ windows[second[ahead] + lcp[ahead]]), \
+		length - numpy.maximum(first[ahead], second[ahead]) - lcp[ahead])
+	lcp += rest
+	return order, rank, lcp
+
+@track_feature
+def track_suffix_array(track):
+	'''The suffix array of the track's EDD bits'''
+	return suffix_array(track['bits'])
+
+def suffix_ranks(order, keys, tiebreaks=None):
+	'''Rank the suffixes in sorted order, suffixes with the same keys get the same rank'''
+	sorted_keys = keys[order]
+	new_rank = numpy.zeros(len(order), dtype=numpy.int64)
+	new_rank[1:] = sorted_keys[1:] != sorted_keys[:-1]
+	if tiebreaks is not None:
+		sorted_tiebreaks = tiebreaks[order]
+		new_rank[1:] |= sorted_tiebreaks[1:] != sorted_tiebreaks[:-1]
+	rank = numpy.empty(len(order), dtype=numpy.int64)
+	rank[order] = numpy.cumsum(new_rank)
+	return rank
+
+def leading_zeros(values):
+	'''Count the leading zero bits in each of an array of 64-bit integers'''
+	count = numpy.zeros(len(values), dtype=numpy.int64)
+	for shift in (32, 16, 8, 4, 2, 1):
+		small = values < numpy.uint64(1 << (64 - shift))
+		count += small * shift
+		values = numpy.where(small, values << numpy.uint64(shift), values)
+	return count + (values == 0)
+
+# Get a function that finds the first copy of the run of bits from start to end that begins at or
+# after a given point.  It does what bits.index(bits[start:end], after) does, but with the suffix
+# array engine it looks in the block of suffixes that start with the run rather than searching.
+def repeat_finder(track):
+	'''Get a function to find copies of runs of the track's bits, using the repeat engine picked'''
+	global options
+	bits = track['bits']
+	if options['repeat_engine'] != 'suffix':
+		return lambda start, end, after: bits.index(bits[start: end], after)
+	order, rank, lcp = track_suffix_array(track)
+	def find_copy(start, end, after):
+		run_length = end - start
+		low = high = rank[start]
+		while low > 0 and lcp[low - 1] >= run_length:
+			low -= 1
+		while high < len(lcp) and lcp[high] >= run_length:
+			high += 1
+		copies = order[low: high + 1]
+		copies = copies[copies >= after]
+		if len(copies) == 0:
+			raise ValueError('bits not found')
+		return int(copies.min())
+	return find_copy
+
+# Find the maximal repeats within the track, at least a minimal track apart, using the
+# suffix array.  Long repeats are in blocks of neighboring suffixes with long LCPs, so only pairs
+# within those blocks are checked.  A pair is a maximal repeat if the bits before the two copies
+# differ (so the repeat can't be extended backwards), and the LCP says how far forward it goes.
+# Result is in the same form as find_occurrences, patterns organized by where the source bits end.
+# The track length is voted on by how many bits matched at each distance, so each repeat is trimmed
+# to the whole windows find_occurrences would have matched of it (windows start at multiples of the
+# window size, and stop a minimal track short of the end).  Otherwise the few bits either side of a
+# slip tip the vote between distances a bit or two apart differently than the search does.  The votes
+# can still differ where the search skips a copy: it looks for the next copy past the end of the one it
+# found, so in sync it can find one a few bits early and miss the real one.
+def suffix_repeats(track):
+	'''Find the repeats within a track using the suffix array'''
+	global track_minimum
+	minimum_pattern_length = 1000 # as in find_occurrences
+	window_size = 501 # as in find_occurrences
+	block_limit = 16 # how many neighbors to check, in case of a long run of the same thing (like sync)
+	bits = track['bits']
+	# the last window find_occurrences looks for starts before this
+	source_bit_stop = len(bits) - window_size - track_minimum
+	order, rank, lcp = track_suffix_array(track)
+	# the bit before each suffix, so we can tell if a repeat is maximal
+	before = numpy.frombuffer(b'\x02' + unpacked_bits(track)[: len(bits) - 1], dtype=numpy.uint8)
+	patterns = {}
+	# pair each suffix with each of the next few, the match is the smallest LCP in between
+	match_sizes = lcp.copy()
+	for gap in range(1, min(block_limit, len(order) - 1) + 1):
+		if gap > 1:
+			match_sizes = numpy.minimum(match_sizes[:-1], lcp[gap - 1:])
+		source_starts = numpy.minimum(order[:-gap], order[gap:])
+		target_starts = numpy.maximum(order[:-gap], order[gap:])
+		distances = target_starts - source_starts
+		# not maximal if the bits before are the same, it is part of a repeat that starts earlier
+		found = (match_sizes >= minimum_pattern_length) & (distances >= track_minimum) & \
+			(before[source_starts] != before[target_starts])
+		for match_size, source_start, target_start in zip(match_sizes[found].tolist(), \
+				source_starts[found].tolist(), target_starts[found].tolist()):
+			distance = target_start - source_start
+			first_window = -(-source_start // window_size) * window_size
+			windows = min((source_start + match_size - first_window) // window_size, \
+				-(-(source_bit_stop - first_window) // window_size))
+			if windows * window_size < minimum_pattern_length:
+				continue
+			source_end = first_window + windows * window_size
+			patterns.setdefault(source_end, []).append([windows * window_size, distance, first_window, source_end, \
+				first_window + distance, source_end + distance])
+		if not numpy.any(match_sizes >= minimum_pattern_length):
+			break
+	# in the order find_occurrences makes them, so distances that get the same vote come out the same way
+	return {source_end: sorted(patterns[source_end], key=itemgetter(1)) for source_end in sorted(patterns)}
+
+# Older code wants the zero streams on their own, as (start, end) rows (see find_zeros)
+def find_zero_streams(track):
+	'''Collect the zero streams out of the zero spans'''
+	track = find_zeros(track)
+	track['zero_streams'] = Intervals(2, ((start, end) for kind, start, end in track['zero_spans'] if kind == 0))
+	track['zero_stream_starts'] = track['zero_streams'].columns[0]
+	return track
+
+# The zero streams are in order and do not overlap, so they can be found by bisection.
+def within_zero_stream(track, position):
+	'''Check whether a bit position is inside one of the zero streams'''
+	stream = bisect.bisect_right(track['zero_stream_starts'], position) - 1
+	return stream >= 0 and position < track['zero_streams'].columns[1][stream]
+
+def zero_streams_starting(track, start, end):
+	'''Get the zero streams that start after start and before end'''
+	first = bisect.bisect_right(track['zero_stream_starts'], start)
+	last = bisect.bisect_left(track['zero_stream_starts'], end)
+	return track['zero_streams'][first: last]
+
 # Takes the tracks array, computes sync matches between adjacent tracks.  Result of sync analysis
 # is stored within the track dictionary of the higher of the tracks (modifies passed argument),
 # and returns the track groups.
@@ -846,7 +1977,7 @@ def sync_tracks(tracks):
 	track_group = [0]
 	# go through the rest of the tracks and check sync with prior track
 	for track_index in range(1, len(tracks)):
-		track_start_clock = time.clock()
+		started = clock()
 		track = tracks[track_index]
 		track_prior = tracks[track_index - 1]
 		track['sync_lengths'], track['sync_advance'] = find_patterns(track_prior, track)
@@ -876,21 +2007,21 @@ def sync_tracks(tracks):
 			track_group.append(track_index)
 			# remember in the track which group this track is in
 			track['track_group'] = len(track_groups)
-		track['sync_time'] = time.clock() - track_start_clock
+		track['sync_time'] = record_time(track.setdefault('timings', {}), 'sync_tracks', started)
 
 		# status output
 
 		status_sync = '{:6d}'.format(track['sync_best']) if 'sync_best' in track else '   n/a'
 		status_advance = '{:6d}'.format(track['sync_advance']) if 'sync_advance' in track else '   n/a'
-		message('Tracks {:5.2f} - {:5.2f} [group: {:2d}] sync match: {} advance: {}, time: {:5.2f}s'.format(\
+		message('Tracks {:5.2f} - {:5.2f} [group: {:2d}] sync match: {} advance: {}, time: {:5.2f}s', 1, \
 			track_prior['track_number'], track['track_number'], track['track_group'], status_sync, status_advance, \
-			track['sync_time']), 1)
+			track['sync_time'])
 	# if the final track failed to group with the previous one, we will still have a track group hanging
 	if track_group != []:
 		track_groups.append({'track_group': track_group, 'advance_average': group_sync_average[2]})
 	# compute the disk-wide average valid sync advance for use when we have no other guidance
 	status['sync_average'] = int(track_sync_average[0] / track_sync_average[1])
-	message('track_groups: Overall track advance average: {}'.format(status['sync_average']), 2)
+	message('track_groups: Overall track advance average: {}', 2, status['sync_average'])
 	return track_groups
 
 # This is called after we have already done the sync check and grouping between tracks
@@ -926,7 +2057,7 @@ def group_tracks(tracks, track_groups):
 			# the sync is long enough to replicate this track across the group
 			# do the match computations first, before replicating
 			source_track = tracks[match_track]
-			message('Track {} can be used for entire group, searching within for patterns.'.format(source_track['track_number']), 2)
+			message('Track {} can be used for entire group, searching within for patterns.', 2, source_track['track_number'])
 			source_track['pattern_lengths'], source_track['track_length'] = find_patterns(source_track)
 			for track_index in group:
 				# just copy the match track over the other ones (including match results, etc.)
@@ -989,8 +2120,8 @@ def sync_groups(tracks, track_groups):
 			current_offset += (track_length if current_offset < 0 else 0)
 			# and now chop the bits
 			# I am only chopping off the beginning because we might still be trying to write out an oversample
-			message('Track {} advance is {} (already advanced: {})'.format(track['track_number'], advance, already_advanced), 2)
-			message('Chopping track {} from {}'.format(track['track_number'], current_offset), 2)
+			message('Track {} advance is {} (already advanced: {})', 2, track['track_number'], advance, already_advanced)
+			message('Chopping track {} from {}', 2, track['track_number'], current_offset)
 			track['bits'] = track['bits'][current_offset:]
 			# this will invalidate pattern matches, but this is basically the last thing we do, so who cares.
 			# track['pattern_lengths'], track['track_length'] = adjust_patterns(track['pattern_lengths'], current_offset)
@@ -1019,28 +2150,7 @@ def analyze_track(tracks, track_groups):
 
 		# we should have several reads of the same bits from adjacent tracks, within this track group
 		for track_index in group:
-			track_start_clock = time.clock()
-			track = tracks[track_index]
-			# Analyze the bits
-			if options['analyze_bits'] and track['match_best'] > 0:
-				# note: resolve_bits will modify the bits once it is confident it has the track
-				track = resolve_bits(track)
-			else:
-				# if we are not analyzing the bits, or if the track had no matches, set default start and end
-				track['track_start'] = 0
-				track['track_repeat'] = track['track_length']
-			if options['analyze_nibbles']:
-				# note: nibblize can adjust track_start and track_end to align with nibbles
-				track = nibblize(track)
-				# Analyze track for standard 13/16 formats
-				# This can be turned off as an option if we know that the disk has no relevant sectors
-				if options['analyze_sectors']:
-					track = consolidate_sectors(locate_sectors(track))
-			# record the bits now for the purpose of writing out track-sized things.
-			track['track_bits'] = track['bits'][track['track_start']: track['track_repeat']]
-			# TODO: Test for use_second, write_full, from_zero, spiral here
-			track['processing_time'] = time.clock() - track_start_clock
-			track_status(track)
+			tracks[track_index] = analyze_one_track(tracks[track_index])
 		# if the track group was consolidated, copy over the results to the other tracks in the group
 		if 'consolidated' in track_group:
 			for track_index in track_group['track_group']:
@@ -1050,6 +2160,135 @@ def analyze_track(tracks, track_groups):
 					tracks[track_index]['track_number'] = track_number
 	return tracks
 
+def analyze_one_track(track):
+	'''do bit analysis and nibble analysis on a single track'''
+	global options
+	if track.get('from_cache', False):
+		# already analyzed on an earlier run (see split_track)
+		track['processing_time'] = 0.0
+		track_status(track)
+		return track
+	if track.get('standard_track', False):
+		# read straight from the EDD bits (see split_track), nothing more to do
+		track_status(track)
+		return track
+	track_start_clock = time.perf_counter()
+	# Analyze the bits
+	if options['analyze_bits'] and track['match_best'] > 0:
+		# note: resolve_bits will modify the bits once it is confident it has the track
+		track = timed(track, resolve_bits)
+	else:
+		# if we are not analyzing the bits, or if the track had no matches, set default start and end
+		track['track_start'] = 0
+		track['track_repeat'] = track['track_length']
+	if options['analyze_nibbles']:
+		# note: nibblize can adjust track_start and track_end to align with nibbles
+		track = timed(track, nibblize)
+		# Analyze track for standard 13/16 formats
+		# This can be turned off as an option if we know that the disk has no relevant sectors
+		if options['analyze_sectors']:
+			track = timed(track, locate_sectors)
+			track = timed(track, consolidate_sectors)
+	# record the bits now for the purpose of writing out track-sized things.
+	track['track_bits'] = track['bits'][track['track_start']: track['track_repeat']]
+	# TODO: Test for use_second, write_full, from_zero, spiral here
+	track['processing_time'] = time.perf_counter() - track_start_clock
+	if options['cache_dir']:
+		save_cached_track(track)
+	track_status(track)
+	return track
+
+# Analysis results can be kept in a cache directory (--cache) so that running over the same
+# capture again (to write another format, after changing an unrelated option, or after a crash)
+# does not have to redo the analysis.  Entries are keyed by a hash of the track's bits and the
+# options that affect the analysis, so the same track read will be found wherever it appears.
+# Each entry is a pickled, compressed copy of the analysis results (the bit stream, a summary of
+# the track map, the nibbles, and the sectors).  The raw bits and the intermediate nibble arrays
+# are left out, and any bits that are kept are copied out of the EDD buffer they were viewing.
+# Entries are touched when used, and the least recently used ones are removed at the end of a
+# run to keep the cache under options['cache_size'] bytes.
+cache_version = 6 # bump this when a change to the analysis would change the results
+cache_options = ('analyze_bits', 'analyze_nibbles', 'analyze_sectors', 'repair_tracks', 'repeat_engine')
+cache_skip = ('track_number', 'index_offset', 'bits', 'track_map', 'all_nibbles', 'all_offsets', \
+	'processing_time', 'cache_key', 'track_group', 'window_index', 'timings', 'features')
+
+def track_cache_key(track):
+	'''Compute the cache key for a track, from its bits and the options that matter'''
+	global options
+	key = hashlib.sha256(track['bits'].packed())
+	key.update(repr((cache_version, len(track['bits']), [options[option] for option in cache_options])).encode())
+	return key.hexdigest()
+
+def cache_path(cache_key):
+	'''Where the cache entry for a key lives'''
+	return os.path.join(options['cache_dir'], cache_key + '.track')
+
+def load_cached_track(track):
+	'''Fill in the track from the cache if it has been analyzed before, returns True if it was'''
+	global options
+	track['cache_key'] = track_cache_key(track)
+	try:
+		with open(cache_path(track['cache_key']), mode="rb") as cachefile:
+			cached = pickle.loads(zlib.decompress(cachefile.read()))
+		os.utime(cache_path(track['cache_key']))
+	except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+		# not there, or something went wrong, either way it is a miss
+		return False
+	track.update(cached)
+	track['from_cache'] = True
+	message('Track: {} found in cache', 2, track['track_number'])
+	return True
+
+def save_cached_track(track):
+	'''Store the analysis results for a track in the cache'''
+	global options
+	cached = {}
+	for key, value in track.items():
+		if key in cache_skip:
+			continue
+		if isinstance(value, PackedBits):
+			# copy just the bits this covers, rather than the whole EDD buffer it is a view onto
+			value = PackedBits.view(value.packed(), 0, len(value))
+		cached[key] = value
+	cached['track_map_summary'] = [segment[0:3] for segment in track.get('track_map', [])]
+	if not 'cache_key' in track:
+		track['cache_key'] = track_cache_key(track)
+	try:
+		os.makedirs(options['cache_dir'], exist_ok=True)
+		# write to a temporary file and move it into place, in case another process is at the same entry
+		handle, temporary = tempfile.mkstemp(dir=options['cache_dir'], suffix='.tmp')
+		with os.fdopen(handle, mode="wb") as cachefile:
+			cachefile.write(zlib.compress(pickle.dumps(cached, pickle.HIGHEST_PROTOCOL)))
+		os.replace(temporary, cache_path(track['cache_key']))
+	except OSError as err:
+		message('Could not save track {} in the cache: {}', 1, track['track_number'], err)
+
+def trim_cache():
+	'''Remove the least recently used cache entries until the cache fits in its size limit'''
+	global options
+	try:
+		entries = [entry for entry in os.scandir(options['cache_dir']) if entry.name.endswith('.track')]
+	except OSError:
+		return
+	sizes = []
+	for entry in entries:
+		try:
+			sizes.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+		except OSError:
+			# another conversion sharing the cache got to it first
+			pass
+	entries = sizes
+	cache_size = sum(entry[1] for entry in entries)
+	for mtime, size, path in sorted(entries):
+		if cache_size <= options['cache_size']:
+			break
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+		cache_size -= size
+	message('Track cache is {} bytes in {}', 2, cache_size, options['cache_dir'])
+
 # TODO: Someday make this look nicer and display more relevant information.
 def track_status(track):
 	'''Display information about track analysis'''
@@ -1073,36 +2312,126 @@ def track_status(track):
 # A message sent at level 0 (default) is always displayed
 # level 1 is displayed in verbose mode, level 2 is displayed in werbose mode
 # Any messages go both to the screen and the log file if the log file is requested
-def message(message, level=0, end='\n'):
+# Most of the chatter is at level 2, and much of it comes from inside the per-segment and per-bit loops,
+# so a message can be handed its arguments separately, message('Segment: {}', 2, segment), and they are
+# only formatted into it if it is actually going to be shown.  Where even gathering what to say is work
+# (the gap resolution columns, bit displays), check showing(level) first and skip it entirely.
+log_buffer = 1 << 16 # how much of the log file to hold before writing it out
+
+def showing(level):
+	'''Check whether messages at this level are being shown'''
+	return level == 0 or (level == 1 and options['verbose']) or (level == 2 and options['werbose'])
+
+def message(message, level=0, *args, end='\n'):
 	'''Output messages to the screen and to the log file if requested'''
 	global options
-	if level == 0 or (level == 1 and options['verbose']) or (level == 2 and options['werbose']):
+	if showing(level):
+		if args:
+			message = message.format(*args)
 		for output in options['console']:
 			print(message, file=output, end=end)
 
-def grab_nibble(bits):
-	'''Take the first nibble off the bit stream that was passed in'''
-	offset = 0
-	leading_zeros = 0
-	data_register = 0
-	wait_for_one = True
-	stop_offset = len(bits)-1
-	while offset < stop_offset:
-		bit = bits[offset]
-		if bit == 1:
-			data_register = (data_register << 1) + 1
-			wait_for_one = False
+# Each stage of the analysis of a track records how long it took (wall time from a monotonic clock,
+# and CPU time) in track['timings'], keyed by stage, as [wall, cpu] in seconds.  Things done for the
+# whole disk (loading, starting and finishing the output files) go in status['timings'] the same way.
+# With --profile, all of this is written out as a JSON report at the end (see write_profile).
+def clock():
+	'''The wall and CPU time right now'''
+	return time.perf_counter(), time.process_time()
+
+def record_time(timings, stage, started):
+	'''Add the time since started (from clock) to a stage in timings, return the wall time'''
+	wall, cpu = clock()
+	timing = timings.setdefault(stage, [0.0, 0.0])
+	timing[0] += wall - started[0]
+	timing[1] += cpu - started[1]
+	return wall - started[0]
+
+def timed(track, stage):
+	'''Run an analysis stage (a function of the track) and record how long it took'''
+	started = clock()
+	track = stage(track)
+	record_time(track.setdefault('timings', {}), stage.__name__, started)
+	return track
+
+def profile_track(track):
+	'''Hold on to the timings for a track that is done, for the profile report'''
+	global options, status
+	if options['profile_file']:
+		status['profile_tracks'].append({'track': track['track_number'], \
+			'cached': track.get('from_cache', False), 'standard': track.get('standard_track', False), \
+			'stages': {stage: {'wall': wall, 'cpu': cpu} for stage, (wall, cpu) in track.get('timings', {}).items()}})
+
+def write_profile():
+	'''Write out the timings as a JSON report'''
+	global options, status
+	totals = {}
+	for profile in status['profile_tracks']:
+		for stage, timing in profile['stages'].items():
+			total = totals.setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'tracks': 0})
+			total['wall'] += timing['wall']
+			total['cpu'] += timing['cpu']
+			total['tracks'] += 1
+	report = {
+		'eddfile': options['output_basename'],
+		'python': sys.version.split()[0],
+		'numpy': numpy.__version__ if options['numpy'] else None,
+		'jobs': options['jobs'],
+		'stream': options['stream_tracks'],
+		# CPU time is for the process that did the work, so with --jobs the per-track stages are worker time
+		'disk': {stage: {'wall': wall, 'cpu': cpu} for stage, (wall, cpu) in status['timings'].items()},
+		'stages': totals,
+		'tracks': status['profile_tracks']
+		}
+	with open(options['profile_file'], mode='w') as profile_file:
+		json.dump(report, profile_file, indent=1)
+	message('Wrote timing report to {}', 1, options['profile_file'])
+
+# The Disk II data register ignores 0s until a 1 arrives, then shifts in bits until its high bit is set,
+# so a nibble is any run of 0s (timing bits) followed by a 1 and seven more bits.  Matching that one after
+# the other, from where the last one ended, is the same as running the shift register over the whole track.
+nibble_pattern = re.compile(b'(\x00*)(\x01.{7})', re.DOTALL)
+nibble_values = {bytes((value >> (7 - bit)) & 1 for bit in range(8)): value for value in range(128, 256)}
+
+def decode_nibbles(bits, start=0, resume=None):
+	'''Run the data register over the bits from start and return arrays of the nibbles it latches'''
+	global nibble_pattern, nibble_values
+	if resume:
+		# resume is the decoding of the same bits from an earlier start.  Once a nibble starts where one
+		# of those did, the rest is the same, so only decode (a chunk at a time) until they fall into step.
+		chunk = 256
+		while start + chunk < len(bits):
+			head = decode_nibbles(bits[: start + chunk], start)
+			# the last nibble in the chunk may have been cut short, so don't trust it
+			for index in range(len(head['starts']) - 1):
+				step = bisect.bisect_left(resume['starts'], head['starts'][index])
+				if step < len(resume['starts']) and resume['starts'][step] == head['starts'][index]:
+					return {key: head[key][: index] + resume[key][step:] for key in head}
+			chunk *= 2
+	unpacked = bytes(bits[start:].unpacked() if isinstance(bits, PackedBits) else bits[start:])
+	# the last bit never gets shifted in, a nibble has to be complete before it
+	last = len(unpacked) - 1
+	# once there is no complete nibble at the next position there are none later either, so these all follow on
+	found = nibble_pattern.findall(unpacked, 0, max(last, 0))
+	nibbles = bytearray([nibble_values[nibble] for zeros, nibble in found])
+	leading_zeros = array.array('l', [len(zeros) for zeros, nibble in found])
+	bounds = array.array('l', accumulate([count + 8 for count in leading_zeros], initial=start))
+	starts = bounds[:-1]
+	ends = array.array('l', [bound - 1 for bound in bounds[1:]])
+	position = bounds[-1] - start
+	if position < len(unpacked):
+		# if we run out of data, keep what the register had, though it is probably useless to do so.
+		tail = unpacked[position: last]
+		first_one = tail.find(1)
+		if first_one < 0:
+			nibbles.append(0)
+			leading_zeros.append(len(tail))
 		else:
-			if wait_for_one:
-				leading_zeros += 1
-			else:
-				data_register = data_register << 1
-		if data_register > 127:
-			# nibble complete return it
-			break
-		offset += 1
-	# if we run out of data, return what we had, though it is probably useless to do so.	
-	return {'nibble': data_register, 'leading_zeros': leading_zeros, 'offset': offset}
+			nibbles.append(int(tail[first_one:].translate(bit_digits), 2))
+			leading_zeros.append(first_one)
+		starts.append(start + position)
+		ends.append(start + max(last, position))
+	return {'nibbles': nibbles, 'leading_zeros': leading_zeros, 'starts': starts, 'ends': ends}
 
 # This can be SLOW.  This can be very slow.  I've seen it take almost 4 minutes on a track, even if it
 # is usually way faster.  I'm not sure what property causes the slowness but I want to eradicate whatever it is.
@@ -1111,7 +2440,7 @@ def grab_nibble(bits):
 def find_patternsx(track, second_track = None):
 	'''Take course-grained scan and maximize matching patterns in track'''
 	# First, get a course match, only valid up to the window size used in find_occurrences.
-	occurrences = find_occurrences(track, second_track)
+	occurrences = find_repeats(track, second_track)
 	# Now, patterns has a decent rough cut of where repeats were found, but they are not necessarily
 	# as big as they can be.  So, sort the patterns (which will sort them by start bit of the earlier bits),
 	# and go through them trying to expand them as far as possible to capture the full extent of the matches
@@ -1230,8 +2559,8 @@ def find_patternsx(track, second_track = None):
 			# we now have the biggest region we can get here.
 			# add it to the list of regions we want to keep
 			if False:
-				message('Adding good region {} to {} with {} to {} ({}, distance: {})'.format(\
-					starts[0], ends[0], starts[1], ends[1], ends[0] - starts[0], starts[1] - starts[0]), 2)
+				message('Adding good region {} to {} with {} to {} ({}, distance: {})', 2, \
+					starts[0], ends[0], starts[1], ends[1], ends[0] - starts[0], starts[1] - starts[0])
 				# display_bits('Search bits: ', bits[starts[0]: new_ends[0]], 2)
 				# display_bits(' Match bits: ', bits[starts[1]: new_ends[1]], 2)
 			# record the pattern so we can block repeats
@@ -1261,6 +2590,10 @@ def find_patternsx(track, second_track = None):
 	if len(track_length_votes) > 0:
 		votes = sorted(track_length_votes.items(), key=itemgetter(1), reverse = True)
 		track_length, highest_vote_count = votes[0]
+	elif not second_track:
+		# no patterns at all, so go with the estimate
+		track_length, correlation = estimate_track_length(track)
+		highest_vote_count = 0
 	else:
 		track_length = 0
 		highest_vote_count = 0
@@ -1273,13 +2606,13 @@ def find_patternsx(track, second_track = None):
 			display = ' SYNC from {:5.2f}: {:7d} bits ({:7d} votes). '
 		else:
 			display = 'Track {:5.2f} --- {:7d} bits ({:7d} votes). '
-		message(display.format(track['track_number'], track_length, highest_vote_count), 2, end='')
+		message(display, 2, track['track_number'], track_length, highest_vote_count, end='')
 	# sort by longest match
 	patterns_by_length.sort(key = itemgetter(0), reverse = True)
 	if False:
 		if len(patterns_by_length) > 0:
-			message('Match: {:7d} ({:7d}/{:7d}) distance {:7d}'.format(patterns_by_length[0][0], \
-				patterns_by_length[0][2], patterns_by_length[0][4], patterns_by_length[0][1]), 2)
+			message('Match: {:7d} ({:7d}/{:7d}) distance {:7d}', 2, patterns_by_length[0][0], \
+				patterns_by_length[0][2], patterns_by_length[0][4], patterns_by_length[0][1])
 		else:
 			message('No matches :(', 2)
 	return patterns_by_length, track_length
@@ -1422,15 +2755,20 @@ def assemble_track_regions(pattern_lengths):
 # So, for the region we're looking at (presumed to be the match between 2 and 3), we look back
 # in the map to see if we find a match about a track back that matched with 2.  If so, 3 will
 # become the check bits for the 1-2 match.
-def find_check_bits(track, track_region, track_map):
+# The map index holds the matches in the map by where they end and by where they start, so that only
+# the ones that end or start about a track back need to be looked at, earliest in the map first.
+def find_check_bits(track, track_region, track_map, map_index):
 	'''Locate the check bits for a particular match'''
 	# name region members of the current match we are processing
 	reg_start, reg_end, match_start, match_end = track_region
 	# the format of the check bits is: check bits bounds, prior region that corresponds bounds
 	check_bits = [-1, -1, -1, -1]
 	found_check_bits = False
+	ends, starts = map_index
+	looking_back = set(ends.near(reg_end - track['track_length'], track['tolerance']))
+	looking_back.update(starts.near(reg_start - track['track_length'], track['tolerance']))
 	# look back among the matches we already found to see if one ended about a track before this region.
-	for check_map in track_map:
+	for check_map in (track_map[position] for position in sorted(looking_back)):
 		# name map members
 		map_type, map_start, map_end, map_match_start, map_match_end = check_map[:5]
 		if map_type == 'match':
@@ -1442,7 +2780,7 @@ def find_check_bits(track, track_region, track_map):
 				check_bits[1] = reg_end # check bits end with region
 				check_bits[3] = map_end # corresponding bits end with map
 				found_check_bits = True
-				message('Looking back, found a match ending where we want: {}'.format(check_map), 2)
+				message('Looking back, found a match ending where we want: {}', 2, check_map)
 			# start of first current match minus start of prior found match
 			if abs((reg_start - map_start) - track['track_length']) < track['tolerance']:
 				# check region starts about a track back
@@ -1451,7 +2789,7 @@ def find_check_bits(track, track_region, track_map):
 				check_bits[0] = reg_start
 				check_bits[2] = map_start
 				found_check_bits = True
-				message('Looking back, found a match starting where we want: {}'.format(check_map), 2)
+				message('Looking back, found a match starting where we want: {}', 2, check_map)
 			if found_check_bits:
 				# we found something, but it may not be the same size (may run off one end or the other)
 				# message('Found check match: {}'.format(check_bits), 2)
@@ -1465,8 +2803,8 @@ def find_check_bits(track, track_region, track_map):
 						# set matching bits to start as far back from end as prior found match has bits
 						check_bits[0] = reg_end - (map_end - map_start)
 						check_bits[2] = map_start
-						message('Found end but not beginning, so setting beginning to {}/{}'.format(\
-							check_bits[0], check_bits[2]), 2)
+						message('Found end but not beginning, so setting beginning to {}/{}', 2, \
+							check_bits[0], check_bits[2])
 					else:
 						# we found the beginning but not the end
 						# so the current match-to-be is too close to the end of the track
@@ -1475,10 +2813,10 @@ def find_check_bits(track, track_region, track_map):
 						# and set check bits to end as far ahead of the beginning as current match has bits
 						check_bits[1] = track_region[1]
 						check_bits[3] = map_start + (track_region[1] - track_region[0])
-						message('Found beginning but not end, so setting end to {}/{}'.format(\
-							check_bits[1], check_bits[3]), 2)
+						message('Found beginning but not end, so setting end to {}/{}', 2, \
+							check_bits[1], check_bits[3])
 				# check bits found, stop checking
-				message('After end adjustment: {}'.format(check_bits), 2)
+				message('After end adjustment: {}', 2, check_bits)
 				break
 	# if we found check bits, try to resolve them so that they line up exactly
 	# (they may not line up exactly if we had to adjust the length)
@@ -1550,9 +2888,10 @@ def build_track_mapx(track):
 	# done in the region computation.
 	track_length = track['track_length']
 	tolerance = track['tolerance']
-	zero_streams = track['zero_streams']
 	bits = track['bits']
 	track_map = []
+	# the matches in the map, by end and by start, for find_check_bits
+	map_index = (OffsetIndex(), OffsetIndex())
 	index = [0, track_length, -1]
 	for track_region in track['track_regions']:
 		# name the array values so that the code makes some semblance of sense
@@ -1577,9 +2916,9 @@ def build_track_mapx(track):
 			# match_end = bits[track_region[1] - 100: track_region[1]]
 			# search_start = track_region[2] + track_length - tolerance
 			# search_end = track_region[2] + track_length + tolerance + 100
-			message('track region: {}'.format(track_region), 2)
-			check_bits = find_check_bits(track, track_region, track_map)
-			message('check bits: {}'.format(check_bits), 2)
+			message('track region: {}', 2, track_region)
+			check_bits = find_check_bits(track, track_region, track_map, map_index)
+			message('check bits: {}', 2, check_bits)
 
 			# add the gap between this match and the previous one to the track map
 			if match_start > index[1] and reg_start > index[0]:
@@ -1592,33 +2931,35 @@ def build_track_mapx(track):
 					check = ''
 				track_map.append(['gap', index[0], reg_start, index[1], match_start, \
 					index[0], reg_start, index[2], check_bits[2]])
-				message('.....: {:6d} to {:6d} and {:6d} to {:6d} is a gap (length {:5d} / {:5d}) {}'.format(\
+				message('.....: {:6d} to {:6d} and {:6d} to {:6d} is a gap (length {:5d} / {:5d}) {}', 2, \
 					index[0], track_region[0], index[1], track_region[2], \
-					track_region[0] - index[0], track_region[2] - index[1], check), 2)
+					track_region[0] - index[0], track_region[2] - index[1], check)
 			# add the match to the track map, and the move the next anticipated thing pointer ahead past the match
 			if check_bits.count(-1) == 0:
 			# if found_check_bits:
 				check = 'check {:6d} to {:6d} ({})'.format(check_bits[2], check_bits[3], check_bits[3] - check_bits[2])
 			else:
 				check = ''
+			map_index[0].add(reg_end, len(track_map))
+			map_index[1].add(reg_start, len(track_map))
 			track_map.append(['match', reg_start, reg_end, match_start, match_end, \
 				check_bits[0], check_bits[1], check_bits[2], check_bits[3]])
-			message('MATCH: {:6d} to {:6d} matches {:6d} to {:6d} (length {:5d}, distance {:5d} [{:3d}]) {}'.format(\
+			message('MATCH: {:6d} to {:6d} matches {:6d} to {:6d} (length {:5d}, distance {:5d} [{:3d}]) {}', 2, \
 				reg_start, reg_end, match_start, match_end, \
 				reg_end - reg_start, match_start - reg_start, \
-				match_start - reg_start - track_length, check), 2)
+				match_start - reg_start - track_length, check)
 			next_index = [reg_end, match_end, check_bits[3]]
 
 		# before we actually advance, check for zero streams in the vicinity, between anticipated next thing
 		# and next anticipated next thing.  Right now this is kind of just for information, not sure how it
 		# will be useful except in gap resolution.  Don't really want to advance past it as a thing really.
-		for (start, end) in [(index[0] - tolerance, next_index[0] + tolerance), (index[1] - tolerance, next_index[1] + tolerance)]:
-			for zero_stream in zero_streams:
-				# message('zs0: {}, start: {}, end: {}.'.format(zero_stream[0], start, end), 2)
-				if zero_stream[0] > start and zero_stream[0] < end:
+		# Since it only feeds the display, skip it when nobody is going to see it.
+		if showing(2):
+			for (start, end) in [(index[0] - tolerance, next_index[0] + tolerance), (index[1] - tolerance, next_index[1] + tolerance)]:
+				for zero_stream in zero_streams_starting(track, start, end):
 					# there is a zero stream that starts in the region we will advance over
-					message('  000: {:6d} to {:6d} is a zero region (length {}).'.format(\
-						zero_stream[0], zero_stream[1], zero_stream[1] - zero_stream[0]), 2)
+					message('  000: {:6d} to {:6d} is a zero region (length {}).', 2, \
+						zero_stream[0], zero_stream[1], zero_stream[1] - zero_stream[0])
 		# and now advance
 		index = next_index.copy()	
 	return track_map
@@ -1638,9 +2979,9 @@ def gap_display(columns, index, force=False):
 					columns[column] += extra_spaces
 		# display if we have reached the end of a line
 		if len(columns[0]) == 16:
-			message('{} {} {} {} {} {} {} {} {:6d}/{:6d} {} '.format(\
+			message('{} {} {} {} {} {} {} {} {:6d}/{:6d} {} ', 2, \
 				columns[0], columns[1], columns[7], columns[2], columns[3], \
-				columns[4], columns[5], columns[6], index[0], index[1], columns[8]), 2)
+				columns[4], columns[5], columns[6], index[0], index[1], columns[8])
 			columns = None
 	if not columns:
 		columns = ['', '', '', '', '', '', '', '', '']
@@ -1755,9 +3096,9 @@ def resolve_bits(track):
 	track = find_zero_streams(track)
 	# count how many triple zeros we have and base the tolerance for track length mismatch on that
 	# I am just kind of eyeballing it here.
-	count_000 = bits.count(threezeros)
+	count_000 = count_threezeros(track)
 	track['tolerance'] = int(count_000 / 75) + 15
-	message('We found {} 000s in the bit stream, tolerance is {}.'.format(count_000, track['tolerance']), 2)
+	message('We found {} 000s in the bit stream, tolerance is {}.', 2, count_000, track['tolerance'])
 	track['track_map'] = build_track_mapx(track)
 	# we have a map of the matches and the gaps now to walk through, everything should be contiguous.
 	# so now we try to resolve the bits in the gaps between matches
@@ -1766,7 +3107,7 @@ def resolve_bits(track):
 	next_nibble_start = None
 	prior_segment = None
 	for map_segment in track['track_map']:
-		message('Map segment: {}'.format(map_segment), 2)
+		message('Map segment: {}', 2, map_segment)
 		# name the members of map_segment
 		map_type, map_start, map_end, map_match_start, map_match_end = map_segment[:5]
 		check_match_start, check_match_end, check_start, check_end = map_segment[5:]
@@ -1840,9 +3181,9 @@ def resolve_bits(track):
 					track_shrink += 1
 				# skip to next map segment
 				continue
-			message('Gap from {} to {} and {} to {}, lengths {} / {}, pressure {}'.format(\
+			message('Gap from {} to {} and {} to {}, lengths {} / {}, pressure {}', 2, \
 				map_start, map_end, map_match_start, map_match_end, \
-				map_end - map_start, map_match_end - map_match_start, pressure), 2, end='')
+				map_end - map_start, map_match_end - map_match_start, pressure, end='')
 			if next_nibble_start:
 				display_bits(', leading bits for nibbles: ', next_nibble_start, 2, '')
 			message('', 2)
@@ -1855,27 +3196,16 @@ def resolve_bits(track):
 			# now walk through
 			gap_resolved = bytearray()
 			index = [map_start, map_match_start]
-			columns = gap_display(None, index) if options['werbose'] else []
+			columns = gap_display(None, index) if showing(2) else []
 			next_bit_action = -2
 			next_bit_source = 0
 			next_bit_target = 0
 			next_bit_action_display = '?'
 			while index[0] < map_segment[2] and index[1] < map_segment[4]:
 				line_start = len(gap_resolved)
-				in_zero_stream_each = [False, False]
-				sync_in_zero_stream_each = [False, False]
 				# if either index is in a zero region, then let the zero win
-				# TODO: Do this more incrementally, so I don't have to rescan the zero streams for every gap bit
-				for stream in [0, 1]:
-					for zero_stream in track['zero_streams']:
-						if index[stream] >= zero_stream[0] and index[stream] < zero_stream[1]:
-							in_zero_stream_each[stream] = True
-						if index[stream] + 12 >= zero_stream[0] and index[stream] + 12 < zero_stream[1]:
-							sync_in_zero_stream_each[stream] = True
-					if in_zero_stream_each[stream] and sync_in_zero_stream_each[stream]:
-						break
-				in_zero_stream = in_zero_stream_each[0] or in_zero_stream_each[1]
-				sync_in_zero_stream = sync_in_zero_stream_each[0] or sync_in_zero_stream_each[1]
+				in_zero_stream = within_zero_stream(track, index[0]) or within_zero_stream(track, index[1])
+				sync_in_zero_stream = within_zero_stream(track, index[0] + 12) or within_zero_stream(track, index[1] + 12)
 				# These flags will determine what we do, the heuristics below will set them
 				bit_action = 0 # -1 delete, 0 replace, 1 insert
 				bit_source = 0 # bit to insert or replace
@@ -2108,12 +3438,12 @@ def resolve_bits(track):
 					resolved_display = '{}'.format(bit_source) # display new resolved bit
 				# display nibbles of resolved bits
 				# since right now this is only for display purposes, only bother if we are displaying it
-				if options['werbose']:
+				if showing(2):
 					line_bits = gap_resolved[line_start:]
 					next_nibble_start, nibble_display = bits_to_nibbles(line_bits, next_nibble_start)
 
 				# display what we did
-				if options['werbose']:
+				if showing(2):
 					columns = gap_display_collect(columns, bits, index, map_segment, pressure, in_zero_stream, \
 						sync_character, bit_action_display, resolved_display, skip_target, nibble_display)
 					columns = gap_display(columns, index)
@@ -2121,7 +3451,7 @@ def resolve_bits(track):
 				index = [index[0] + 1, index[1] + 1]
 			# we have made it through the gap
 			# Flush out any undisplayed gap status information
-			columns = gap_display(columns, index, True) if options['werbose'] else []
+			columns = gap_display(columns, index, True) if showing(2) else []
 			if next_nibble_start:
 				display_bits('Trailing bits after nibbles: ', next_nibble_start, 2)
 			if index != [map_segment[2], map_segment[4]]:
@@ -2137,14 +3467,14 @@ def resolve_bits(track):
 		elif map_segment[0] == 'match':
 			# this is a match
 			# display the bits and nibbles if we are in verbose mode
-			if options['werbose']:
+			if showing(2):
 				# match, display the bits maybe
-				message('Matching bits: {}'.format(map_segment[2] - map_segment[1]), 2, end='')
-				message(', track length difference: {}'.format((map_segment[3] - map_segment[1]) - track_length), 2, end='')
+				message('Matching bits: {}', 2, map_segment[2] - map_segment[1], end='')
+				message(', track length difference: {}', 2, (map_segment[3] - map_segment[1]) - track_length, end='')
 				if next_nibble_start:
 					display_bits(', leading bits for nibbles: ', next_nibble_start, 2, '')
 				message('', 2)
-				matching_bits = bits[map_segment[1]: map_segment[2]]
+				matching_bits = bits[map_segment[1]: map_segment[2]].unpacked()
 				bit_length = len(matching_bits)
 				bit_window = 96
 				offset = 0
@@ -2199,8 +3529,8 @@ def resolve_bits(track):
 			resolved_bits.extend(map_segment[9])
 			# display_bits('  Gap ({:5d}): '.format(len(map_segment[9])), map_segment[9], 2)
 	# And now resolved bits should have everything all together
-	message('Resolved track bits are now {} bits long.'.format(len(resolved_bits)), 2)
-	track['resolved_bits'] = resolved_bits
+	message('Resolved track bits are now {} bits long.', 2, len(resolved_bits))
+	track['resolved_bits'] = PackedBits.from_bits(resolved_bits)
 	track['adjusted_map'] = adjusted_map
 	track['longest_resolved_match'] = [longest_match, longest_match_offset, longest_match_end_offset]
 	# Find an appropriate place to cut the resolved bits
@@ -2209,14 +3539,12 @@ def resolve_bits(track):
 	# remember how much we lopped off the beginning already (for use in sync estimation)
 	track['already_cut'] = start_cut
 	end_cut = start_cut + resolved_length
-	message('Cutting the track from {} to {}'.format(start_cut, end_cut), 2)
-	final_bits = resolved_bits[start_cut: end_cut]
+	message('Cutting the track from {} to {}', 2, start_cut, end_cut)
+	final_bits = track['resolved_bits'][start_cut: end_cut]
 	display_bits('  End of track: ', final_bits[-128:], 2)
 	display_bits('Start of track: ', final_bits[:128], 2)
 
-	track['bits'] = final_bits[:]
-	track['bits'].extend(final_bits)
-	track['bits'].extend(final_bits)
+	track['bits'] = PackedBits.join([final_bits, final_bits, final_bits])
 
 	track['track_start'] = 0
 	track['track_repeat'] = len(final_bits)
@@ -2229,28 +3557,20 @@ def resolve_bits(track):
 
 def bits_to_nibbles(line_bits, next_nibble_start):
 	'''Compute nibbles for the verbose displays'''
-	nibble_offset = 0
-	displayed_some = False
 	nibble_display = ''
-	while nibble_offset < len(line_bits):
-		if next_nibble_start:
-			bits_forward = next_nibble_start[:]
-			bits_forward.extend(line_bits[nibble_offset:])
-			last_nibble = grab_nibble(bits_forward)
-			last_nibble['offset'] -= len(next_nibble_start)
-		else:
-			last_nibble = grab_nibble(line_bits[nibble_offset:])
-		next_nibble_offset = nibble_offset + last_nibble['offset'] + 1
-		if next_nibble_offset >= len(line_bits) or last_nibble['nibble'] < 128:
-			if displayed_some or not next_nibble_start:
-				next_nibble_start = line_bits[nibble_offset:]
-			else:
-				next_nibble_start.extend(line_bits[nibble_offset:])
+	if len(line_bits) == 0:
+		return next_nibble_start, nibble_display
+	# carry on from the bits left over from the last line
+	bits_forward = next_nibble_start[:] if next_nibble_start else bytearray()
+	bits_forward.extend(line_bits)
+	decoded = decode_nibbles(bits_forward)
+	for index, nibble in enumerate(decoded['nibbles']):
+		nibble_start = decoded['starts'][index]
+		if decoded['ends'][index] + 1 >= len(bits_forward) or nibble < 128:
+			# save the bits of the incomplete nibble for the next line
+			next_nibble_start = bits_forward[nibble_start:]
 			break
-		nibble_display += '{}{:02x}'.format('_' if last_nibble['leading_zeros'] > 0 else ' ', last_nibble['nibble'])
-		displayed_some = True
-		next_nibble_start = None
-		nibble_offset = next_nibble_offset
+		nibble_display += '{}{:02x}'.format('_' if decoded['leading_zeros'][index] > 0 else ' ', nibble)
 	return next_nibble_start, nibble_display
 
 def locate_track_cut(track, track_shrink):
@@ -2269,8 +3589,8 @@ def locate_track_cut(track, track_shrink):
 	track_prediction = track_length
 	# track_prediction = track_length - track_shrink
 	start_cut = 0
-	message('Track length before was {} and shrank by {} so new prediction is {}'.format(\
-		track_length, track_shrink, track_prediction), 2)
+	message('Track length before was {} and shrank by {} so new prediction is {}', 2, \
+		track_length, track_shrink, track_prediction)
 	window_size = 1500
 	# spiral out from predicted track length because match pattern might be too common
 	radius = 0
@@ -2281,38 +3601,38 @@ def locate_track_cut(track, track_shrink):
 	# try to pick a track cut that includes the longest match
 	longest_match, longest_match_offset, longest_match_end_offset = track['longest_resolved_match']
 	max_center = len(resolved_bits) - window_size - max_radius - 12
-	message('Max center point is {}, based on window {}, max radius {}, bits {}'.format(\
-		max_center, window_size, max_radius, len(resolved_bits)), 2)
+	message('Max center point is {}, based on window {}, max radius {}, bits {}', 2, \
+		max_center, window_size, max_radius, len(resolved_bits))
 	if longest_match_offset + track_prediction < max_center:
 		# if we start at the longest match, we should still have room at the end to find end of track
 		search_start = longest_match_offset + 12
 		search_center = search_start + track_prediction
 		found_suitable_bits = True
-		message('Starting at beginning of longest match ({} to {}).'.format(longest_match_offset, longest_match_end_offset), 2)
+		message('Starting at beginning of longest match ({} to {}).', 2, longest_match_offset, longest_match_end_offset)
 	elif longest_match_end_offset < max_center and longest_match_end_offset - track_prediction - window_size - max_radius > 0:
 		# there is room from the beginning to end at the longest match
 		search_center = longest_match_end_offset + 12
 		search_start = search_center - track_prediction
 		found_suitable_bits = True
-		message('Ending at end of longest match ({} to {}).'.format(longest_match_offset, longest_match_end_offset), 2)
+		message('Ending at end of longest match ({} to {}).', 2, longest_match_offset, longest_match_end_offset)
 	else:
 		# if we get here, we can neither start with longest match nor end with it
 		for map_segment in track_map:
 			if map_segment[0] == 'match' and map_segment[2] - map_segment[1] > window_size + 24:
 				# match is big enough to do the search
-				message('Big enough to do the search: {} to {}'.format(map_segment[1], map_segment[2]), 2)
+				message('Big enough to do the search: {} to {}', 2, map_segment[1], map_segment[2])
 				if (not found_suitable_bits) or map_segment[2] - map_segment[1] > best_match:
 					# this is better than what we have so far
-					message('Better than what we had before: {}'.format(best_match), 2)
+					message('Better than what we had before: {}', 2, best_match)
 					if map_segment[1] + 12 + track_prediction < max_center:
 						# search center is far enough inland that we can do the radial search
 						search_start = map_segment[1] + 12
 						search_center = search_start + track_prediction
-						message('Search center is {}, max center is {}, good enough.'.format(search_center, max_center), 2)
+						message('Search center is {}, max center is {}, good enough.', 2, search_center, max_center)
 						found_suitable_bits = True
 						best_match = map_segment[2] - map_segment[1]
 	if found_suitable_bits:
-		message('Searching from first sufficient match at {} around {}'.format(search_start, search_center), 2)
+		message('Searching from first sufficient match at {} around {}', 2, search_start, search_center)
 	else:
 		# getting desperate now.
 		# look for the first window_size bits available that are not in a zero stream
@@ -2332,7 +3652,7 @@ def locate_track_cut(track, track_shrink):
 			# jump ahead 12 bits again to be well clear of zeros
 			search_start += 12
 			search_center = search_start + track_prediction
-			message('Searching for first non-zero-stream bits (at {}) around {}'.format(search_start, search_center), 2)
+			message('Searching for first non-zero-stream bits (at {}) around {}', 2, search_start, search_center)
 		else:
 			# couldn't find a non-zero start, so give up and use the first bits
 			search_start = 0
@@ -2354,19 +3674,19 @@ def locate_track_cut(track, track_shrink):
 			track_expanded = (map_segment[4] - map_segment[2]) - last_track_length
 			adjustment -= region_shrunk
 			adjustment += track_expanded
-			message('Segment starting at {}/{}: region shrunk {} track expanded {} cumulative adjustment {}'.format(\
-				map_segment[0], map_segment[2], region_shrunk, track_expanded, adjustment), 2)
+			message('Segment starting at {}/{}: region shrunk {} track expanded {} cumulative adjustment {}', 2, \
+				map_segment[0], map_segment[2], region_shrunk, track_expanded, adjustment)
 		# else:
 		# 	message('Skipping segment {} to {}'.format(map_segment[0], map_segment[1]), 2)
 		last_track_length = map_segment[4] - map_segment[2]
-	message('Cumulative guess at track length adjustment is {}:'.format(adjustment), 2)
-	message('For comparison, track length was {} and track shrink was {}'.format(\
-		track_length, track_shrink), 2)
+	message('Cumulative guess at track length adjustment is {}:', 2, adjustment)
+	message('For comparison, track length was {} and track shrink was {}', 2, \
+		track_length, track_shrink)
 	if search_start < search_center:
 		search_center += adjustment
 	else:
 		search_center -= adjustment
-	message('That puts the search center at {}'.format(search_center), 2)
+	message('That puts the search center at {}', 2, search_center)
 	# display_bits('Looking for: ', search_bits, 2)
 	# display_bits('Before search center: ', bits[search_center - max_radius: search_center], 2)
 	# display_bits('    at search center: ', bits[search_center: search_center + window_size], 2)
@@ -2379,21 +3699,21 @@ def locate_track_cut(track, track_shrink):
 			# found forwards
 			resolved_length = abs(search_start - (search_center + radius))
 			start_cut = search_start if search_start < search_center else search_center + radius
-			message('Search bits found forward {} bits, meaning track length of {}'.format(\
-				radius, resolved_length), 2)
+			message('Search bits found forward {} bits, meaning track length of {}', 2, \
+				radius, resolved_length)
 			break
 		elif resolved_bits[search_center - radius: search_center - radius + window_size] == search_bits:
 			# found backwards
 			resolved_length = abs(search_start - (search_center - radius))
 			start_cut = search_start if search_start < search_center else search_center - radius
-			message('Search bits found backward {} bits, meaning track length of {}'.format(\
-				radius, resolved_length), 2)
+			message('Search bits found backward {} bits, meaning track length of {}', 2, \
+				radius, resolved_length)
 			break
 		radius += 1
 	if resolved_length == 0:
 		# we did not succeed in finding the match at all.
-		message('WTF.  Cannot find my matching bits.  Searching around {} up to {} and back to {}'.format(\
-			search_center, search_center + max_radius + window_size, search_center - max_radius), 2)
+		message('WTF.  Cannot find my matching bits.  Searching around {} up to {} and back to {}', 2, \
+			search_center, search_center + max_radius + window_size, search_center - max_radius)
 		display_bits('Looking for: ', search_bits, 2)
 		display_bits('Entire search range: ', resolved_bits[search_center - max_radius: search_center + max_radius + window_size], 2)
 		# so just take the predicted length then
@@ -2414,11 +3734,12 @@ def locate_track_cut(track, track_shrink):
 # This will fail to see those.  Probably should add some verbosity to see what it actually finds.
 def grab_first_post_sync_nibble(bits):
 	'''Search bits for at least two long nibbles and return the last one'''
-	offset = 0
 	long_nibbles_found = 0
 	short_nibbles_found = 0
-	while offset < len(bits):
-		nibble = grab_nibble(bits[offset:])
+	decoded = decode_nibbles(bits)
+	for index, offset in enumerate(decoded['starts']):
+		nibble = {'nibble': decoded['nibbles'][index], 'leading_zeros': decoded['leading_zeros'][index], \
+			'offset': decoded['ends'][index] - offset}
 		if nibble['leading_zeros'] > 0:
 			# this is a long nibble
 			long_nibbles_found += 1
@@ -2446,11 +3767,15 @@ def grab_first_post_sync_nibble(bits):
 				if short_nibbles_found > 6: # this used to be 6, might be too strict
 					# yep, we've got enough.  So return the last long nibble we found
 					return last_long_nibble
-		offset += nibble['offset'] + 1
 	# if we get to here we failed to find two long nibbles and a short one.
 	message('Could not find even enough long nibbles followed by short ones to sync', 2)
 	return False
 
+def describe_nibbles(decoded, first, last):
+	'''Show a run of decoded nibbles in hex, with a dot for each leading zero'''
+	return ''.join(('.' * decoded['leading_zeros'][index]) + '{:2x} '.format(decoded['nibbles'][index]) \
+		for index in range(first, last))
+
 # Nibblize the bit stream.  Also keeps track of timing bits.  Will finish by creating nibble stream
 # of entire track (or possibly entire track starting from beginning of best match).
 def nibblize(track):
@@ -2464,7 +3789,6 @@ def nibblize(track):
 		# track['all_timing'] = []
 		track['all_offsets'] = []
 		# track['nibble_ends'] = []
-		# track['sync_regions'] = []
 		track['nib_nibbles'] = bytearray()
 		return track
 	bits = track['bits']
@@ -2480,89 +3804,74 @@ def nibblize(track):
 	# So I will discard all nibbles before that.  Evaluation of wisdom of this move pending.
 	start_offset = best['needle']
 	cut_offset = best['haystack']
-	message('Nibblize: initial values: start at {}, cut at {}'.format(start_offset, cut_offset), 2)
+	message('Nibblize: initial values: start at {}, cut at {}', 2, start_offset, cut_offset)
+	decoded = None
+	cut_index = None
 	while start_offset < best['needle'] + 12:
-		offset = start_offset
+		# after the first time through, this only decodes until the new start falls into step with the last one
+		decoded = decode_nibbles(bits, start_offset, decoded)
 		restart = False
-		track_nibbles = bytearray()
-		track_timing = []
-		nibble_offsets = []
-		nibble_ends = []
-		sync_regions = []
-		sync_start = 0
-		sync_run = 0
-		# message('Starting offset at {:5d}, will record track nibbles just before {:5d}'.format(offset, cut_offset), 2)
+		if 'track_nibbles' in track:
+			break
+		# find the nibble that reaches the cut
+		cut_index = bisect.bisect_left(decoded['ends'], cut_offset - 1)
+		if cut_index == len(decoded['ends']):
+			# never got there
+			cut_index = None
+			break
+		offset = decoded['ends'][cut_index] + 1
+		if offset > cut_offset:
+			# if we found that the cut is not after the right number of bits
+			# adjust the start forward and do it again
+			start_offset += offset - cut_offset
+			cut_offset += offset - cut_offset
+			restart = True
+			message('Resetting and renibblizing from {} to {} to try to get the track cut precise.', 2, \
+				start_offset, cut_offset)
+			continue
+		track['track_nibbles'] = decoded['nibbles'][: cut_index + 1] # freeze it in time, don't equate the pointers
+		# message('Track nibbles stored, there are {:5d} of them'.format(len(track['track_nibbles'])), 2)
+		break
+	track_nibbles = decoded['nibbles']
+	nibble_starts = decoded['starts']
+	nibble_ends = decoded['ends']
+	if restart:
+		# we ran out of tries, so we just have the nibbles up to the last attempted cut
+		track_nibbles = track_nibbles[: cut_index + 1]
+		nibble_starts = nibble_starts[: cut_index + 1]
+		nibble_ends = nibble_ends[: cut_index + 1]
 		nibble_run_start = ''
 		nibble_run_end = ''
-		while offset < len(track['bits']):
-			nibble = grab_nibble(track['bits'][offset:])
-			track_nibbles.append(nibble['nibble'])
-			track_timing.append(nibble['leading_zeros'])
-			nibble_offsets.append(nibble['offset'])
-			nibble_ends.append(offset + nibble['offset'])
-			if offset < best['needle'] + 128:
-				nibble_run_start += '{:5d}: '.format(offset) if nibble_run_start == '' else ''
-				nibble_run_start += ('.' * nibble['leading_zeros'])
-				nibble_run_start += '{:2x} '.format(nibble['nibble'])
-			if offset > best['haystack'] - 64 and offset < best['haystack'] + 128:
-				nibble_run_end += ' ...{:5d}: '.format(offset) if nibble_run_end == '' else ''
-				nibble_run_end += ('.' * nibble['leading_zeros'])
-				nibble_run_end += '{:2x} '.format(nibble['nibble'])
-			# if offset < best['needle'] + 128 or (offset > best['haystack'] - 64 and offset < best['haystack'] + 128):
-			# 	message('Nibble: {:2x} with timing {:2d} at offset {:5d}'.format(nibble['nibble'], nibble['leading_zeros'], offset), 2)
-			if nibble['leading_zeros'] > 0:
-				# this was a long nibble, a sync byte or something more devious.
-				# if it's the first one, start recording this as a region
-				if sync_start == 0:
-					sync_start = offset
-					sync_run = 0
-				else:
-					# and if it is continuing in a region we already opened, keep track of the number of nibbles
-					sync_run += 1
-			else:
-				# this is a regular sized nibble, but if we were recording a sync region, close it
-				# offset in the sync regions list is the offset of the beginning of the first long nibble
-				if sync_start > 0:
-					sync_regions.append([sync_run, sync_start, offset])
-					sync_start = 0
-					sync_run = 0
-			offset += nibble['offset'] + 1
-			# Since we're grabbing the whole track here starting at needle, notice when we've got the best track nibbles
-			if offset >= cut_offset and not 'track_nibbles' in track:
-				# if we reached here and found that the cut is not after the right number of bits
-				# adjust the start forward and do it again
-				if offset > cut_offset:
-					start_offset += offset - cut_offset
-					cut_offset += offset - cut_offset
-					restart = True
-					nibble_run_start = ''
-					nibble_run_end = ''
-					message('Resetting and renibblizing from {} to {} to try to get the track cut precise.'.format(\
-						start_offset, cut_offset), 2)
-					break
-				nibble_run_end += '-//- '
-				# message('--- track cut ---', 2)
-				track['track_nibbles'] = track_nibbles[:] # freeze it in time, don't equate the pointers
-				# message('Track nibbles stored, there are {:5d} of them'.format(len(track['track_nibbles'])), 2)
-		if not restart:
-			break
+	else:
+		# show the nibbles at the start, and those around the cut
+		last = bisect.bisect_left(nibble_starts, best['needle'] + 128)
+		nibble_run_start = '{:5d}: '.format(nibble_starts[0]) + describe_nibbles(decoded, 0, last) if last > 0 else ''
+		first = bisect.bisect_right(nibble_starts, best['haystack'] - 64)
+		last = bisect.bisect_left(nibble_starts, best['haystack'] + 128)
+		nibble_run_end = ' ...{:5d}: '.format(nibble_starts[first]) if first < last else ''
+		if cut_index is None or cut_index >= last:
+			nibble_run_end += describe_nibbles(decoded, first, last) + ('' if cut_index is None else '-//- ')
+		elif cut_index < first:
+			nibble_run_end = '-//- ' + describe_nibbles(decoded, first, last)
+		else:
+			nibble_run_end += describe_nibbles(decoded, first, cut_index + 1) + '-//- ' + \
+				describe_nibbles(decoded, cut_index + 1, last)
 	message('Doing full track nibblize and collecting timing bits.', 2)
-	message('Starting offset at {:5d}, recording track nibbles just before {:5d}'.format(start_offset, cut_offset), 2)
+	message('Starting offset at {:5d}, recording track nibbles just before {:5d}', 2, start_offset, cut_offset)
 	message('Nibbles: ' + (' ' * (len(nibble_run_end) - len(nibble_run_start))) + nibble_run_start, 2)
 	message('         ' + nibble_run_end, 2)
 	# track['nibble_best'] = best
 	track['all_nibbles'] = track_nibbles
-	# track['all_timing'] = track_timing
-	track['all_offsets'] = nibble_offsets
+	# track['all_timing'] = decoded['leading_zeros']
+	track['all_offsets'] = array.array('l', [end - start for start, end in zip(nibble_starts, nibble_ends)])
 	# track['nibble_ends'] = nibble_ends
-	# track['sync_regions'] = sync_regions
 	if 'track_nibbles' in track:
-		message('Nibbles collected. Track_nibbles is {} long.'.format(len(track['track_nibbles'])), 2)
+		message('Nibbles collected. Track_nibbles is {} long.', 2, len(track['track_nibbles']))
 	else:
 		message('Nibbles collected, but.. did not find the track boundary.', 2)
 		# fill them all in -- what else can I do?  Not sure where to truncate it otherwise.
 		track['track_nibbles'] = track_nibbles
-	message('All_nibbles is {} long.'.format(len(track['all_nibbles'])), 2)
+	message('All_nibbles is {} long.', 2, len(track['all_nibbles']))
 
 	# message('First few nibbles of all_nibbles: {}'.format(track_nibbles[:10]), 2)
 	# message('First few nibbles of track_nibbles: {}'.format(track['track_nibbles'][:10]), 2)
@@ -2575,6 +3884,8 @@ def nibblize(track):
 	# message('About to leave nibblize, track nibbles is {} long'.format(len(track['track_nibbles'])), 2)
 	return track
 
+sector_mark = re.compile(b'\xd5\xaa[\x96\xb5\xad]') # address (16 and 13 sector) and data marks
+
 # This is primarily for the purpose of creating dsk images
 # Also useful for getting an estimate of track length.
 # Of course, this is mostly useful on disks with pretty much standard formatting.
@@ -2590,8 +3901,8 @@ def locate_sectors(track):
 	message('offset ADDR: vol track sector 13/16 ; ADDR/DATA: CHK=addr checksum error, ok=addr epilogue ok ', 2)
 	# TODO: Keep track of the gaps and optimal beginning of the nibble stream for nib writing.
 	# Skip the last 420 nibbles since they cannot contain a sector and this would be their third read anyway
-	message('There are {:4d} track nibbles'.format(len(track['track_nibbles'])), 2)
-	message('There are {:4d} total nibbles'.format(len(track['all_nibbles'])), 2)
+	message('There are {:4d} track nibbles', 2, len(track['track_nibbles']))
+	message('There are {:4d} total nibbles', 2, len(track['all_nibbles']))
 	# message('The first ones are {:2x} {:2x} {:2x}'.format(track['track_nibbles'][0], track['track_nibbles'][1], track['track_nibbles'][2]), 2)
 	# tack on the beginning of the track to the end so that we can handle a wrap-around
 	scan_nibbles = track['track_nibbles'] + track['track_nibbles'][0:1000]
@@ -2601,11 +3912,21 @@ def locate_sectors(track):
 	offset = 0
 	awaiting_data = False
 	# We will keep track of the gaps between found elements, might be useful at least informationally.
-	gap = bytearray()
+	# They are kept as [start, end] offsets into all_nibbles.
+	gap_start = 0
+	# The data fields are decoded all together once they have all been found, so hold on to them, and
+	# hold the console report back until then too (it reports the data checksums).
+	data_fields = []
+	report = []
 	while offset < stop_scan:
+		# skip straight to the next mark (that starts before stop_scan), the nibbles in between are gap
+		found = sector_mark.search(scan_nibbles, offset, stop_scan + 2)
+		if not found:
+			break
+		offset = found.start()
+		gap = [gap_start, offset]
 		nibfield = (scan_nibbles)[offset : offset + 14]
-		# message('Looking for {} in {}'.format(bytearray(b'\xd5\xaa\x96'), nibfield), 2)
-		if nibfield[0:3] in [bytearray(b'\xd5\xaa\x96'), bytearray(b'\xd5\xaa\xb5')]:
+		if nibfield[2] != 0xad:
 			# we found an address mark (d5aa96 for 16-sector, d5aab5 for 13-sector)
 			sector = {
 			'dos32': (nibfield[2] == 0xb5), # true if it was 13-sector
@@ -2623,56 +3944,66 @@ def locate_sectors(track):
 			# but a gold star if all three were written
 			sector['addr_epilogue_perfect'] = (sector['addr_epilogue'][0:3] == bytearray(b'\xde\xaa\xeb'))
 			all_sectors.append(sector)
-			gap = bytearray()
 			if awaiting_data:
 				# If we have gotten two address fields in a row, send a linebreak to the console
-				message('', 2)
-			message('{:6d} ADDR: {:02x} {:02x} {:02x} {} {} {}{}  '.format( \
+				report.append(('', '\n'))
+			report.append(('{:6d} ADDR: {:02x} {:02x} {:02x} {} {} {}{}  '.format( \
 				sector['offset'], sector['vol'], sector['track'], sector['sector'], \
 				'13' if sector['dos32'] else '16', \
 				'   ' if sector['addr_checksum_ok'] else 'C{:02x}'.format(sector['addr_checksum']), \
 				'    ok' if sector['addr_epilogue_ok'] else ('{:02x}{:02x}{:02x}'.format( \
 					(sector['addr_epilogue'])[0], (sector['addr_epilogue'])[1], (sector['addr_epilogue'])[2])), \
 				'!' if sector['addr_epilogue_perfect'] else ' ' \
-				), 2, end='')
+				), ''))
 			# jump past the address epilogue
 			offset += 14
+			gap_start = offset
 			# next thing we expect is a data field
 			awaiting_data = True
-		elif nibfield[0:3] == bytearray(b'\xd5\xaa\xad'): # data mark (for both standard 13- and 16-sector formats)
+		else: # data mark (for both standard 13- and 16-sector formats)
 			# this is presumed to be the data mark on the last pushed sector
 			if awaiting_data:
 				sector = all_sectors.pop()
 			else:
 				# we got a data field without having registered an address field
 				sector = zero_sector
-				message('{:6d}                                '.format(offset), 2, end='')
+				report.append(('{:6d}                                '.format(offset), ''))
 			# the next 342 (3.3) or 410 (3.2) nibbles will be encoded data, followed by a checksum and epilogue
 			data_length = 411 if sector['dos32'] else 343
 			nibfield = scan_nibbles[offset + 3: offset + data_length + 6]
 			sector['encoded_data'] = nibfield[:-3]
 			sector['data_epilogue'] = nibfield[-3:]
-			sector['data'] = decode_53(sector['encoded_data']) if sector['dos32'] else decode_62(sector['encoded_data'])
-			sector['data_checksum'] = sector['data'].pop()
-			sector['data_checksum_ok'] = (sector['data_checksum'] == 0)
 			sector['data_epilogue_ok'] = (sector['data_epilogue'][0:2] == bytearray(b'\xde\xaa'))
 			sector['data_epilogue_perfect'] = (sector['data_epilogue'][0:3] == bytearray(b'\xde\xaa\xeb'))
 			sector['data_pre_gap'] = gap
-			# put the sector back, now with the data
+			# put the sector back, the data gets decoded below
 			all_sectors.append(sector)
-			gap = bytearray()
+			data_fields.append([sector, sector['encoded_data'], sector['data_epilogue']])
+			report.append(len(data_fields) - 1)
 			awaiting_data = False
-			message('DATA: {} {}{}'.format( \
-				'   ' if sector['data_checksum_ok'] else 'C{:02x}'.format(sector['data_checksum']), \
-				'ok    ' if sector['data_epilogue_ok'] else ('{:02x}{:02x}{:02x}'.format( \
-					(sector['data_epilogue'])[0], (sector['data_epilogue'])[1], (sector['data_epilogue'])[2])), \
-				'!' if sector['data_epilogue_perfect'] else ' ' \
-				), 2)
 			offset += 6 + data_length
+			gap_start = offset
+	# decode all of the data fields for each encoding at once
+	for dos32 in [False, True]:
+		batch = [field for field in data_fields if field[0]['dos32'] == dos32]
+		data, checksums = decode_sectors([field[1] for field in batch], dos32)
+		for field, sector_data, checksum in zip(batch, data, checksums):
+			field.extend([sector_data, checksum])
+	for sector, encoded_data, data_epilogue, sector_data, checksum in data_fields:
+		sector['data'] = sector_data
+		sector['data_checksum'] = checksum
+		sector['data_checksum_ok'] = (checksum == 0)
+	for line in report:
+		if isinstance(line, int):
+			# a data field, report its checksum and epilogue
+			sector, encoded_data, data_epilogue, sector_data, checksum = data_fields[line]
+			message('DATA: {} {}{}', 2, \
+				'   ' if checksum == 0 else 'C{:02x}'.format(checksum), \
+				'ok    ' if data_epilogue[0:2] == bytearray(b'\xde\xaa') else ('{:02x}{:02x}{:02x}'.format( \
+					data_epilogue[0], data_epilogue[1], data_epilogue[2])), \
+				'!' if data_epilogue[0:3] == bytearray(b'\xde\xaa\xeb') else ' ')
 		else:
-			# Keep track of the nibbles in the gap between marks we find
-			gap.append(scan_nibbles[offset])
-			offset += 1
+			message(line[0], 2, end=line[1])
 	track['all_sectors'] = all_sectors
 	if awaiting_data:
 		# if we ended after an address without data, print a linebreak to the console
@@ -2685,7 +4016,7 @@ def consolidate_sectors(track):
 	sorted_sectors = {}
 	dos32_mode = False
 	# prodos_mode = options['write_po']
-	if options['werbose']:
+	if showing(2):
 		message('Consolidating found sectors by reported sector number and checking data integrity.')
 	# collect in an array keyed by self-reported sector number, for all addresses with a proper checksum.
 	# also remember the offset of the first sector
@@ -2741,7 +4072,7 @@ def consolidate_sectors(track):
 		message('After consolidating: (self-id track) DCHK data checksum err, DATA data mismatch err, offset, bit distance twixt copies', 1)
 		for sector_number in sorted_sectors.keys():
 			data = False
-			message('Sec {:0x}: '.format(sector_number), 1, end='')
+			message('Sec {:0x}: ', 1, sector_number, end='')
 			for sector in sorted_sectors[sector_number]:
 				if data:
 					data_match = True if 'data' in sector and sector['data'] == data else False
@@ -2754,16 +4085,16 @@ def consolidate_sectors(track):
 				# it is impossible to have a bad address checksum because it wouldn't have been stored
 				# message('{} {} {} {:5d} {:5d} /'.format( \
 				# 	'    ' if 'addr_checksum_ok' in sector and sector['addr_checksum_ok'] else 'ACHK', \
-				message('({:0x}) {} {} {:5d} {:5d} /'.format( \
+				message('({:0x}) {} {} {:5d} {:5d} /', 1, \
 					sector['track'],
 					'    ' if 'data_checksum_ok' in sector and sector['data_checksum_ok'] else 'DCHK', \
 					'    ' if data_match else 'DATA', \
-					sector['offset'], bit_distance
-					), 1, end='')
+					sector['offset'], bit_distance, end='')
 			message('', 1)
 	# Gather the track data for .dsk and .po images, taking the first valid one (data checksum ok) of first two
 	dsk_bytes = bytearray()
 	track_error = False
+	good_sectors = 0
 	message('Creating the .dsk byte stream for the track.', 2)
 	for logical_sector in range(16):
 		# TODO: Allow for CP/M, Pascal, ProDOS skewing as well at some point
@@ -2776,6 +4107,7 @@ def consolidate_sectors(track):
 		try:
 			sector = sorted_sectors[physical_sector][0]
 			if sector['data_checksum_ok']:
+				good_sectors += 1
 				dsk_bytes.extend(sector['data'])
 			else:
 				# first sector was not ok, check to see if there's a second sector that is
@@ -2783,6 +4115,7 @@ def consolidate_sectors(track):
 					sector = sorted_sectors[physical_sector][1]
 					if sector['data_checksum_ok']:
 						# second one was ok even though first was not, so store that instead
+						good_sectors += 1
 						dsk_bytes.extend(sector['data'])
 					else:
 						# append a sector of zeros, neither of the first two were ok
@@ -2797,31 +4130,25 @@ def consolidate_sectors(track):
 			dsk_bytes.extend(bytearray(256))
 			track_error = True
 	track['dsk_bytes'] = dsk_bytes
+	track['good_sectors'] = good_sectors
 	# For now, just report when there was a bad track, not used anywhere
 	if track_error:
 		message('At least one sector was bad (and stuffed with zeros).', 2)
 	return track
 
+# Each nibble in a data field is the xor of its value with the value before it, so the values are
+# the running xor (checksum) of the translated nibbles.
 def decode_62(encoded_data):
 	'''Decode 6+2 encoded nibbles in a standard sector of 16'''
-	checksum = 0
-	secondary = []
-	decoded_data = []
+	checksums = list(accumulate(bytes(encoded_data[:343]).translate(translate_62), xor))
 	# first 86 bytes represent the lower two bits of the next 256 bytes
-	for offset in range(86):
-		checksum ^= translate_62(encoded_data[offset])
-		secondary.append(checksum)
-	# reverse them, we need them in the other order
-	secondary = secondary[::-1]
 	# next 256 bytes represent the high bits
-	for offset in range(256):
-		checksum ^= translate_62(encoded_data[offset + 86])
-		decoded_data.append(checksum << 2)
+	decoded_data = [checksum << 2 for checksum in checksums[86: 342]]
 	# decode was successful if checksum plus XOR the last byte is zero, stored in element 256
-	decoded_data.append(translate_62(encoded_data[342]) ^ checksum)
+	decoded_data.append(checksums[342])
 	# reassemble the bytes
 	for offset in range(86):
-		lo = secondary[85 - offset]
+		lo = checksums[offset]
 		decoded_data[offset] += (((lo & 0b000001) << 1) + ((lo & 0b000010) >> 1))
 		decoded_data[offset + 86] += (((lo & 0b000100) >> 1) + ((lo & 0b001000) >> 3))
 		if offset < 84:
@@ -2840,21 +4167,13 @@ def decode_53(encoded_data):
 	# Incidentally, this is interesting but a little bit pointless.  This information would be useful
 	# for a dsk but dsk generally does not support 13-sectors.  It can help with track length estimation.
 	# When written as a dsk, it'll write 13 sectors and 3 zero sectors per track.
-	checksum = 0
-	secondary = []
-	decoded_data = []
-	# read the secondary buffer first
-	for offset in range(154):
-		checksum ^= translate_53(encoded_data[offset])
-		secondary.append(checksum)
-	# reverse them, we need them in the other order
-	secondary = secondary[::-1]
+	checksums = list(accumulate(bytes(encoded_data[:411]).translate(translate_53), xor))
+	# read the secondary buffer first, we need it in the other order
+	secondary = checksums[153:: -1]
 	# read the primary buffer (high bits, rotate left to free the three lower bits)
-	for offset in range(256):
-		checksum ^= translate_53(encoded_data[offset + 154])
-		decoded_data.append(checksum << 3) # I had 2 in a previous version, must have been wrong
+	decoded_data = [checksum << 3 for checksum in checksums[154: 410]] # I had 2 in a previous version, must have been wrong
 	# decode was successful if checksum plus XOR the last byte is zero, stored in element 256
-	decoded_data.append(translate_53(encoded_data[410]) ^ checksum)
+	decoded_data.append(checksums[410])
 	# reassemble the bytes
 	for offset in range(0x33):
 		# Lower bits for first three primary bands are in ---xxx---, rotate into place and add.
@@ -2874,52 +4193,141 @@ def decode_53(encoded_data):
 	decoded_data[255] = (encoded_data[255] << 3) + encoded_data[409]
 	return decoded_data
 
+# Decode a batch of data fields (all 6+2 or all 5+3) at once.  With NumPy, the fields are stacked into
+# a matrix with a row per sector and decoded a column at a time, the same way decode_62/decode_53 do it.
+# Returns the decoded data for each sector (256 values) and its checksum (ok if 0).
+def decode_sectors(encoded_fields, dos32=False):
+	'''Decode a batch of data fields, returning the data and checksum of each'''
+	global options
+	field_length = 411 if dos32 else 343
+	if not options['numpy'] or len(encoded_fields) == 0 or \
+			any(len(encoded_data) != field_length for encoded_data in encoded_fields):
+		decoded = [decode_53(encoded_data) if dos32 else decode_62(encoded_data) for encoded_data in encoded_fields]
+		return [decoded_data[:256] for decoded_data in decoded], [decoded_data[256] for decoded_data in decoded]
+	encoded = numpy.frombuffer(b''.join(bytes(encoded_data) for encoded_data in encoded_fields), \
+		dtype=numpy.uint8).reshape(len(encoded_fields), field_length)
+	table = numpy.frombuffer(translate_53 if dos32 else translate_62, dtype=numpy.uint8)
+	checksums = numpy.bitwise_xor.accumulate(table[encoded], axis=1).astype(numpy.int32)
+	if dos32:
+		secondary = checksums[:, 153:: -1]
+		bands = [secondary[:, band * 0x33: (band + 1) * 0x33] for band in range(3)]
+		data = checksums[:, 154: 410] << 3
+		for band in range(3):
+			data[:, band: 255: 5] += bands[band] >> 2
+		lower_bits = (bands[0] & 4) + (bands[1] & 2) + (bands[2] & 1)
+		data[:, 3: 255: 5] += lower_bits
+		data[:, 4: 255: 5] += lower_bits
+		data[:, 255] = (encoded[:, 255].astype(numpy.int32) << 3) + encoded[:, 409]
+		return data.tolist(), checksums[:, 410].tolist()
+	lo = checksums[:, :86]
+	data = checksums[:, 86: 342] << 2
+	data[:, :86] += ((lo & 0b000001) << 1) + ((lo & 0b000010) >> 1)
+	data[:, 86: 172] += ((lo & 0b000100) >> 1) + ((lo & 0b001000) >> 3)
+	data[:, 172:] += ((lo[:, :84] & 0b010000) >> 3) + ((lo[:, :84] & 0b100000) >> 5)
+	return data.tolist(), checksums[:, 342].tolist()
 
 def display_bits(label, bit_array, level, end="\n"):
-	message(label, level, end='')
-	for i in range(0, len(bit_array)):
-		message('{:1d}'.format(bit_array[i]), level, end='')
-	message('', level, end)
+	if showing(level):
+		message(label + ''.join('{:1d}'.format(bit) for bit in bit_array), level, end=end)
 
-def write_dsk_file(eddfile, tracks):
+# Output writers.  Each output format has a writer class that opens its file, is handed the tracks
+# one at a time in track order, and is then closed.  None of them hold on to the tracks, so the
+# tracks can be streamed through them as they are analyzed (--stream) as easily as written from a
+# finished tracks array.  Where a header depends on all of the tracks (the fdi track length table,
+# the v2d file size), the writer reserves the space for it and patches it in when it is closed.
+class TrackWriter:
+	'''Base class for output writers'''
+	extension = ''
+	description = ''
+
+	def __init__(self, eddfile):
+		global options
+		self.eddfile = eddfile
+		self.filename = options['output_basename'] + self.extension
+		message('Writing {} image to {}', 2, self.description, self.filename)
+		started = clock()
+		self.outfile = open(self.filename, mode="wb")
+		self.start()
+		record_time(status['timings'], 'write_' + self.description, started)
+
+	def start(self):
+		'''Write whatever comes before the first track'''
+		pass
+
+	def add_track(self, track):
+		'''Write out one track'''
+		pass
+
+	def finish(self):
+		'''Write or patch whatever depends on all of the tracks'''
+		pass
+
+	def write_track(self, track):
+		'''Write out one track, recording how long it took'''
+		started = clock()
+		self.add_track(track)
+		record_time(track.setdefault('timings', {}), 'write_' + self.description, started)
+
+	def close(self):
+		'''Finish up and close the output file'''
+		started = clock()
+		self.finish()
+		self.outfile.close()
+		record_time(status['timings'], 'write_' + self.description, started)
+
+# Hand a whole tracks array to a writer (this is what the write_*_file functions do)
+def write_tracks(writer, tracks):
+	'''Write all of the tracks out using an output writer'''
+	for track in tracks:
+		writer.write_track(track)
+	writer.close()
+
+class DskWriter(TrackWriter):
 	'''Write the data out in the form of a 34-track dsk or po file'''
-	global options
 	# restore this later when po order options are put back in
-	# outfile = options['output_basename'] + ('.po' if options['write_po'] else '.dsk')
-	outfile = options['output_basename'] + '.dsk'
-	message('Writing dsk image to {}'.format('outfile'), 2)
-	with open(outfile, mode="wb") as dskfile:
-		for track in tracks:
-			if (4 * track['track_number']) % 4 == 0 and track['track_number'] < 35:
-				dskfile.write(track['dsk_bytes'])
+	# extension = '.po' if options['write_po'] else '.dsk'
+	extension = '.dsk'
+	description = 'dsk'
+
+	def add_track(self, track):
+		if (4 * track['track_number']) % 4 == 0 and track['track_number'] < 35:
+			self.outfile.write(track['dsk_bytes'])
+
+def write_dsk_file(eddfile, tracks):
+	'''Write the data out in the form of a 34-track dsk or po file'''
+	write_tracks(DskWriter(eddfile), tracks)
+
+class NicWriter(TrackWriter):
+	'''Write the EDD data out in the form of a 35-track nic file'''
+	extension = '.nic'
+	description = 'nic'
+
+	def add_track(self, track):
+		if (4 * track['track_number']) % 4 == 0 and track['track_number'] < 35:
+			track_nickels = bits_to_bytes(track['track_bits'][:65536])
+			self.outfile.write(track_nickels)
 
 def write_nic_file(eddfile, tracks):
 	'''Write the EDD data out in the form of a 35-track nic file'''
-	global options
-	# restore this later when po order options are put back in
-	# outfile = options['output_basename'] + ('.po' if options['write_po'] else '.dsk')
-	outfile = options['output_basename'] + '.nic'
-	message('Writing nic image to {}'.format('outfile'), 2)
-	with open(outfile, mode="wb") as dskfile:
-		for track in tracks:
-			if (4 * track['track_number']) % 4 == 0 and track['track_number'] < 35:
-				track_nickels = bits_to_bytes(track['track_bits'][:65536])
-				dskfile.write(track_nickels)
+	write_tracks(NicWriter(eddfile), tracks)
+
+class NibWriter(TrackWriter):
+	'''Write the data out in the form of a 34-track nib file'''
+	extension = '.nib'
+	description = 'nib'
+
+	def add_track(self, track):
+		if (4 * track['track_number']) % 4 == 0 and track['track_number'] < 35:
+			# if 'sync_nibstart' in track:
+			# 	sync_nibstart = track['sync_nibstart']
+			# 	self.outfile.write((track['nibbles'])[sync_nibstart: sync_nibstart + 0x1a00])
+			# else:
+			# 	self.outfile.write((track['nibbles'])[:0x1a00])
+			self.outfile.write(track['nib_nibbles'])
 
 def write_nib_file(eddfile, tracks):
 	'''Write the data out in the form of a 34-track nib file'''
-	global options
-	outfile = options['output_basename'] + '.nib'
-	message('Writing nib image to {}'.format('outfile'), 2)
-	with open(outfile, mode="wb") as nibfile:
-		for track in tracks:
-			if (4 * track['track_number']) % 4 == 0 and track['track_number'] < 35:
-				# if 'sync_nibstart' in track:
-				# 	sync_nibstart = track['sync_nibstart']
-				# 	nibfile.write((track['nibbles'])[sync_nibstart: sync_nibstart + 0x1a00])
-				# else:
-				# 	nibfile.write((track['nibbles'])[:0x1a00])
-				nibfile.write(track['nib_nibbles'])
+	write_tracks(NibWriter(eddfile), tracks)
 
 # def write_nit_file(eddfile, tracks):
 # 	'''Write the nibble timing data out in the form of a (quarter tracked) nit file'''
@@ -2937,172 +4345,152 @@ def write_nib_file(eddfile, tracks):
 # 			else:
 # 				nibfile.write((track['nibbles'])[:0x1a00])
 
-def write_v2d_file(eddfile, tracks):
+class V2dWriter(TrackWriter):
 	'''Write the data out in the form of a half-tracked v2d/d5ni file'''
-	global options
-	outfile = options['output_basename'] + '.v2d'
 	# A v2d/D5NI container can store quarter tracks, but Virtual II only recognizes half tracks.
-	message('Writing v2d image to {}'.format('outfile'), 2)
-	with open(outfile, mode="wb") as v2dfile:
-		# precompute the lengths so we can get the filesize
-		filesize = 0
-		num_tracks = 0
-		for track in tracks:
-			quarter_track = int(4 * track['track_number'])
-			phase = quarter_track % 4
-			if phase == 0 or phase == 2:
-				filesize += len(track['track_nibbles'])
-				# if len(track['track_nibbles']) < nibs_to_write:
-				# 	filesize += len(track['track_nibbles'])
-				# else:
-				# 	filesize += nibs_to_write
-				# and four bytes for the track header
-				filesize += 4
-				if len(track['track_nibbles']) > 0:
-					# is it even possible to have zero nibbles, e.g., on an unformatted track?  All zeros?
-					num_tracks += 1
-				else:
-					message('v2d write: No track nibbles on track {}'.format(track['track_number']), 2)					
-		# write the d5ni/v2d header
-		# filesize = len(tracks) * (nibs_to_write + 4) # (1a00 + 4) * tracks
-		v2dfile.write(struct.pack('>I', filesize)) # size of whole file
-		v2dfile.write(b"D5NI") #signature
-		v2dfile.write(struct.pack('>H', num_tracks)) # number of tracks
-		for track in tracks:
-			quarter_track = int(4 * track['track_number'])
-			phase = quarter_track % 4
-			if phase == 0 or phase == 2:
-				if 'track_nibbles' in track and len(track['track_nibbles']) > 0:
-					# assuming there are some nibbles (otherwise, skip the track)
-					# write the track header
-					v2dfile.write(struct.pack('>H', int(4 * track['track_number']))) # quarter track index
-					v2dfile.write(struct.pack('>H', len(track['track_nibbles']))) # bytes in this track
-					# if len(track['track_nibbles']) < nibs_to_write:
-					# 	# if we don't have enough nibbles around to write, then cut the track back
-					# 	v2dfile.write(struct.pack('>H', len(track['track_nibbles']))) # bytes in this track
-					# else:
-					# 	v2dfile.write(struct.pack('>H', nibs_to_write)) # bytes in this track
-					# TODO: Maybe try to use sync_nibstart like .nib writing does.  Not now, though.
-					# This should write as many nibbles as we have, if it is fewer than nibs_to_write
-					v2dfile.write(track['track_nibbles'])
+	extension = '.v2d'
+	description = 'v2d'
+
+	def start(self):
+		# write the d5ni/v2d header, the file size and number of tracks get filled in at the end
+		self.filesize = 0
+		self.num_tracks = 0
+		self.outfile.write(struct.pack('>I', 0)) # size of whole file
+		self.outfile.write(b"D5NI") #signature
+		self.outfile.write(struct.pack('>H', 0)) # number of tracks
+
+	def add_track(self, track):
+		quarter_track = int(4 * track['track_number'])
+		phase = quarter_track % 4
+		if phase == 0 or phase == 2:
+			# the file size counts a track header even for tracks that are skipped
+			self.filesize += len(track['track_nibbles']) + 4
+			if len(track['track_nibbles']) > 0:
+				# assuming there are some nibbles (otherwise, skip the track)
+				self.num_tracks += 1
+				# write the track header
+				self.outfile.write(struct.pack('>H', quarter_track)) # quarter track index
+				self.outfile.write(struct.pack('>H', len(track['track_nibbles']))) # bytes in this track
+				# TODO: Maybe try to use sync_nibstart like .nib writing does.  Not now, though.
+				self.outfile.write(track['track_nibbles'])
+			else:
+				# is it even possible to have zero nibbles, e.g., on an unformatted track?  All zeros?
+				message('v2d write: No track nibbles on track {}', 2, track['track_number'])
+
+	def finish(self):
+		self.outfile.seek(0)
+		self.outfile.write(struct.pack('>I', self.filesize))
+		self.outfile.seek(8)
+		self.outfile.write(struct.pack('>H', self.num_tracks))
+
+def write_v2d_file(eddfile, tracks):
+	'''Write the data out in the form of a half-tracked v2d/d5ni file'''
+	write_tracks(V2dWriter(eddfile), tracks)
 
 # Write a png file representation of the bits
 # Inspired by (and bits of code lightly lifted/adapted from) Charles Mangin's HackFest entry at KansasFest 2015
+class PngWriter(TrackWriter):
+	'''Write a png file representation of the bits (not yet written, so no file is created)'''
+	description = 'png'
+
+	def __init__(self, eddfile):
+		self.eddfile = eddfile
+
+	def close(self):
+		pass
+
 def write_png_file(eddfile, tracks):
-	pass
+	write_tracks(PngWriter(eddfile), tracks)
 
-def write_fdi_file(eddfile, tracks):
+# The FDI track length table has room for 180 tracks.  Each track gets two bytes, the track
+# type and its length in pages, and the track data follows the header in the same order.
+# Spiral experiments (disabled for now): it appears (at least with Jawbreaker) that there is a
+# window of about 250 bits in which it will still work, known good was 20007, worked from 19907 up
+# to 20157, with a modulo of 51091.  Unfortunately, that disk computes a spiral advance on its own
+# of 11691/10546 = 11118, so the closest working value to what it came up with is 8789 higher.
+# No idea to what extent there is a systematic difference there.  Jawbreaker read 2 reported
+# 9618/51090, gets to splash at 9618.  Read 3 reported 9966/51089, splash at 10966, works at 11216.
+# The idea was to write a shotgun of fdi files at start cuts of
+# int(offset * 4 * track['track_number']) % options['spiral_modulo'] to try to figure it out.
+class FdiWriter(TrackWriter):
 	'''Write the data out in the form of an FDI file'''
-	global options
-	if options['spiral'] and False:
-		# it appears (at least with Jawbreaker) that there is a window of about
-		# 250 bits in which it will still work, known good was 20007, worked from 19907 up to 20157
-		# unfortunately, that disk computes a spiral advance on its own of 11691/10546 = 11118
-		# so, the closest working value to what it came up with is 8789 higher.
-		# no idea to what extent there is a systematic difference there, will it always be about that low?
-		# hence the shotgun to try to figure it out.
-		# known-good for Jawbreaker read number 1 (good from 19907 to 20157)
-		# options['spiral_advance'] = 20007
-		# options['spiral_modulo'] = 51091
-		# Jawbreaker read 2 reported 9618/51090, gets to splash at 9618
-		# Jawbreaker read 3 reported 9966/51089, gets to splash at 10966, works at 11216.
-		start_offset = options['spiral_advance'] - 250
-		end_offset = options['spiral_advance'] + 9000
-	else:
-		start_offset = 0
-		end_offset = 0
-	offset_increment = 250
-	offset = start_offset
-	while offset <= end_offset:
-		if options['spiral'] and False:
-			outfile = options['output_basename'] + '-{}-{}.fdi'.format(offset, options['spiral_modulo'])
+	extension = '.fdi'
+	description = 'fdi'
+	table_entries = 180
+
+	def start(self):
+		# Write the FDI header
+		self.outfile.write(b"Formatted Disk Image file\n\r") #signature
+		self.outfile.write(b"defedd, version 0.0a          \n\r") #creator
+		self.outfile.write(b"\x1a" * 81) # comment field and eof marker
+		self.outfile.write(b"\x02\x00") #version 2.0
+		self.outfile.write(b"\x00\x9f") #last track for OE, corresponds to 160 quarter tracks, or 40 tracks
+		self.outfile.write(b"\x00") #last head
+		self.outfile.write(b"\x01") #5.25
+		self.outfile.write(b"\xac") #300 rpm
+		if options['write_protect']:
+			self.outfile.write(b"\x01") #flags, not write protected, not index synchronized
 		else:
-			outfile = options['output_basename'] + '.fdi'.format(offset)
-		message('Writing fdi image to {}'.format(outfile), 2)
-		with open(outfile, mode="wb") as fdifile:
-			# Write the FDI header
-			fdifile.write(b"Formatted Disk Image file\n\r") #signature
-			fdifile.write(b"defedd, version 0.0a          \n\r") #creator
-			for x in range(81): # comment field and eof marker
-				fdifile.write(b"\x1a") 
-			fdifile.write(b"\x02\x00") #version 2.0
-			fdifile.write(b"\x00\x9f") #last track for OE, corresponds to 160 quarter tracks, or 40 tracks
-			fdifile.write(b"\x00") #last head
-			fdifile.write(b"\x01") #5.25
-			fdifile.write(b"\xac") #300 rpm
-			if options['write_protect']:
-				fdifile.write(b"\x01") #flags, not write protected, not index synchronized
+			self.outfile.write(b"\x00") #flags, not write protected, not index synchronized
+		self.outfile.write(b"\x05") #192 tpi (quarter tracks)
+		self.outfile.write(b"\x05") #192 tpi (quarter tracks, though the heads aren't really this narrow)
+		self.outfile.write(b"\x00\x00") #reserved
+		# reserve the track length table, it is filled in as the tracks are written
+		self.table_offset = self.outfile.tell()
+		self.table = bytearray()
+		self.outfile.write(bytes(2 * self.table_entries))
+
+	def add_track(self, track):
+		phase = (4 * track['track_number']) % 4
+		if options['process_quarters'] or phase == 0 or (options['process_halves'] and phase == 2):
+			if len(track['track_bits']) == 0:
+				# treat track as unformatted (so we don't even have the 8 header bits)
+				# TODO: add partial chaating back in
+				self.table += b'\x00\x00'
 			else:
-				fdifile.write(b"\x00") #flags, not write protected, not index synchronized
-			fdifile.write(b"\x05") #192 tpi (quarter tracks)
-			fdifile.write(b"\x05") #192 tpi (quarter tracks, though the heads aren't really this narrow)
-			fdifile.write(b"\x00\x00") #reserved
-			lengths_written = 0 # keep track of how many track lengths we have written
-			for track in tracks:
-				phase = (4 * track['track_number']) % 4
-				if options['process_quarters'] or phase == 0 or (options['process_halves'] and phase == 2):
-					if len(track['track_bits']) == 0:
-						# treat track as unformatted (so we don't even have the 8 header bits)
-						# TODO: add partial chaating back in
-						fdifile.write(b'\x00\x00')
-						track['fdi_bits'] = 0
-						lengths_written += 1
-					else:
-						fdifile.write(b"\xd2") # raw GCR
-						# start_cut = int(offset * 4 * track['track_number']) % options['spiral_modulo'] if options['spiral'] else 0
-						start_cut = 0
-						# if options['spiral']:
-						# 	message('track {:5.2f}, cut at {:5d}'.format(track['track_number'], start_cut), 2)
-						track['fdi_bytes'] = bits_to_bytes(track['track_bits'][start_cut:])
-						track['fdi_bits'] = len(track['track_bits'][start_cut:])
-						track['fdi_write_length'] = 8 + len(track['fdi_bytes'])
-						track['fdi_page_length'] = math.ceil(track['fdi_write_length'] / 256)
-						fdifile.write(bytes([track['fdi_page_length']]))
-						lengths_written += 1
-				if not options['process_quarters']:
-					# we are not processing quarters so we will need to stuff lengths at least for half tracks
-					if not options['process_halves']:
-						# we are processing whole tracks, so stuff zero lengths for quarters 2-4:
-						fdifile.write(b'\x00\x00\x00\x00\x00\x00')
-						lengths_written += 3
-					else:
-						# we are processing half tracks, so stuff zero lengths for quarters 2 and 4:
-						fdifile.write(b'\x00\x00')
-						lengths_written += 1
-			# Write out enough zeros after the track data to get us to a page boundary
-			for extra_track in range(180 - lengths_written):
-				fdifile.write(b"\x00\x00")
+				# bitstream data could actually come straight out of the EDD file
+				# but I will use the one that was re-encoded based on repeat location
+				fdi_bytes = bits_to_bytes(track['track_bits'])
+				fdi_write_length = 8 + len(fdi_bytes)
+				self.table += b"\xd2" # raw GCR
+				self.table.append(math.ceil(fdi_write_length / 256))
+				self.outfile.write(struct.pack('>L', len(track['track_bits'])))
+				self.outfile.write(struct.pack('>L', track['index_offset']))
+				self.outfile.write(fdi_bytes)
+				# pad to a page boundary.
+				self.outfile.write(bytes(256 - fdi_write_length % 256))
+		if not options['process_quarters']:
+			# we are not processing quarters so we will need to stuff lengths at least for half tracks
+			if not options['process_halves']:
+				# we are processing whole tracks, so stuff zero lengths for quarters 2-4:
+				self.table += b'\x00\x00\x00\x00\x00\x00'
+			else:
+				# we are processing half tracks, so stuff zero lengths for quarters 2 and 4:
+				self.table += b'\x00\x00'
 
-			# go to the beginning of the eddfile in case we want to write bytes straight out of it
-			eddfile.seek(0)
+	def finish(self):
+		if len(self.table) > 2 * self.table_entries:
+			message('fdi write: Too many tracks for the track table, only the first {} were recorded', 0, \
+				self.table_entries)
+			del self.table[2 * self.table_entries:]
+		self.outfile.seek(self.table_offset)
+		self.outfile.write(self.table)
 
-			for track in tracks:
-				track_index = track['track_number'] * 4
-				phase = track_index % 4
-				if options['process_quarters'] or phase == 0 or (options['process_halves'] and phase == 2):
-					if track['fdi_bits'] > 0:
-						# message('Writing fdi track {}, fdi bits {}'.format(track['track_number'], track['fdi_bits']), 2)
-						fdifile.write(struct.pack('>L', track['fdi_bits']))
-						fdifile.write(struct.pack('>L', track['index_offset']))
-						if options['from_zero'] and False:
-							# if asked, we can at this point pass bits straight from the EDD file
-							eddbuffer = eddfile.read(16384)
-							fdifile.write(eddbuffer[:len(track['track_bits'])])
-						else:
-							# bitstream data could actually come straight out of the EDD file
-							# but I will use the one that was re-encoded based on repeat location
-							fdifile.write(track['fdi_bytes'])
-						# pad to a page boundary.
-						for x in range(256 - track['fdi_write_length'] % 256):
-							fdifile.write(b"\x00")
-		offset += offset_increment
+def write_fdi_file(eddfile, tracks):
+	'''Write the data out in the form of an FDI file'''
+	write_tracks(FdiWriter(eddfile), tracks)
 
+# MFI writing has been disabled for now (see write_mfi_file), so this just creates an empty file.
+class MfiWriter(TrackWriter):
+	'''Write the data out in the form of a MESS Floppy Image file'''
+	extension = '.mfi'
+	description = 'mfi'
 
 def write_mfi_file(eddfile, tracks):
 	'''Write the data out in the form of a MESS Floppy Image file'''
 	global options
 	outfile = options['output_basename'] + '.mfi'
-	message('Writing mfi image to {}'.format(outfile), 2)
+	message('Writing mfi image to {}', 2, outfile)
 	with open(outfile, mode="wb") as mfifile:
 		# Preprocess the tracks because we need this information for the header
 		# Don't have the same option of storing 2.5x revolutions of bits in MFI
@@ -3180,37 +4568,26 @@ def write_mfi_file(eddfile, tracks):
 			else:
 				break
 
-def translate_62(nibble):
-	'''Nibble translate table for 6+2 encoding'''
-	try:
-		translation = {
-			0x96: 0x00, 0x97: 0x01, 0x9a: 0x02, 0x9b: 0x03, 0x9d: 0x04, 0x9e: 0x05, 0x9f: 0x06, 0xa6: 0x07,
-			0xa7: 0x08, 0xab: 0x09, 0xac: 0x0a, 0xad: 0x0b, 0xae: 0x0c, 0xaf: 0x0d, 0xb2: 0x0e, 0xb3: 0x0f,
-			0xb4: 0x10, 0xb5: 0x11, 0xb6: 0x12, 0xb7: 0x13, 0xb9: 0x14, 0xba: 0x15, 0xbb: 0x16, 0xbc: 0x17,
-			0xbd: 0x18, 0xbe: 0x19, 0xbf: 0x1a, 0xcb: 0x1b, 0xcd: 0x1c, 0xce: 0x1d, 0xcf: 0x1e, 0xd3: 0x1f,
-			0xd6: 0x20, 0xd7: 0x21, 0xd9: 0x22, 0xda: 0x23, 0xdb: 0x24, 0xdc: 0x25, 0xdd: 0x26, 0xde: 0x27,
-			0xdf: 0x28, 0xe5: 0x29, 0xe6: 0x2a, 0xe7: 0x2b, 0xe9: 0x2c, 0xea: 0x2d, 0xeb: 0x2e, 0xec: 0x2f,
-			0xed: 0x30, 0xee: 0x31, 0xef: 0x32, 0xf2: 0x33, 0xf3: 0x34, 0xf4: 0x35, 0xf5: 0x36, 0xf6: 0x37,
-			0xf7: 0x38, 0xf9: 0x39, 0xfa: 0x3a, 0xfb: 0x3b, 0xfc: 0x3c, 0xfd: 0x3d, 0xfe: 0x3e, 0xff: 0x3f,
-		}[nibble]
-	except:
-		# TODO: Invalidate the data block in this situation. Checksum should fail anyway, though.
-		translation = 0x00
-	return translation
-
-def translate_53(nibble):
-	'''Nibble translate table for 5+3 encoding'''
-	try:
-		translation = {
-			0xab: 0x00, 0xad: 0x01, 0xae: 0x02, 0xaf: 0x03, 0xb5: 0x04, 0xb6: 0x05, 0xb7: 0x06, 0xba: 0x07,
-			0xbb: 0x08, 0xbd: 0x09, 0xbe: 0x0a, 0xbf: 0x0b, 0xd6: 0x0c, 0xd7: 0x0d, 0xda: 0x0e, 0xdb: 0x0f,
-			0xdd: 0x10, 0xde: 0x11, 0xdf: 0x12, 0xea: 0x13, 0xeb: 0x14, 0xed: 0x15, 0xee: 0x16, 0xef: 0x17,
-			0xf5: 0x18, 0xf6: 0x19, 0xf7: 0x1a, 0xfa: 0x1b, 0xfb: 0x1c, 0xfd: 0x1d, 0xfe: 0x1e, 0xff: 0x1f,
-		}[nibble]
-	except:
-		# TODO: Invalidate the data block in this situation. Checksum should fail anyway, though.
-		translation = 0x00
-	return translation
+# The writer for each output type, for Converter(outputs=...)
+output_writers = {'nib': NibWriter, 'dsk': DskWriter, 'mfi': MfiWriter, 'fdi': FdiWriter, 'v2d': V2dWriter,
+	'nic': NicWriter, 'png': PngWriter}
+
+# Nibble translate tables for 6+2 and 5+3 encoding, 256 entries each so that a whole data field can be
+# translated at once (with bytes.translate or NumPy indexing).  Nibbles that are not valid in the
+# encoding translate to 0.
+# TODO: Invalidate the data block in this situation. Checksum should fail anyway, though.
+translate_62 = bytearray(256)
+for value, nibble in enumerate(bytes.fromhex(
+		'96979a9b9d9e9fa6a7abacadaeafb2b3b4b5b6b7b9babbbcbdbebfcbcdcecfd3'
+		'd6d7d9dadbdcdddedfe5e6e7e9eaebecedeeeff2f3f4f5f6f7f9fafbfcfdfeff')):
+	translate_62[nibble] = value
+translate_62 = bytes(translate_62)
+
+translate_53 = bytearray(256)
+for value, nibble in enumerate(bytes.fromhex(
+		'abadaeafb5b6b7babbbdbebfd6d7dadbdddedfeaebedeeeff5f6f7fafbfdfeff')):
+	translate_53[nibble] = value
+translate_53 = bytes(translate_53)
 
 def dos_order(logical_sector):
 	'''DOS 3.3 sector skewing'''
@@ -3234,6 +4611,12 @@ def cpm_order(logical_sector):
 		}[logical_sector]
 
 def bits_to_bytes(bits):
+	# packed bits only need to be shifted into byte alignment, the trailing zero byte
+	# is what the bit at a time version below has always produced.
+	if isinstance(bits, PackedBits):
+		return bytearray(bits.packed() + b'\x00')
+	if options['numpy']:
+		return bytearray(numpy.packbits(numpy.frombuffer(bytearray(bits), dtype=numpy.uint8)).tobytes() + b'\x00')
 	bit_offset = 0
 	bytes = bytearray()
 	local_bits = bits.copy() # without this, it was altering the bits for the caller
@@ -3265,6 +4648,8 @@ for i in range(256):
 # run through the buffer and use the lookup table to blast the bits onto the array [JA]
 def bytes_to_bits(eddbuffer):
 	'''Convert bytes into component bits'''
+	if options['numpy']:
+		return bytearray(numpy.unpackbits(numpy.frombuffer(eddbuffer, dtype=numpy.uint8)).tobytes())
 	bits = bytearray()
 	for byte in eddbuffer:
 		bits.extend(N2bits[byte])
@@ -3273,15 +4658,28 @@ def bytes_to_bits(eddbuffer):
 # Main entry point and options processing
 def main(argv=None):
 	'''Main entry point'''
-	global options, status
-
 	print("defedd - analyze and convert EDD files.")
+	# the options on the command line are gathered up in a converter, which then does the work
+	converter = Converter()
+	with converter:
+		result = parse_options(sys.argv[1:] if argv is None else argv)
+	if isinstance(result, int):
+		return result
+	if len(result) > 1:
+		converter.convert_batch(result)
+	else:
+		converter.convert(result[0])
+	return 1
+
+def parse_options(argv):
+	'''Set the options from the command line, return the EDD files or a status code to exit with'''
+	global options
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "hndfmp5txl1qcak0sryvw2u", \
+		opts, args = getopt.getopt(argv, "hndfmp5txl1qcak0sryvw2uj:", \
 			["help", "nib", "dsk", "fdi", "mfi", "po", "v2d", "nit", "protect", "log",
 				"int", "quick", "cheat", "all", "keep", "zero", "slice", "spiral", "sync",
-				"verbose", "werbose", "half", "nic"])
+				"verbose", "werbose", "half", "nic", "nonumpy", "jobs=", "stream", "cache=", "cachesize=", "repeats=", "nofast", "profile="])
 	except getopt.GetoptError as err:
 		print(str(err))
 		usage()
@@ -3293,29 +4691,29 @@ def main(argv=None):
 			return 0
 		# output file type options
 		elif o == "-f" or o == "--fdi":
-			options['output']['fdi'] = write_fdi_file
+			options['output']['fdi'] = FdiWriter
 			# options['output']['fdi'] = eddfilename + ".fdi"
 			print("Will save fdi file.")
 		elif o == "-m" or o == "--mfi":
-			options['output']['mfi'] = write_mfi_file
+			options['output']['mfi'] = MfiWriter
 			print("Will save mfi file.")
 		elif o == "-5" or o == "--v2d":
-			options['output']['v2d'] = write_v2d_file
+			options['output']['v2d'] = V2dWriter
 			print("Will save v2d/d5ni file.")
 		elif o == "-u" or o == "--nic":
-			options['output']['nic'] = write_nic_file
+			options['output']['nic'] = NicWriter
 			print("Will save UNISDISK NIC file.")
 		elif o == "-n" or o == "--nib":
-			options['output']['nib'] = write_nib_file
+			options['output']['nib'] = NibWriter
 			print("Will save nib file.")
 		elif o == "-g" or o == "--png":
-			options['output']['png'] = write_png_file
+			options['output']['png'] = PngWriter
 			print("Will save png file.")
 		# elif o == "-t" or o == "--nit":
 		# 	options['output']['nit'] = write_nit_file
 		# 	print("Will save nit (nibble timing) file.")
 		elif o == "-d" or o == "--dsk":
-			options['output']['dsk'] = write_dsk_file
+			options['output']['dsk'] = DskWriter
 			print("Will save dsk file (DOS 3.3 order, a.k.a. .do).")
 		# elif o == "-p" or o == "--po":
 		# 	options['output']['po'] = write_po_file
@@ -3362,6 +4760,40 @@ def main(argv=None):
 		elif o == "-s" or o == "--slice":
 			options['use_slice'] = True
 			print("Will write track-length bits starting from beginning of EDD sample for unparseable tracks")
+		elif o == "--nonumpy":
+			options['numpy'] = False
+			print("Will not use NumPy even if it is available.")
+		elif o == "-j" or o == "--jobs":
+			try:
+				options['jobs'] = int(a) if int(a) > 0 else multiprocessing.cpu_count()
+			except ValueError:
+				print('The number of jobs needs to be a number, {} is not a number.'.format(a))
+				return 1
+			print("Will analyze tracks using {} worker processes.".format(options['jobs']))
+		elif o == "--stream":
+			options['stream_tracks'] = True
+			print("Will write out each track as soon as it is analyzed.")
+		elif o == "--cache":
+			options['cache_dir'] = a
+			print("Will keep track analysis in cache directory {}.".format(a))
+		elif o == "--cachesize":
+			try:
+				options['cache_size'] = int(float(a) * 1024 * 1024)
+			except ValueError:
+				print('The cache size needs to be a number of megabytes, {} is not a number.'.format(a))
+				return 1
+		elif o == "--repeats":
+			if not a in ('search', 'coarse', 'suffix'):
+				print('The repeat engine needs to be search, coarse, or suffix, not {}.'.format(a))
+				return 1
+			options['repeat_engine'] = a
+			print("Will find repeats using the {} engine.".format(a))
+		elif o == "--nofast":
+			options['fast_sectors'] = False
+			print("Will analyze every track fully, even standard ones.")
+		elif o == "--profile":
+			options['profile_file'] = a
+			print("Will write a report of the time each stage took to {}.".format(a))
 		elif o == "-v" or o == "--verbose":
 			options['verbose'] = True
 			print("Will be more chatty about progress than usual.")
@@ -3379,18 +4811,21 @@ causing the candle to flicker, much like a cursor in a dark terminal window.
 Our story begins with a single command, cautiously typed at a prompt. . .
 ''')
 
-	try:
-		eddfilename = args[0]
-	except:
+	eddfilenames = find_edd_files(args)
+	if not eddfilenames:
 		print('You need to provide the name of an EDD file to begin.')
 		return 1
+	return eddfilenames
 
-	options['output_basename'] = eddfilename
-
-	# Do some sanity checking
+# Do some sanity checking, before converting
+def check_options():
+	'''Adjust the options that do not make sense together'''
+	global options
+	if options['jobs'] < 1:
+		options['jobs'] = multiprocessing.cpu_count()
 	# To write dsk files we need to do the sector analysis, for others it is not needed
 	if options['output']['dsk'] and not options['analyze_sectors']:
-		print('It is necessary to analyze sectors in order to write a .dsk file, turning that option on.')
+		message('It is necessary to analyze sectors in order to write a .dsk file, turning that option on.')
 		options['analyze_sectors'] = True
 	# To write pure EDD->fdi files (which OpenEmulator can handle), we don't need to do any analysis.
 	# If user picked no translation but picked something other than fdi, turn no translation off
@@ -3399,37 +4834,45 @@ Our story begins with a single command, cautiously typed at a prompt. . .
 		options['analyze_nibbles'] = False
 		for output_file in options['output'].items():
 			if output_file[1] and not (output_file[0] == 'fdi' or output_file[0] == 'nic'):
-				print('No translation is only valid for fdi, but since you picked a different output format, analysis is still needed.')
+				message('No translation is only valid for fdi, but since you picked a different output format, analysis is still needed.')
 				options['analyze_bits'] = True
 				options['analyze_nibbles'] = True
 				break
 
+	if options['repeat_engine'] == 'suffix' and not options['numpy']:
+		message('The suffix array repeat engine needs NumPy, searching for repeats instead.')
+		options['repeat_engine'] = 'search'
+
+	if options['stream_tracks'] and options['sync_tracks']:
+		message('Syncing tracks needs all the tracks at once, so they cannot be streamed.')
+		options['stream_tracks'] = False
+
+	if options['jobs'] > 1 and options['sync_tracks']:
+		message('Syncing tracks needs all the tracks at once, so they will be analyzed in one process.')
+
 	if options['spiral'] and not (options['process_halves'] or options['process_quarters']):
-		print('Cannot do track sync without at least processing half tracks, quarter tracks is better.')
-		print('Processing half tracks for now.')
+		message('Cannot do track sync without at least processing half tracks, quarter tracks is better.')
+		message('Processing half tracks for now.')
 		options['process_halves'] = True
 
 	# TODO: Improve the style of the quarter/half/whole track decisionmaking here
 	if options['process_quarters'] and not options['output']['mfi'] and not options['output']['fdi']:
 		options['process_quarters'] = False
 		if options['process_halves'] and not options['output']['v2d']:
-			print('Only processing whole tracks, no sense in processing quarter tracks unless they will be stored.')
+			message('Only processing whole tracks, no sense in processing quarter tracks unless they will be stored.')
 			options['process_halves'] = False
 		else:
-			print('Only processing half tracks, no sense in processing quarter tracks unless they will be stored.')
+			message('Only processing half tracks, no sense in processing quarter tracks unless they will be stored.')
 	# I think I am going to remove the po option for now until I settle the analysis portion
 	# if options['output']['dsk'] and options['output']['po']:
 	# 	options['output']['po'] = False
-	# 	print('Writing dsk and po are mutually exclusive, will write dsk and not po.')
+	# 	message('Writing dsk and po are mutually exclusive, will write dsk and not po.')
 	# TODO: Maybe there is other sanity checking to do here, add if it occurs to me
 
-	analyze_disk()
-	return 1
-
 def usage():
 	'''Display help information'''
 	print('''
-Usage: defedd.py [options] eddfile
+Usage: defedd.py [options] eddfile [eddfile ...]
 
 Assumption is that the EDD file was produced by I'm fEDD Up.
 Quarter tracks.
@@ -3459,6 +4902,17 @@ Analysis options:
  -r, --spiral  Write EDD bits in 17000-bit spiral to try to keep track sync
  -k, --keep    Do not attempt to repair bitstream
  -y, --sync    Try to sync the tracks
+ --nonumpy     Do not use NumPy for bit packing/unpacking even if installed
+ -j, --jobs N  Analyze tracks in N worker processes (0 means one per CPU)
+               (with several EDD files, convert N files at a time instead)
+ --stream      Write out each track as it is analyzed (less memory, no --sync)
+ --cache DIR   Keep track analysis in DIR to reuse when converting again
+ --cachesize M Keep the cache to at most M megabytes (default 256)
+ --repeats E   Find repeats by search (default), coarse (search only near where the nibbles
+               say the copies are), or suffix (suffix array, needs NumPy)
+ --nofast      Analyze every track fully, even clean standard ones (with just -d)
+ --profile F   Write the time spent in each stage for each track to F (JSON)
+               (with several EDD files, to eddfile.profile.json for each)
 Help and debugging:
  -h, --help    You're looking at it.
  -v, --verbose Be more verbose than usual
@@ -3468,6 +4922,7 @@ Help and debugging:
  defedd.py -d eddfile.edd (write a dsk file, standard 16-sector format)
  defedd.py -faq eddfile.edd (write an fdi file for OpenEmulator with all 2.5x samples)
  	(works for Choplifter)
+ defedd.py -faq -j 4 disks (the same for every .edd file in disks, four at a time)
  defedd.py -qv eddfile.edd (write a v2d file for Virtual II)
  	(works for standard disks so far)
  defedd.py -qn eddfile.edd (write a nib file, skip sector analysis)